@@ -0,0 +1,108 @@
+"""Startup time benchmark of the command line tool.
+
+Measures the wall clock time of short runs of glacier-upload that never reach
+Glacier (--help, a missing file and the hash subcommand), each in a new process
+like when the tool is called from cron or a batch script. Also lists the heavy
+modules (boto3 and botocore) that were imported on the way, which should be none.
+
+    python benchmarks/bench_startup.py --runs 20
+    python benchmarks/bench_startup.py --max-ms 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HEAVY_MODULES = ("boto3", "botocore")
+
+# Runs the command line tool in the process and prints the heavy modules imported.
+RUNNER = """
+import sys
+from glacier_upload.main import main
+sys.argv = ["glacier-upload"] + sys.argv[1:]
+try:
+    main()
+except SystemExit:
+    pass
+finally:
+    heavy = sorted({name.split(".")[0] for name in sys.modules} & set(%r))
+    sys.__stderr__.write("HEAVY_MODULES " + ",".join(heavy) + "\\n")
+""" % (HEAVY_MODULES,)
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description='startup time benchmark of the command line tool')
+    parser.add_argument('--runs', type=int, default=10, help='runs per case')
+    parser.add_argument('--max-ms', dest='max_ms', type=float,
+                        help='exit with 1 if the median of a case is slower than this (milliseconds)')
+    parser.add_argument('--json', dest='json_file', help='write the results also to this file')
+    return parser
+
+
+def cases(directory):
+    data_file = Path(directory) / "data.bin"
+    data_file.write_bytes(os.urandom(65536))
+    log_file = str(Path(directory) / "uploaded_log.db")
+    return {
+        "help": ["--help"],
+        "missing file": [str(Path(directory) / "missing.bin"), "bench_vault", "-l", log_file],
+        "hash": ["hash", str(data_file)],
+    }
+
+
+def interpreter_times(runs):
+    """Wall clock times (ms) of starting the bare interpreter, for comparison."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def measure(arguments, runs):
+    """Runs the tool the given times and returns the wall clock times (ms) and the heavy
+    modules imported.
+    """
+    times = []
+    heavy = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", RUNNER] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        ).stderr
+        times.append((time.perf_counter() - start) * 1000)
+        lines = [line for line in output.decode().splitlines() if line.startswith("HEAVY_MODULES")]
+        heavy = lines[-1].split(" ", 1)[1] if lines else "?"
+    return times, heavy
+
+
+def main():
+    settings = setup_parser().parse_args()
+    interpreter_ms = statistics.median(interpreter_times(settings.runs))
+    print(f"{'case':<16}{'median ms':>10}{'min ms':>10}  heavy modules imported")
+    print(f"{'python -c pass':<16}{interpreter_ms:>10.1f}")
+    results = []
+    slow = False
+    with tempfile.TemporaryDirectory(prefix="glacier-bench-") as directory:
+        for name, arguments in cases(directory).items():
+            times, heavy = measure(arguments, settings.runs)
+            median = statistics.median(times)
+            print(f"{name:<16}{median:>10.1f}{min(times):>10.1f}  {heavy or '-'}")
+            results.append({"case": name, "median_ms": round(median, 1), "min_ms": round(min(times), 1),
+                            "heavy_modules": heavy.split(",") if heavy else []})
+            slow = slow or (settings.max_ms is not None and median > settings.max_ms)
+    if settings.json_file:
+        with open(settings.json_file, "w") as file_object:
+            json.dump({"interpreter_ms": round(interpreter_ms, 1), "results": results}, file_object, indent=4)
+    if slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Upload throughput benchmarks against the local Glacier.
+
+Runs single chunk and multipart uploads over a matrix of file sizes, part sizes and
+concurrency levels. Each case runs in its own process so that the peak RSS and the
+CPU time belong to that case only. The local Glacier runs in the same process as
+the upload and verifies the data (tree hashes), so the CPU time includes that too.
+
+    python benchmarks/bench_upload.py --sizes 64 256 --part-sizes 4 16 --concurrency 1 4
+    python benchmarks/bench_upload.py --latency 0.05 --bandwidth 200 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MEGABYTE = 1048576
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description='upload throughput benchmarks against the local glacier')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[16, 64, 256], help='file sizes in megabytes')
+    parser.add_argument('--part-sizes', dest='part_sizes', nargs='+', type=int, default=[4, 16],
+                        help='multipart part sizes in megabytes')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4], help='parallel part uploads')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each request')
+    parser.add_argument('--bandwidth', type=float, help='bandwidth of the local glacier in megabytes per second')
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0,
+                        help='share of the requests failing with ServiceUnavailableException')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case (the best one is reported)')
+    parser.add_argument('--json', dest='json_file', help='write the results also to this file')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser
+
+
+def cases(settings):
+    for size in settings.sizes:
+        yield {"mode": "single", "size": size, "part_size": None, "concurrency": 1}
+        for part_size in settings.part_sizes:
+            if part_size > size:
+                continue
+            for concurrency in settings.concurrency:
+                yield {"mode": "multipart", "size": size, "part_size": part_size, "concurrency": concurrency}
+
+
+def create_file(directory, size):
+    path_to_file = Path(directory) / f"data_{size}mb.bin"
+    if not path_to_file.exists():
+        with open(path_to_file, "wb") as file_object:
+            for _ in range(size):
+                file_object.write(os.urandom(MEGABYTE))
+    return str(path_to_file)
+
+
+def run_case(case):
+    """Runs a single case in this process and prints the measurements as JSON."""
+    from glacier_upload.libraries.glacier_library import GlacierLib
+    from glacier_upload.libraries.local_glacier import LocalGlacier, local_client
+    from glacier_upload.libraries.retry_policy import RetryPolicy
+    logging.getLogger("glacier_logger").setLevel(logging.WARNING)
+    bandwidth = case.get("bandwidth")
+    glacier = LocalGlacier(
+        vaults=("bench_vault",),
+        latency=case.get("latency"),
+        bandwidth=bandwidth * MEGABYTE if bandwidth else None,
+        error_rate=case.get("error_rate"),
+        keep_data=False,
+        seed=1,
+    )
+    glacier_lib = GlacierLib(
+        "bench_vault",
+        upload_log=str(Path(case.get("directory")) / f"log_{os.getpid()}.db"),
+        workers=case.get("concurrency"),
+        client=local_client(glacier, workers=case.get("concurrency")),
+        retry_policy=RetryPolicy(max_attempts=10, base_delay=0.01, max_delay=0.1),
+    )
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    if case.get("mode") == "single":
+        success = glacier_lib.upload(case.get("path_to_file"))
+    else:
+        success = glacier_lib.multipart_upload(case.get("path_to_file"), part_size=case.get("part_size"))
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_time = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    result = dict(case)
+    result.update({
+        "success": success,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(case.get("size") / elapsed, 1),
+        "cpu_seconds": round(cpu_time, 3),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        "peak_rss_mb": round(usage_after.ru_maxrss / (MEGABYTE if sys.platform == "darwin" else 1024), 1),
+        "requests": glacier.request_count,
+        "retries": glacier_lib.retry_count,
+        "phase_seconds": glacier_lib.metrics.snapshot().get("phase_seconds"),
+    })
+    print(json.dumps(result))
+
+
+def measure(case, repeat):
+    """Runs the case in separate processes and returns the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--case", json.dumps(case)], check=True, stdout=subprocess.PIPE,
+        ).stdout
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run.get("seconds"))
+
+
+def print_row(result):
+    part_size = result.get("part_size") or "-"
+    print(
+        f"{result.get('mode'):<10}{result.get('size'):>8}{part_size:>8}{result.get('concurrency'):>6}"
+        f"{result.get('mb_per_s'):>10}{result.get('cpu_seconds'):>10}{result.get('peak_rss_mb'):>10}"
+        f"{result.get('retries'):>9}  {'ok' if result.get('success') else 'FAILED'}"
+    )
+
+
+def main():
+    settings = setup_parser().parse_args()
+    if settings.case:
+        run_case(json.loads(settings.case))
+        return
+    results = []
+    with tempfile.TemporaryDirectory(prefix="glacier-bench-") as directory:
+        print(
+            f"{'mode':<10}{'size MB':>8}{'part MB':>8}{'conc':>6}{'MB/s':>10}{'cpu s':>10}{'rss MB':>10}{'retries':>9}"
+        )
+        for case in cases(settings):
+            case.update({
+                "path_to_file": create_file(directory, case.get("size")),
+                "directory": directory,
+                "latency": settings.latency,
+                "bandwidth": settings.bandwidth,
+                "error_rate": settings.error_rate,
+            })
+            result = measure(case, settings.repeat)
+            print_row(result)
+            results.append(result)
+    if settings.json_file:
+        with open(settings.json_file, "w") as file_object:
+            json.dump(results, file_object, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import asyncio
+import functools
+import inspect
+import threading
+from pathlib import Path
+from .glacier_library import GlacierLib
+from .part_reader import MappedFile, PartView
+from .partlify import add_byte_ranges, get_allowed_sizes, get_byte_range, get_file_fingerprint, get_needed_parts
+from .tree_hash import part_hashes, tree_hash
+from .upload_journal import Journal
+
+
+class InFlightLimit:
+    def __init__(self, parts, max_bytes=None):
+        """Limits the parts (and the bytes they hold) in flight at once over all the
+        uploads on the event loop. Waiting for a slot suspends only the coroutine. A
+        part larger than max_bytes is let through when nothing else is in flight.
+
+        Args:
+            parts (int): Amount of parts in flight at once.
+            max_bytes (int, optional): Upper limit for the bytes of the parts in flight.
+        """
+        self.parts = parts
+        self.max_bytes = max_bytes
+        self.parts_in_flight = 0
+        self.bytes_in_flight = 0
+        self._condition = None
+
+    async def acquire(self, size):
+        if self._condition is None:
+            # Created on the loop that uses it (Python < 3.10 binds it to a loop).
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._fits(size))
+            self.parts_in_flight += 1
+            self.bytes_in_flight += size
+
+    async def release(self, size):
+        async with self._condition:
+            self.parts_in_flight -= 1
+            self.bytes_in_flight -= size
+            self._condition.notify_all()
+
+    def _fits(self, size):
+        if self.parts_in_flight >= self.parts:
+            return False
+        return not self.max_bytes or not self.bytes_in_flight or self.bytes_in_flight + size <= self.max_bytes
+
+
+class AsyncGlacierLib(GlacierLib):
+    def __init__(self, vault_name, max_in_flight=None, **kwargs):
+        """Uploading with coroutines, e.g. from an asyncio service. Thousands of uploads
+        can run at once on one event loop: the parts wait for their turn on the loop and
+        only the parts in flight hold a worker thread. The calls to Glacier are made with
+        the blocking client in the upload workers (as by GlacierLib), so the retries,
+        rate limiting, replicas and the storage work as they do there.
+
+        The coroutines are named apart from the blocking methods of GlacierLib (e.g.
+        async_upload next to upload), which still work as they do there (e.g. for
+        upload_files).
+
+        Cancelling a multipart upload stops queuing its parts, waits for the parts being
+        sent and aborts the upload in Glacier.
+
+        Args:
+            vault_name (str): Name of the vault in Glacier.
+            max_in_flight (int, optional): Parts (and single chunk uploads) in flight at once
+                over all the uploads. Defaults to the workers. The bytes in flight are
+                limited by max_memory.
+            **kwargs: As for GlacierLib.
+        """
+        super().__init__(vault_name, **kwargs)
+        self.max_in_flight = max_in_flight or self.workers
+        self.limit = InFlightLimit(self.max_in_flight, self.max_memory * 1048576 if self.max_memory else None)
+
+    async def async_upload(self, path_to_file, description="", progress=None, part_size=4):
+        """Uploading a file in a single chunk.
+
+        Args:
+            path_to_file (str): Path to the file.
+            description (str, optional): Description of what is uploaded.
+            progress (callable, optional): Called on the event loop with a dict of the
+                progress (see _progress_event) once the file is uploaded. Can be a
+                coroutine function.
+            part_size (int or str, optional): Size for the multipart parts in megabytes or
+                "auto" when the file is compressed (the compressed size isn't known
+                beforehand). Defaults to 4 megabytes.
+
+        Returns:
+            bool: True if the upload succeeded.
+        """
+        if not self.validator.preupload_checks(path_to_file):
+            return False
+        if not await self._in_thread(self._vault_exists, self.vault_name):
+            return False
+        if await self._in_thread(self._should_skip, path_to_file):
+            return True
+        fingerprint = get_file_fingerprint(path_to_file)
+        self._add_total(fingerprint.get("size"))
+        if self.compression:
+            uploaded = await self._in_thread(self._upload_compressed, path_to_file, part_size, description)
+        else:
+            uploaded = await self._in_flight(
+                fingerprint.get("size"), self._start_upload, path_to_file, description, fingerprint.get("size")
+            )
+        if uploaded:
+            await self._report(progress, self._progress_event(path_to_file, None, 1, 1, fingerprint.get("size")))
+        return uploaded
+
+    async def async_multipart_upload(self, path_to_file, part_size=4, description="", progress=None):
+        """Uploading a file in multiple parts. The parts of all the uploads share the
+        in-flight limit. An upload that fails is left in the journal to be resumed
+        (see GlacierLib.resume_multipart_upload) and a cancelled one is aborted.
+
+        Args:
+            path_to_file (str): Path to the file.
+            part_size (int or str, optional): Size for the multipart parts in megabytes or "auto".
+                Defaults to 4 megabytes.
+            description (str, optional): Description of what is uploaded.
+            progress (callable, optional): Called on the event loop with a dict of the
+                progress (see _progress_event) after each part. Can be a coroutine function.
+
+        Returns:
+            bool: True if the upload succeeded.
+        """
+        part_size = self._resolve_part_size(path_to_file, part_size)
+        if not self.validator.preupload_checks(path_to_file, part_size, self.max_memory):
+            return False
+        if not await self._in_thread(self._vault_exists, self.vault_name):
+            return False
+        if await self._in_thread(self._should_skip, path_to_file):
+            return True
+        fingerprint = get_file_fingerprint(path_to_file)
+        total_size = fingerprint.get("size")
+        self._add_total(total_size)
+        if self.compression:
+            return await self._in_thread(self._upload_compressed, path_to_file, part_size, description)
+        part_size_bytes = get_allowed_sizes().get(str(part_size))
+        parts = add_byte_ranges(get_needed_parts(path_to_file, part_size_bytes, total_size))
+        response = await self.initiate_multipart_upload(description, part_size_bytes, total_size)
+        if not self.validator.is_response_ok(response):
+            return False
+        upload_id = response.get("uploadId")
+        details = {
+            "path_to_file": str(Path(path_to_file).resolve()),
+            "vault_name": self.vault_name,
+            "region_name": self.client.meta.region_name,
+            "description": description,
+            "part_size": part_size_bytes,
+            "total_size": total_size,
+            "fingerprint": fingerprint,
+        }
+        journal = Journal(self.storage.file_name, upload_id)
+        journal.start(details)
+        try:
+            uploaded = await self._upload_parts(upload_id, path_to_file, parts, journal, progress)
+        except asyncio.CancelledError:
+            self.logger.info(f"Upload of {path_to_file} cancelled.")
+            # Shielded so that the upload is aborted even if the caller gives up waiting.
+            await asyncio.shield(self.abort_multipart_upload(upload_id))
+            journal.remove()
+            raise
+        if not uploaded:
+            self.logger.error(f"Upload of {path_to_file} failed. Can be resumed with --resume {upload_id}.")
+            return False
+        return await self._in_thread(self._finish_multipart_upload, upload_id, parts, details, None, journal)
+
+    async def initiate_multipart_upload(self, description, part_size_bytes, total_size=None):
+        """Initiates a multipart upload.
+
+        Returns:
+            dict: The response from Glacier (with the uploadId) or None if the call failed.
+        """
+        return await self._in_thread(self._initiate_multipart_upload, description, part_size_bytes, total_size)
+
+    async def upload_part(self, upload_id, data, range_start):
+        """Uploads the data (bytes-like) as the part of the upload starting at range_start.
+        Waits for a slot in the in-flight limit.
+
+        Returns:
+            dict: The part with its byte range, tree hash leaves, checksum (tree hash) and
+                whether it succeeded.
+        """
+        part = {"part_size": len(data)}
+        part.update(get_byte_range(range_start, len(data)))
+        await self._in_flight(len(data), self._send_data_part, upload_id, data, part)
+        return part
+
+    async def complete_multipart_upload(self, upload_id, parts):
+        """Completes the upload from the uploaded parts (as returned by upload_part).
+
+        Returns:
+            dict: The response from Glacier (with the archiveId) or None if the call failed.
+        """
+        parts = sorted(parts, key=lambda part: part.get("range_start"))
+        total_size = sum([part.get("part_size") for part in parts])
+        total_hash = tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")])
+        return await self._in_thread(self._complete_multipart_upload, upload_id, total_size, total_hash)
+
+    async def abort_multipart_upload(self, upload_id):
+        """Aborts the upload so that Glacier drops the parts it has received.
+
+        Returns:
+            bool: True if the upload was aborted.
+        """
+        return await self._in_thread(self._abort_multipart_upload, upload_id)
+
+    async def _upload_parts(self, upload_id, path_to_file, parts, journal, progress):
+        """Queues the parts for the upload workers as slots free up in the in-flight limit.
+        On cancellation the parts not yet sent are dropped and the ones being sent are
+        waited for, as they read from the memory mapped file.
+        """
+        failed = threading.Event()
+        running = list()
+        done = {"parts": 0, "bytes": 0}
+        with MappedFile(path_to_file, self.drop_cache) as mapped_file:
+            tasks = [
+                asyncio.ensure_future(self._send_file_part(
+                    upload_id, mapped_file, part, (i, len(parts)), failed, journal, running, progress, done
+                ))
+                for i, part in enumerate(parts, 1)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except asyncio.CancelledError:
+                failed.set()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if running:
+                    await asyncio.wait([asyncio.wrap_future(future) for future in running])
+                raise
+        return all([part.get("success") for part in parts])
+
+    async def _send_file_part(self, upload_id, mapped_file, part, numbering, failed, journal, running, progress,
+                              done):
+        await self.limit.acquire(part.get("part_size"))
+        try:
+            future = self.scheduler.submit(
+                0, self._upload_file_part, upload_id, mapped_file, part, *numbering, failed, journal
+            )
+            running.append(future)
+            await asyncio.wrap_future(future)
+        finally:
+            await self.limit.release(part.get("part_size"))
+        if part.get("success"):
+            done.update({"parts": done.get("parts") + 1, "bytes": done.get("bytes") + part.get("part_size")})
+            event = self._progress_event(
+                mapped_file.path_to_file, upload_id, done.get("parts"), numbering[1], done.get("bytes")
+            )
+            await self._report(progress, event)
+
+    def _send_data_part(self, upload_id, data, part):
+        """Hashes and uploads a part given as bytes. Run in one of the upload workers."""
+        with PartView(data, 0, len(data)) as body:
+            with self.metrics.cpu_phase("hashing"):
+                hashes, body.content_sha256 = part_hashes(body.data)
+            part.update({"leaf_hashes": hashes, "checksum": tree_hash(hashes)})
+            response = self._upload_part(part, upload_id, part.get("range"), body)
+        part.update({"success": self.validator.is_response_ok(response)})
+
+    def _progress_event(self, path_to_file, upload_id, parts_done, part_count, bytes_done):
+        """The progress of an upload: the file, upload id (None for a single chunk), the
+        parts and bytes done of the file and the snapshot of all the uploads (see
+        UploadMetrics.snapshot).
+        """
+        return {
+            "path_to_file": path_to_file,
+            "upload_id": upload_id,
+            "parts_done": parts_done,
+            "part_count": part_count,
+            "bytes_done": bytes_done,
+            "metrics": self.metrics.snapshot(),
+        }
+
+    async def _report(self, progress, event):
+        if progress is None:
+            return
+        result = progress(event)
+        if inspect.isawaitable(result):
+            await result
+
+    async def _in_flight(self, size, call, *args):
+        """Runs the blocking call in the upload workers once it fits in the in-flight limit."""
+        await self.limit.acquire(size)
+        try:
+            return await asyncio.wrap_future(self.scheduler.submit(0, call, *args))
+        finally:
+            await self.limit.release(size)
+
+    async def _in_thread(self, call, *args):
+        """Runs a blocking call (e.g. to Glacier or hashing a file) in the default executor
+        of the loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(call, *args))
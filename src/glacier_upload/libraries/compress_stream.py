@@ -0,0 +1,124 @@
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+from collections import deque
+from .tree_hash import LEAF_SIZE, tree_hash
+
+# Each block is compressed into its own frame (a gzip member, a bzip2 stream or an xz
+# stream). The standard tools and the decompress functions below decode the
+# concatenated frames as one file, and the frames can be compressed on all the CPUs.
+CODECS = {
+    "gzip": {"suffix": ".gz", "compress": lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+             "decompress": gzip.decompress, "default_level": 6},
+    "bz2": {"suffix": ".bz2", "compress": lambda data, level: bz2.compress(data, compresslevel=level),
+            "decompress": bz2.decompress, "default_level": 9},
+    "xz": {"suffix": ".xz", "compress": lambda data, level: lzma.compress(data, preset=level),
+           "decompress": lzma.decompress, "default_level": 6},
+}
+
+BLOCK_SIZE = 4 * LEAF_SIZE
+
+
+def decompress(data, codec):
+    """Decompresses the data of a compressed archive (all the frames)."""
+    return CODECS[codec]["decompress"](data)
+
+
+def compress_block(block, codec, level):
+    """Compresses a block into a frame. Also returns the SHA-256 of each megabyte of
+    the original data (for its tree hash). Run in the compression threads; zlib, bz2,
+    lzma and hashlib release the GIL while working on large buffers.
+    """
+    leaves = [hashlib.sha256(block[start:start + LEAF_SIZE]).digest() for start in range(0, len(block), LEAF_SIZE)]
+    return CODECS[codec]["compress"](block, level), leaves
+
+
+class CompressStream(io.RawIOBase):
+    def __init__(self, source, codec, executor, level=None, block_size=BLOCK_SIZE, window=2):
+        """Read-only stream of the source compressed in blocks. The blocks are read from
+        the source as the stream is read and compressed in parallel in the executor, up
+        to window blocks ahead, so compressing overlaps with reading and uploading. The
+        frames come out in the order of the blocks.
+
+        The size and the tree hash of the original data are known once the stream has
+        been read to the end (original_size and original_checksum).
+
+        Args:
+            source (io.BufferedIOBase): Binary stream of the original data.
+            codec (str): One of CODECS.
+            executor (concurrent.futures.Executor): Where the blocks are compressed.
+            level (int, optional): Compression level. Defaults to the default of the codec.
+            block_size (int, optional): Bytes compressed into each frame. A multiple of a
+                megabyte. Defaults to 4 megabytes.
+            window (int, optional): Blocks compressed ahead. One more than the threads of the
+                executor keeps all of them busy. Defaults to 2.
+        """
+        self.source = source
+        self.codec = codec
+        self.level = CODECS[codec]["default_level"] if level is None else level
+        self.block_size = block_size
+        self.window = max(window, 1)
+        self.original_size = 0
+        self.compressed_size = 0
+        self._executor = executor
+        self._futures = deque()
+        self._leaves = []
+        self._source_done = False
+        self._block_count = 0
+        self._pending = memoryview(b"")
+
+    @property
+    def memory(self):
+        """Bytes held at most by the window: the blocks being compressed and their frames
+        (about the size of the block at most).
+        """
+        return 2 * self.window * self.block_size
+
+    @property
+    def original_checksum(self):
+        """Tree hash of the original data read so far."""
+        return tree_hash(self._leaves or [hashlib.sha256(b"").digest()])
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            self._fill_window()
+            if not self._futures:
+                return 0
+            frame, leaves = self._futures.popleft().result()
+            self._leaves.extend(leaves)
+            self.compressed_size += len(frame)
+            self._pending = memoryview(frame)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def _fill_window(self):
+        while not self._source_done and len(self._futures) < self.window:
+            block = self._read_block()
+            if not block and self._block_count:
+                self._source_done = True
+                break
+            # An empty source is still compressed into one (empty) frame.
+            self._block_count += 1
+            self.original_size += len(block)
+            self._futures.append(self._executor.submit(compress_block, block, self.codec, self.level))
+            if len(block) < self.block_size:
+                self._source_done = True
+
+    def _read_block(self):
+        """Reads a full block (a pipe may return less per read)."""
+        chunks = []
+        remaining = self.block_size
+        while remaining:
+            chunk = self.source.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
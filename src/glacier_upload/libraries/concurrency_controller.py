@@ -0,0 +1,122 @@
+import threading
+import time
+from .setup_logger import logger
+
+THROTTLING_ERRORS = (
+    "ThrottlingException",
+    "ServiceUnavailableException",
+)
+
+
+def is_throttling(error):
+    """Checks if the error (exception raised by the client) tells to slow down."""
+    error_code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return error_code in THROTTLING_ERRORS
+
+
+class ConcurrencyController:
+    def __init__(self, max_limit, min_limit=1, decrease_factor=0.5, tolerance=0.05, probe_after=3,
+                 clock=time.monotonic):
+        """Adjusts the amount of parts uploaded at once (additive increase,
+        multiplicative decrease). Starts from the minimum and doubles the limit while
+        the goodput (bytes of the completed parts per second) keeps improving. After
+        that the limit is raised by one when the goodput improves, lowered by one when
+        it gets worse and kept otherwise (probing one higher now and then). When
+        Glacier throttles (ThrottlingException or 503) the limit is cut by the decrease
+        factor, at most once per window.
+
+        The goodput is measured over windows of as many completed parts as the limit.
+
+        Args:
+            max_limit (int): Upper limit for the parallel uploads (the amount of workers).
+            min_limit (int, optional): Lower limit. Defaults to 1.
+            decrease_factor (float, optional): Multiplier of the limit when throttled. Defaults to 0.5.
+            tolerance (float, optional): Relative change of the goodput taken as a change. Defaults to 0.05.
+            probe_after (int, optional): Windows without a change before trying a higher limit. Defaults to 3.
+            clock (callable, optional): Source of the time in seconds.
+        """
+        self.logger = logger
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = min(max(min_limit, 1), self.max_limit)
+        self.decrease_factor = decrease_factor
+        self.tolerance = tolerance
+        self.probe_after = probe_after
+        self.limit = self.min_limit
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self._clock = clock
+        self._slow_start = True
+        self._previous_goodput = None
+        self._steady_windows = 0
+        self._condition = threading.Condition()
+        self._reset_window()
+
+    def acquire(self):
+        """Blocks until another upload fits in the current limit."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def completed(self, size, seconds):
+        """Records a successfully uploaded part.
+
+        Args:
+            size (int): Size of the part in bytes.
+            seconds (float): How long the upload of the part took.
+        """
+        with self._condition:
+            self._window_bytes += size
+            self._window_latencies.append(seconds)
+            if len(self._window_latencies) >= self.limit:
+                self._evaluate_window()
+
+    def throttled(self):
+        """Records a throttling response and cuts the limit (once per window)."""
+        with self._condition:
+            if self._window_throttled:
+                return
+            self._slow_start = False
+            self._previous_goodput = None
+            self._set_limit(int(self.limit * self.decrease_factor), "throttled")
+            self._window_throttled = True
+
+    def _evaluate_window(self):
+        elapsed = max(self._clock() - self._window_start, 1e-9)
+        goodput = self._window_bytes / elapsed
+        previous = self._previous_goodput
+        latencies = sorted(self._window_latencies)
+        reason = f"{goodput / 1048576:.1f} MB/s, median part latency {latencies[len(latencies) // 2]:.2f} s"
+        if previous is None or goodput > previous * (1 + self.tolerance):
+            self._steady_windows = 0
+            self._set_limit(self.limit * 2 if self._slow_start else self.limit + 1, reason)
+        elif goodput < previous * (1 - self.tolerance):
+            self._slow_start = False
+            self._steady_windows = 0
+            self._set_limit(self.limit - 1, reason)
+        else:
+            self._slow_start = False
+            self._steady_windows += 1
+            if self._steady_windows >= self.probe_after:
+                self._steady_windows = 0
+                self._set_limit(self.limit + 1, f"{reason}, probing")
+        self._previous_goodput = goodput
+        self._reset_window()
+
+    def _set_limit(self, limit, reason):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if limit != self.limit:
+            self.logger.info(f"Concurrency {self.limit} -> {limit} ({reason}).")
+            self.limit = limit
+            self.peak_limit = max(self.peak_limit, limit)
+            self._condition.notify_all()
+
+    def _reset_window(self):
+        self._window_start = self._clock()
+        self._window_bytes = 0
+        self._window_latencies = []
+        self._window_throttled = False
@@ -0,0 +1,37 @@
+import glob
+import sys
+from pathlib import Path
+
+
+def collect_files(targets):
+    """Expands the given upload targets into a list of files. Directories are walked
+    recursively and glob patterns (e.g. "logs/**/*.gz") are expanded. Other targets are
+    kept as they are so that the preupload checks can report the missing files.
+
+    Args:
+        targets (list): File paths, directories or glob patterns.
+
+    Returns:
+        list: Paths to the files in the given order without duplicates.
+    """
+    files = list()
+    for target in targets:
+        if Path(target).is_dir():
+            files.extend(sorted(str(path) for path in Path(target).rglob("*") if path.is_file()))
+        elif glob.has_magic(target):
+            files.extend(sorted(path for path in glob.glob(target, recursive=True) if Path(path).is_file()))
+        else:
+            files.append(target)
+    return list(dict.fromkeys(files))
+
+
+def read_file_list(list_file):
+    """Reads the upload targets from a file with one target per line. "-" reads from
+    the standard input.
+    """
+    if list_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(list_file) as file_object:
+            lines = file_object.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
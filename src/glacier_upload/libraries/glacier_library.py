@@ -1,26 +1,182 @@
-import boto3
-from botocore.utils import calculate_tree_hash
+import os
+import threading
+from contextlib import contextmanager
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .setup_logger import logger
 from .response_storage import Storage
 from .upload_validator import Validator
-from .partlify import get_allowed_sizes, get_file_size, get_needed_parts, add_byte_ranges
+from .tree_hash import file_leaf_hashes, file_tree_hash, part_hashes, tree_hash
+from .part_reader import BufferPool, MappedFile, PartView, add_content_sha256, fill_buffer
+from .part_scheduler import PartScheduler
+from .upload_journal import Journal
+from .retry_policy import RetryPolicy
+from .concurrency_controller import ConcurrencyController, is_throttling
+from .upload_metrics import UploadMetrics
+from .pack_stream import PackStream, group_files
+from .compress_stream import BLOCK_SIZE, CompressStream
+from .shard_plan import ShardPlan
+from .partlify import (
+    MAX_PARTS, get_allowed_sizes, get_file_fingerprint, get_file_size, get_needed_parts, add_byte_ranges,
+    choose_part_size, get_byte_range, split_into_shards
+)
+
+
+def create_client(region_name=None, workers=1, **client_kwargs):
+    """Creates the Glacier client. The connection pool is sized for the workers and
+    botocore's own retries are turned off as the calls are retried by the RetryPolicy.
+    boto3 is imported here and not with the module as importing it takes a large share
+    of the startup time of the command line tool (e.g. for --help or a missing file).
+
+    Args:
+        region_name (str, optional): Where the vault is located in AWS.
+        workers (int, optional): Amount of parallel uploads. Defaults to 1.
+        **client_kwargs: Passed on to boto3.client (e.g. the credentials).
+
+    Returns:
+        botocore.client.BaseClient: The client.
+    """
+    import boto3
+    from botocore.config import Config
+    return boto3.client(
+        'glacier',
+        region_name=region_name,
+        config=Config(max_pool_connections=max(workers, 10), retries={"max_attempts": 0}),
+        **client_kwargs
+    )
+
+
+def resolve_region_name():
+    """The region configured for the profile (in the environment or ~/.aws/config)
+    resolved the same way as for the client, but without creating one. botocore is
+    imported here for the same reason as boto3 in create_client.
+
+    Returns:
+        str: The region or None if no region is configured.
+    """
+    import botocore.session
+    return botocore.session.Session().get_config_variable("region")
 
 
 class GlacierLib:
-    def __init__(self, vault_name, upload_log="uploaded_log.json", region_name=None):
+    def __init__(self, vault_name, upload_log="uploaded_log.db", region_name=None, workers=1, max_memory=None,
+                 retry_policy=None, skip_existing=False, client=None, adaptive=False, rate_limiter=None,
+                 vault_cache_ttl=3600, replicas=None, compression=None, compression_level=None, read_ahead=1,
+                 drop_cache=True, endpoint_url=None):
         """Initializing the GlacierLib. If region is not specified one from ~/.aws/config will
         be used.
 
         Args:
             vault_name (str): Name of the vault in Glacier.
-            log_file (str, optional): Logs the responses from Glacier. Defaults to "uploaded_log.json".
+            log_file (str, optional): Catalog of the responses from Glacier. Defaults to "uploaded_log.db".
             region_name (str, optional): Where the vault is located in AWS.
+            workers (int, optional): Amount of parallel uploads in the worker pool shared by all
+                the uploads. The connection pool of the client is sized to match. Defaults to 1.
+            max_memory (int, optional): Upper limit in megabytes for the part data held by the
+                in-flight parts at once. No limit by default.
+            retry_policy (RetryPolicy, optional): How the failed calls are retried. Defaults to
+                RetryPolicy().
+            skip_existing (bool, optional): Skip the files that have already been uploaded to the
+                vault (same tree hash and size in the storage). Defaults to False.
+            client (botocore.client.BaseClient, optional): Glacier client to use in place of the
+                one created for the region, e.g. one sending to the local Glacier (see local_glacier).
+                The client for the region is created on the first call to Glacier.
+            adaptive (bool, optional): Adjust the amount of parallel uploads between 1 and the
+                workers by the observed goodput and throttling (see ConcurrencyController).
+                Defaults to False.
+            rate_limiter (RateLimiter, optional): Limits the upload rate of all the workers and
+                files together. Not limited by default.
+            vault_cache_ttl (float, optional): Seconds a found vault is cached in memory and in
+                the storage before it is looked up again. 0 disables the cache. Defaults to an hour.
+            replicas (list, optional): GlacierLibs of the other vaults (e.g. in other regions) the
+                uploads are replicated to. Each part is read and hashed once and sent to all the
+                vaults at the same time. Each replica has its own client, retries, metrics and
+                records in the storage. Give them the same rate_limiter to keep the upload rate of
+                all the vaults within one limit. A replica that fails is dropped without stopping
+                the upload to the others.
+            compression (str, optional): Compress the files and streams with the codec (gzip, bz2
+                or xz) while uploading them (see CompressStream). The blocks are compressed on all
+                the CPUs and the codec and the original size are saved with the archive. Packs are
+                not compressed. Not compressed by default.
+            compression_level (int, optional): Level of the compression. Defaults to the default
+                of the codec.
+            read_ahead (int, optional): Parts read into the page cache in the background ahead of
+                each part being hashed and sent (see MappedFile.read_ahead). 0 leaves it to the
+                kernel. Defaults to 1.
+            drop_cache (bool, optional): Drop the parts that are done from the page cache, so a
+                large upload doesn't push the cached data of other programs out of memory.
+                Defaults to True.
+            endpoint_url (str, optional): Glacier endpoint used in place of the one of the region,
+                e.g. a VPC endpoint or the local Glacier served over HTTP (see LocalGlacierServer).
         """
         self.logger = logger
         self.vault_name = vault_name
-        self.client = boto3.client('glacier', region_name=region_name)                
+        self.workers = workers
+        self.max_memory = max_memory
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.skip_existing = skip_existing
+        self.rate_limiter = rate_limiter
+        self.vault_cache_ttl = vault_cache_ttl
+        self._vault_cache = dict()
+        self._vault_cache_location = None
+        self.retry_count = 0
+        self._retry_lock = threading.Lock()
+        self.metrics = UploadMetrics()
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self._client = None
+        self._client_lock = threading.Lock()
+        if client is not None:
+            self.client = client
         self.validator = Validator()
         self.storage = Storage(file_name=upload_log)
+        self.controller = ConcurrencyController(workers) if adaptive else None
+        self.scheduler = PartScheduler(workers, max_memory, self.controller)
+        self.replicas = replicas or []
+        self._replica_uploads = dict()
+        self._replica_executor = ThreadPoolExecutor(max_workers=workers * len(self.replicas)) if self.replicas else None
+        self.compression = compression
+        self.read_ahead = read_ahead
+        self.drop_cache = drop_cache
+        self.compression_level = compression_level
+        self._compress_workers = os.cpu_count() or 1
+        self._compress_executor = ThreadPoolExecutor(max_workers=self._compress_workers) if compression else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the upload workers, the compression and replication threads and the
+        replicas once the uploads are done.
+        """
+        self.scheduler.shutdown()
+        if self._replica_executor:
+            self._replica_executor.shutdown(wait=True)
+        if self._compress_executor:
+            self._compress_executor.shutdown(wait=True)
+        for replica in self.replicas:
+            replica.close()
+
+    @property
+    def client(self):
+        """The Glacier client, created when it is first needed."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self.client = create_client(self.region_name, self.workers, endpoint_url=self.endpoint_url)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        for operation in ("UploadArchive", "UploadMultipartPart"):
+            client.meta.events.register_first(
+                f'before-call.glacier.{operation}', add_content_sha256, unique_id=f"glacier-upload-sha256-{operation}"
+            )
+        self._client = client
 
     def upload(self, path_to_file, description="", **kwargs):
         """Uploading a file in a single chunk. The default option.
@@ -28,72 +184,727 @@ class GlacierLib:
         Args:
             path_to_file (str): Path to the file.
             description (str, optional): Description of what is uploaded.
+
+        Returns:
+            bool: True if the upload succeeded.
         """
         if self.validator.preupload_checks(path_to_file) and self._vault_exists(self.vault_name):
+            if self._should_skip(path_to_file):
+                return True
             total_size = get_file_size(path_to_file)
-            self._start_upload(path_to_file, description, total_size)
+            self._add_total(total_size)
+            if self.compression:
+                return self._upload_compressed(path_to_file, kwargs.get("part_size") or 4, description)
+            return self._start_upload(path_to_file, description, total_size)
+        return False
 
-    def multipart_upload(self, path_to_file, part_size=4, description=""):
+    def multipart_upload(self, path_to_file, part_size=4, description="", workers=None):
         """Uploading a file in mutiple parts.
 
         Args:
             path_to_file (str): Path to the file.
             description (str, optional): Description of what is uploaded.
-            part_size (int, optional): Size for the multipart parts. Defaults to 4 megabytes.
+            part_size (int or str, optional): Size for the multipart parts in megabytes or "auto"
+                to pick the size by the file size, workers and memory limit. Defaults to 4 megabytes.
+            workers (int, optional): Amount of parts uploaded in parallel. Defaults to the
+                value given for the GlacierLib.
+
+        Returns:
+            bool: True if the upload succeeded.
         """
-        if self.validator.preupload_checks(path_to_file, part_size) and self._vault_exists(self.vault_name):
-            total_size = get_file_size(path_to_file)
-            part_size_bytes = get_allowed_sizes().get(str(part_size))
-            parts = get_needed_parts(path_to_file, part_size_bytes, total_size)
-            parts = add_byte_ranges(parts)
-            response = self._initiate_multipart_upload(description, part_size_bytes, total_size)
-            if self.validator.is_response_ok(response):
-                upload_id = response.get("uploadId")
-                upload_success = self._do_multipart_upload(upload_id, path_to_file, parts)
-                if upload_success:
-                    self.logger.info("Calculating tree hash...")
-                    with open(path_to_file, 'rb') as file_object:
-                        total_hash = calculate_tree_hash(file_object)
-                    completed_response = self._complete_multipart_upload(upload_id, total_size, total_hash)
-                    if self.validator.is_response_ok(completed_response):
-                        self.logger.info("Upload completed.")
+        part_size = self._resolve_part_size(path_to_file, part_size, workers)
+        checks_ok = self.validator.preupload_checks(path_to_file, part_size, self.max_memory)
+        if checks_ok and self._vault_exists(self.vault_name):
+            if self._should_skip(path_to_file):
+                return True
+            self._add_total(get_file_size(path_to_file))
+            if self.compression:
+                return self._upload_compressed(path_to_file, part_size, description, workers)
+            return self._upload_multipart_file(path_to_file, part_size, description, workers)
+        return False
 
-    def _vault_exists(self, vault_name):
-        """Checks if a vault exists with the specified name (and in the region)."""
-        response = self._execute_call(self.client.list_vaults, {})
-        vault_list = response.get("VaultList")
-        exists = any([True for vault in vault_list if vault['VaultName'] == vault_name])
+    def upload_files(self, paths, multipart=False, part_size=4, description="", pack_size=None):
+        """Uploading several files on one go. The vault is checked once and the parts of
+        all the files go to the same pool of upload workers. Files that aren't larger
+        than a part are uploaded in a single chunk. Each uploaded file is saved to the
+        storage separately.
+
+        With pack_size the files smaller than a part are packed into tar archives of
+        about that size instead (see PackStream), which saves the per archive overhead
+        of Glacier. The offset and length of each file in its pack are saved to the
+        storage so a file can later be retrieved alone with a ranged retrieval.
+
+        Args:
+            paths (list): Paths to the files.
+            multipart (bool, optional): Use multipart upload for the files larger than a part.
+            part_size (int or str, optional): Size for the multipart parts in megabytes or "auto".
+                Defaults to 4 megabytes.
+            description (str, optional): Description of what is uploaded.
+            pack_size (int, optional): Pack the files smaller than a part into archives of
+                about this size in megabytes. Not packed by default.
+
+        Returns:
+            dict: Whether the upload succeeded (bool) by the path of the file.
+        """
+        if not self._vault_exists(self.vault_name):
+            return {path_to_file: False for path_to_file in paths}
+        existing = [path_to_file for path_to_file in paths if Path(path_to_file).is_file()]
+        self._add_total(sum([get_file_size(path_to_file) for path_to_file in existing]))
+        packs, skipped = self._pack_small_files(existing, part_size, pack_size) if pack_size else ([], [])
+        packed = {path_to_file for pack in packs for path_to_file in pack}.union(skipped)
+        results = {path_to_file: True for path_to_file in skipped}
+        with ThreadPoolExecutor(max_workers=self.workers) as file_executor:
+            futures = {
+                path_to_file: file_executor.submit(
+                    self._upload_batch_file, path_to_file, multipart, part_size, description
+                )
+                for path_to_file in paths if path_to_file not in packed
+            }
+            pack_futures = [file_executor.submit(self._upload_pack, pack, part_size, description) for pack in packs]
+            for future in pack_futures:
+                results.update(future.result())
+            for path_to_file, future in futures.items():
+                results[path_to_file] = future.result()
+        results = {path_to_file: results.get(path_to_file) for path_to_file in paths}
+        uploaded_count = len([result for result in results.values() if result])
+        self.logger.info(f"{uploaded_count}/{len(paths)} files uploaded.")
+        self._log_concurrency()
+        return results
+
+    def _upload_batch_file(self, path_to_file, multipart, part_size, description):
+        """Uploads one file of a batch. Run in one of the file threads which hand the
+        actual uploading to the upload workers.
+        """
+        if not self.validator.preupload_checks(path_to_file):
+            return False
+        if self._should_skip(path_to_file):
+            self._add_total(-get_file_size(path_to_file))
+            return True
+        part_size = self._resolve_part_size(path_to_file, part_size)
+        total_size = get_file_size(path_to_file)
+        if self.compression:
+            return self._upload_compressed(path_to_file, part_size, description)
+        if multipart and total_size > get_allowed_sizes().get(str(part_size), 0):
+            if not self.validator.preupload_checks(path_to_file, part_size, self.max_memory):
+                return False
+            return self._upload_multipart_file(path_to_file, part_size, description)
+        future = self.scheduler.submit(total_size, self._start_upload, path_to_file, description, total_size)
+        return future.result()
+
+    def _pack_small_files(self, paths, part_size, pack_size):
+        """Groups the files smaller than a part into packs of about pack_size megabytes.
+        Files that are skipped (already archived) are left out of the packs.
+
+        Returns:
+            tuple: The packs (lists of paths) and the skipped files.
+        """
+        small_limit = get_allowed_sizes().get(str(part_size), get_allowed_sizes().get("4"))
+        small_files = list()
+        skipped = list()
+        sizes = dict()
+        for path_to_file in dict.fromkeys(paths):
+            size = get_file_size(path_to_file)
+            if size >= small_limit or not self.validator.preupload_checks(path_to_file):
+                continue
+            if self._should_skip(path_to_file):
+                self._add_total(-size)
+                skipped.append(path_to_file)
+                continue
+            small_files.append(path_to_file)
+            sizes[path_to_file] = size
+        packs = group_files(small_files, sizes, pack_size * 1048576)
+        if packs:
+            self.logger.info(f"Packing {len(small_files)} small files into {len(packs)} archives.")
+        return packs, skipped
+
+    def _upload_pack(self, paths, part_size, description):
+        """Uploads the files as a tar archive from a PackStream and saves the archive and
+        the members of the pack to the storage.
+
+        Returns:
+            dict: Whether the upload succeeded (bool) by the path of the file.
+        """
         try:
-            assert exists
-        except AssertionError:
-            self.logger.error(f"Could not locate a vault with the name '{vault_name}'.")
-        return exists
+            stream = PackStream(paths)
+        except OSError as error:
+            self.logger.error(f"Could not pack the files: {error}")
+            return {path_to_file: False for path_to_file in paths}
+        self._add_total(stream.size - sum([member.get("length") for member in stream.members]))
+        if part_size == "auto":
+            part_size = choose_part_size(stream.size, self.workers, self.max_memory)
+        if not self.validator.prestream_checks(part_size, self.max_memory):
+            return {path_to_file: False for path_to_file in paths}
+        description = description or f"glacier-upload pack of {len(paths)} files"
+        completed_response, total_size = self._upload_stream(stream, part_size, description, self.workers)
+        if completed_response is None:
+            return {path_to_file: False for path_to_file in paths}
+        archive_id = completed_response.get("archiveId")
+        members = [member for member in stream.members if not member.get("error")]
+        replicated = self._save_archive(completed_response, size=total_size, description=description, members=members)
+        for member in members:
+            path_to_file = member.get("path_to_file")
+            fingerprint = get_file_fingerprint(path_to_file)
+            if fingerprint.get("size") == member.get("length"):
+                self.storage.save_fingerprint(path_to_file, fingerprint, member.get("checksum"))
+        self.logger.info(f"Pack of {len(paths)} files ({total_size} bytes) uploaded as {archive_id}.")
+        return {member.get("path_to_file"): replicated and not member.get("error") for member in stream.members}
+
+    def _upload_compressed(self, path_to_file, part_size, description, workers=None):
+        """Uploads the file compressed in multiple parts (the compressed size isn't known
+        beforehand). The part size is picked for the original size so it's large enough.
+        The codec and the size and tree hash of the original file are saved with the
+        archive, so the file is found by --skip-existing.
+        """
+        workers = workers or self.workers
+        fingerprint = get_file_fingerprint(path_to_file)
+        if part_size == "auto":
+            part_size = choose_part_size(fingerprint.get("size"), workers, self.max_memory)
+        if not self.validator.prestream_checks(part_size, self.max_memory):
+            return False
+        with open(path_to_file, "rb") as source:
+            stream = self._compress_stream(source, part_size)
+            completed_response, total_size = self._upload_stream(stream, part_size, description, workers)
+        if completed_response is None:
+            return False
+        self._add_total(total_size - stream.original_size)
+        replicated = self._save_archive(
+            completed_response,
+            path_to_file=path_to_file,
+            size=total_size,
+            description=description,
+            **self._compression_details(stream)
+        )
+        if stream.original_size == fingerprint.get("size"):
+            self.storage.save_fingerprint(path_to_file, fingerprint, stream.original_checksum)
+        self.logger.info(
+            f"Upload of {path_to_file} completed. {stream.original_size} bytes compressed to {total_size} "
+            f"({self.compression}). {self.retry_count} calls retried."
+        )
+        return replicated
+
+    def _compress_stream(self, source, part_size):
+        """The source compressed with a CompressStream. The window of blocks compressed
+        ahead is one more than the compression threads, within what the memory limit
+        leaves next to a part.
+        """
+        window = self._compress_workers + 1
+        if self.max_memory:
+            window = min(window, (self.max_memory - part_size) * 1048576 // (2 * BLOCK_SIZE))
+        return CompressStream(source, self.compression, self._compress_executor, self.compression_level, window=window)
+
+    def _compression_details(self, stream):
+        """The codec and the original size and tree hash of a compressed stream for the storage."""
+        if not isinstance(stream, CompressStream):
+            return dict()
+        return {
+            "codec": stream.codec,
+            "original_size": stream.original_size,
+            "original_checksum": stream.original_checksum,
+        }
+
+    def _upload_multipart_file(self, path_to_file, part_size, description, workers=None):
+        """Initiates the multipart upload and uploads the parts."""
+        fingerprint = get_file_fingerprint(path_to_file)
+        total_size = fingerprint.get("size")
+        part_size_bytes = get_allowed_sizes().get(str(part_size))
+        parts = get_needed_parts(path_to_file, part_size_bytes, total_size)
+        parts = add_byte_ranges(parts)
+        response = self._initiate_multipart_upload(description, part_size_bytes, total_size)
+        if not self.validator.is_response_ok(response):
+            return False
+        upload_id = response.get("uploadId")
+        details = {
+            "path_to_file": str(Path(path_to_file).resolve()),
+            "vault_name": self.vault_name,
+            "region_name": self.client.meta.region_name,
+            "description": description,
+            "part_size": part_size_bytes,
+            "total_size": total_size,
+            "fingerprint": fingerprint,
+        }
+        journal = Journal(self.storage.file_name, upload_id)
+        journal.start(details)
+        self.logger.info(f"Upload id {upload_id}. Can be resumed with --resume if interrupted.")
+        return self._finish_multipart_upload(upload_id, parts, details, workers, journal)
+
+    def stream_upload(self, stream, part_size=4, description="", workers=None):
+        """Uploading from a stream (e.g. stdin or a pipe) in multiple parts as the data
+        arrives. The size doesn't need to be known beforehand. The parts are read into
+        a fixed pool of reusable buffers (one more than the workers, within the memory
+        limit) and the tree hash is collected from the parts as they are uploaded.
+
+        Args:
+            stream (io.BufferedIOBase): Binary stream with readinto (e.g. sys.stdin.buffer).
+            part_size (int or str, optional): Size for the multipart parts in megabytes or "auto".
+                Defaults to 4 megabytes.
+            description (str, optional): Description of what is uploaded.
+            workers (int, optional): Amount of parts uploaded in parallel. Defaults to the
+                value given for the GlacierLib.
+
+        Returns:
+            bool: True if the upload succeeded.
+        """
+        workers = workers or self.workers
+        if part_size == "auto":
+            part_size = choose_part_size(None, workers, self.max_memory)
+        if not (self.validator.prestream_checks(part_size, self.max_memory) and self._vault_exists(self.vault_name)):
+            return False
+        if self.compression:
+            stream = self._compress_stream(stream, part_size)
+        completed_response, total_size = self._upload_stream(stream, part_size, description, workers)
+        if completed_response is None:
+            return False
+        replicated = self._save_archive(
+            completed_response, size=total_size, description=description, **self._compression_details(stream)
+        )
+        self.logger.info(f"Upload of the stream ({total_size} bytes) completed. {self.retry_count} calls retried.")
+        self._log_concurrency()
+        return replicated
+
+    def _upload_stream(self, stream, part_size, description, workers):
+        """Uploads the stream in parts from a pool of buffers and completes the upload.
+        The buffers (and the window of a compressed stream) are charged against the memory
+        budget of the scheduler, so the parts are submitted without a further cost.
+
+        Returns:
+            tuple: The response of the completed upload (None if the upload failed) and the
+                size of the uploaded data.
+        """
+        part_size_bytes = get_allowed_sizes().get(str(part_size))
+        parts = list()
+        total_size = 0
+        failed = threading.Event()
+        with self._scheduler_for(workers) as scheduler, self._buffer_pool(stream, part_size, scheduler) as pool:
+            buffer = pool.get()
+            with self.metrics.phase("disk_read"):
+                length = fill_buffer(stream, buffer)
+            if not length:
+                self.logger.error("Nothing to upload, the stream is empty.")
+                return None, 0
+            response = self._initiate_multipart_upload(description, part_size_bytes)
+            if not self.validator.is_response_ok(response):
+                return None, 0
+            upload_id = response.get("uploadId")
+            futures = list()
+            while length and not failed.is_set():
+                if len(parts) == MAX_PARTS:
+                    self.logger.error(f"The stream needs more than {MAX_PARTS} parts. Please specify larger part size.")
+                    failed.set()
+                    break
+                part = {"part_size": length}
+                part.update(get_byte_range(total_size, length))
+                parts.append(part)
+                total_size += length
+                futures.append(
+                    scheduler.submit(0, self._upload_buffer_part, upload_id, buffer, part, len(parts), failed, pool)
+                )
+                buffer = pool.get()
+                with self.metrics.phase("disk_read"):
+                    length = fill_buffer(stream, buffer)
+            for future in as_completed(futures):
+                if future.exception():
+                    failed.set()
+            for future in futures:
+                future.result()
+        self.logger.debug(parts)
+        if failed.is_set() or not all([part.get("success") for part in parts]):
+            return None, 0
+        total_hash = tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")])
+        completed_response = self._complete_multipart_upload(upload_id, total_size, total_hash)
+        if self.validator.is_response_ok(completed_response):
+            return completed_response, total_size
+        return None, 0
+
+    def _buffer_pool(self, stream, part_size, scheduler):
+        """Pool of one buffer more than the workers of the scheduler (within the memory
+        limit) for the parts of the stream, charged against the memory budget of the
+        scheduler. The window of a compressed stream is reserved along with the first buffer.
+        """
+        buffer_count = scheduler.workers + 1
+        reserved = stream.memory if isinstance(stream, CompressStream) else 0
+        if self.max_memory:
+            buffer_count = min(buffer_count, (self.max_memory * 1048576 - reserved) // (part_size * 1048576))
+        return BufferPool(get_allowed_sizes().get(str(part_size)), buffer_count, scheduler.budget, reserved)
+
+    def resume_multipart_upload(self, upload_id, workers=None):
+        """Resuming an interrupted multipart upload. The parts recorded in the journal are
+        compared to the parts Glacier has received and only the missing parts are
+        uploaded. Parts that Glacier has but the journal doesn't are hashed again
+        (without uploading) to get their tree hash leaves. If the file has changed (its
+        size, modification time or inode) since the upload was started, all the parts
+        Glacier has are hashed again and the ones that don't match are uploaded again.
+
+        Args:
+            upload_id (str): Id of the interrupted multipart upload.
+            workers (int, optional): Amount of parts uploaded in parallel. Defaults to the
+                value given for the GlacierLib.
+
+        Returns:
+            bool: True if the upload succeeded.
+        """
+        journal = Journal(self.storage.file_name, upload_id)
+        if not journal.exists():
+            self.logger.error(f"No journal found for the upload {upload_id}. Can't resume.")
+            return False
+        details, journaled_parts = journal.load()
+        path_to_file = details.get("path_to_file")
+        total_size = details.get("total_size")
+        if not self.validator.preresume_checks(path_to_file, total_size):
+            return False
+        fingerprint = get_file_fingerprint(path_to_file)
+        if details.get("fingerprint") != fingerprint:
+            # The journaled hashes can't be trusted, the parts Glacier has are hashed again
+            # and the ones that don't match the file any more are uploaded again.
+            self.logger.warning(f"{path_to_file} has changed since the upload was started. Checking the parts again.")
+            details.update({"fingerprint": fingerprint})
+            journaled_parts = dict()
+            journal.start(details)
+        uploaded = self._list_uploaded_parts(upload_id)
+        if uploaded is None:
+            return False
+        parts = add_byte_ranges(get_needed_parts(path_to_file, details.get("part_size"), total_size))
+        unjournaled = list()
+        for part in parts:
+            journaled = journaled_parts.get(part.get("range_start"))
+            checksum = uploaded.get(part.get("range_start"))
+            if journaled and journaled.get("checksum") == checksum:
+                part.update({"leaf_hashes": journaled.get("leaf_hashes"), "checksum": checksum, "success": True})
+            elif checksum:
+                unjournaled.append(part)
+        self._hash_parts(path_to_file, unjournaled)
+        for part in unjournaled:
+            if part.get("checksum") == uploaded.get(part.get("range_start")):
+                part.update({"success": True})
+                journal.add_part(part)
+        done_count = len([part for part in parts if part.get("success")])
+        self._add_total(sum([part.get("part_size") for part in parts if not part.get("success")]))
+        self.logger.info(f"Resuming upload {upload_id}. {done_count}/{len(parts)} parts already uploaded.")
+        return self._finish_multipart_upload(upload_id, parts, details, workers, journal)
+
+    def _finish_multipart_upload(self, upload_id, parts, details, workers, journal):
+        """Uploads the parts that haven't been uploaded yet, completes the upload and saves
+        the response to the storage.
+        """
+        path_to_file = details.get("path_to_file")
+        total_size = details.get("total_size")
+        pending = [part for part in parts if not part.get("success")]
+        upload_success = self._do_multipart_upload(upload_id, path_to_file, pending, workers, journal)
+        if upload_success:
+            total_hash = tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")])
+            completed_response = self._complete_multipart_upload(upload_id, total_size, total_hash)
+            if self.validator.is_response_ok(completed_response):
+                replicated = self._save_archive(
+                    completed_response,
+                    path_to_file=path_to_file,
+                    size=total_size,
+                    description=details.get("description"),
+                )
+                if details.get("fingerprint"):
+                    self.storage.save_fingerprint(path_to_file, details.get("fingerprint"), total_hash)
+                journal.remove()
+                self.logger.info(f"Upload of {path_to_file} completed. {self.retry_count} calls retried.")
+                self._log_concurrency()
+                return replicated
+        return False
+
+    def start_distributed_upload(self, path_to_file, shard_count, plan_dir, part_size=4, description=""):
+        """Starts a multipart upload that is uploaded by several workers, e.g. on hosts that
+        mount the same shared storage, so the upload isn't limited by the network of one
+        host. The parts are split into shard_count contiguous shards and the plan is
+        written to plan_dir (see ShardPlan). Each shard is then uploaded with upload_shard
+        and the upload completed with complete_distributed_upload. The replicas are not
+        used for a distributed upload.
+
+        Args:
+            path_to_file (str): Path to the file.
+            shard_count (int): Amount of shards (less if the file has less parts).
+            plan_dir (str): Directory shared by the coordinator and the workers.
+            part_size (int or str, optional): Size for the multipart parts in megabytes or "auto".
+                Defaults to 4 megabytes.
+            description (str, optional): Description of what is uploaded.
+
+        Returns:
+            str: Id of the upload or None if it couldn't be started.
+        """
+        part_size = self._resolve_part_size(path_to_file, part_size)
+        checks_ok = self.validator.preupload_checks(path_to_file, part_size, self.max_memory)
+        if not (checks_ok and self._vault_exists(self.vault_name)):
+            return None
+        fingerprint = get_file_fingerprint(path_to_file)
+        total_size = fingerprint.get("size")
+        part_size_bytes = get_allowed_sizes().get(str(part_size))
+        parts = add_byte_ranges(get_needed_parts(path_to_file, part_size_bytes, total_size))
+        response = self._initiate_multipart_upload(description, part_size_bytes, total_size)
+        if not self.validator.is_response_ok(response):
+            return None
+        upload_id = response.get("uploadId")
+        shards = [
+            {
+                "shard": number,
+                "range_start": shard[0].get("range_start"),
+                "range_end": shard[-1].get("range_end"),
+                "part_count": len(shard),
+            }
+            for number, shard in enumerate(split_into_shards(parts, shard_count), 1)
+        ]
+        ShardPlan(plan_dir, upload_id).write({
+            "path_to_file": str(Path(path_to_file).resolve()),
+            "vault_name": self.vault_name,
+            "region_name": self.client.meta.region_name,
+            "description": description,
+            "part_size": part_size_bytes,
+            "total_size": total_size,
+            "fingerprint": fingerprint,
+        }, shards)
+        self.logger.info(
+            f"Upload id {upload_id} planned in {len(shards)} shards of {len(parts)} parts. Upload each with "
+            f"'glacier-upload shard --plan-dir {plan_dir} --upload-id {upload_id} --shard N' (N 1-{len(shards)})."
+        )
+        return upload_id
+
+    def upload_shard(self, plan_dir, upload_id, shard, path_to_file=None, workers=None):
+        """Uploads the parts of a shard of a distributed upload and reports their tree hash
+        leaves to the coordinator (in the plan directory). A shard that fails can be
+        uploaded again.
+
+        Args:
+            plan_dir (str): Directory shared by the coordinator and the workers.
+            upload_id (str): Id of the upload.
+            shard (int): Number of the shard (from 1).
+            path_to_file (str, optional): Path to the file on this host if it isn't the
+                same as on the coordinator (e.g. mounted elsewhere).
+            workers (int, optional): Amount of parts uploaded in parallel. Defaults to the
+                value given for the GlacierLib.
+
+        Returns:
+            bool: True if the shard was uploaded.
+        """
+        plan = ShardPlan(plan_dir, upload_id)
+        if not plan.exists():
+            self.logger.error(f"No plan found for the upload {upload_id} in {plan_dir}.")
+            return False
+        details = plan.load()
+        path_to_file = path_to_file or details.get("path_to_file")
+        planned = [planned for planned in details.get("shards") if planned.get("shard") == shard]
+        if not planned:
+            self.logger.error(f"The upload {upload_id} has no shard {shard} (1-{len(details.get('shards'))}).")
+            return False
+        if not self.validator.preresume_checks(path_to_file, details.get("total_size")):
+            return False
+        parts = [
+            part for part in add_byte_ranges(
+                get_needed_parts(path_to_file, details.get("part_size"), details.get("total_size"))
+            )
+            if planned[0].get("range_start") <= part.get("range_start") <= planned[0].get("range_end")
+        ]
+        self._add_total(sum([part.get("part_size") for part in parts]))
+        self.logger.info(f"Uploading shard {shard}/{len(details.get('shards'))} ({len(parts)} parts) of {upload_id}.")
+        if not self._do_multipart_upload(upload_id, path_to_file, parts, workers):
+            self.logger.error(f"Shard {shard} of {upload_id} failed. Can be uploaded again.")
+            return False
+        plan.report(shard, parts)
+        self.logger.info(f"Shard {shard} of {upload_id} done. {self.retry_count} calls retried.")
+        return True
+
+    def complete_distributed_upload(self, plan_dir, upload_id, timeout=None, poll_interval=5.0):
+        """Waits for the workers to report all the shards of a distributed upload, combines
+        their tree hash leaves into the tree hash of the archive and completes the upload.
+        If the shards aren't reported in time the upload is left open, so this can be
+        called again once they are.
+
+        Args:
+            plan_dir (str): Directory shared by the coordinator and the workers.
+            upload_id (str): Id of the upload.
+            timeout (float, optional): Seconds to wait for the shards. Waits until they
+                are reported by default.
+            poll_interval (float, optional): Seconds between the checks of the reports.
+                Defaults to 5.
+
+        Returns:
+            bool: True if the upload succeeded.
+        """
+        plan = ShardPlan(plan_dir, upload_id)
+        if not plan.exists():
+            self.logger.error(f"No plan found for the upload {upload_id} in {plan_dir}.")
+            return False
+        details = plan.load()
+        shard_count = len(details.get("shards"))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reported_count = 0
+        while True:
+            reports = plan.load_reports()
+            if len(reports) != reported_count:
+                reported_count = len(reports)
+                self.logger.info(f"{reported_count}/{shard_count} shards of {upload_id} uploaded.")
+            if reported_count == shard_count:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                missing = [
+                    str(shard.get("shard")) for shard in details.get("shards") if shard.get("shard") not in reports
+                ]
+                self.logger.error(f"Shards {', '.join(missing)} of {upload_id} not uploaded in time. Upload left open.")
+                return False
+            time.sleep(poll_interval)
+        reported = {start: part for parts in reports.values() for start, part in parts.items()}
+        path_to_file = details.get("path_to_file")
+        total_size = details.get("total_size")
+        parts = add_byte_ranges(get_needed_parts(path_to_file, details.get("part_size"), total_size))
+        for part in parts:
+            report = reported.get(part.get("range_start"))
+            if report is None or report.get("range_end") != part.get("range_end"):
+                self.logger.error(f"Part at {part.get('range_start')} of {upload_id} wasn't reported by the shards.")
+                return False
+            part.update({"leaf_hashes": report.get("leaf_hashes")})
+        total_hash = tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")])
+        completed_response = self._complete_multipart_upload(upload_id, total_size, total_hash)
+        if not self.validator.is_response_ok(completed_response):
+            self.logger.error(f"Completing the upload {upload_id} failed!")
+            return False
+        self._save_archive(
+            completed_response, path_to_file=path_to_file, size=total_size, description=details.get("description")
+        )
+        self.storage.save_fingerprint(path_to_file, details.get("fingerprint"), total_hash)
+        plan.remove()
+        self.logger.info(f"Upload of {path_to_file} completed from {shard_count} shards.")
+        return True
+
+    def _resolve_part_size(self, path_to_file, part_size, workers=None):
+        """Picks the part size for the file if the automatic part size ("auto") is used."""
+        if part_size != "auto" or not Path(path_to_file).is_file():
+            return part_size
+        part_size = choose_part_size(get_file_size(path_to_file), workers or self.workers, self.max_memory)
+        self.logger.info(f"Using part size {part_size} MB for {path_to_file}.")
+        return part_size
+
+    def _should_skip(self, path_to_file):
+        """Checks if the file should be skipped because it has already been uploaded."""
+        return self.skip_existing and self._is_already_archived(path_to_file)
+
+    def _is_already_archived(self, path_to_file):
+        """Looks up the tree hash and size of the file from the archives in the storage
+        uploaded to this vault. The tree hash is taken from the fingerprint cache if the
+        file hasn't changed and calculated (and cached) otherwise.
+        """
+        fingerprint = get_file_fingerprint(path_to_file)
+        checksum = self.storage.find_checksum_by_fingerprint(path_to_file, fingerprint)
+        if checksum is None:
+            self.logger.info(f"Calculating tree hash of {path_to_file}...")
+            with self.metrics.phase("hashing"):
+                checksum = file_tree_hash(path_to_file)
+            self.storage.save_fingerprint(path_to_file, fingerprint, checksum)
+        archived = self.storage.find_by_checksum(checksum, self.vault_name, fingerprint.get("size"))
+        archived = archived or self.storage.find_pack_members_by_checksum(
+            checksum, self.vault_name, fingerprint.get("size")
+        )
+        archived = archived or self.storage.find_by_original_checksum(
+            checksum, self.vault_name, fingerprint.get("size")
+        )
+        if archived:
+            self.logger.info(f"{path_to_file} already archived as {archived[0].get('archive_id')}. Skipping.")
+        return bool(archived)
+
+    def _vault_exists(self, vault_name):
+        """Checks if a vault exists with the specified name (and in the region). A found
+        vault is cached by the credentials, region (and endpoint) and name in memory and
+        in the storage for vault_cache_ttl seconds, so the uploads of a batch and repeated
+        runs (e.g. from cron) don't each need a call to Glacier (or the client).
+        """
+        key = self._vault_cache_key(vault_name)
+        if key is None or not self._vault_cached(key):
+            response = self._execute_call(self.client.describe_vault, {"vaultName": vault_name})
+            exists = self.validator.is_response_ok(response) and response.get("VaultName") == vault_name
+            if not exists:
+                self.logger.error(f"Could not locate a vault with the name '{vault_name}'.")
+                return False
+            if key is not None and self.vault_cache_ttl:
+                checked_at = self.storage.save_vault(*key, vault_arn=response.get("VaultARN"))
+                self._vault_cache[key] = checked_at + self.vault_cache_ttl
+        # The vaults of the replicas are checked (through their own caches) even if this one is cached.
+        return all([replica._vault_exists(replica.vault_name) for replica in self.replicas])
+
+    def _vault_cached(self, key):
+        """True if the vault was found within vault_cache_ttl seconds (in memory or in the storage)."""
+        if not self.vault_cache_ttl:
+            return False
+        if self._vault_cache.get(key, 0) > time.time():
+            return True
+        cached = self.storage.find_vault(*key, max_age=self.vault_cache_ttl)
+        if cached:
+            self._vault_cache[key] = cached.get("checked_at") + self.vault_cache_ttl
+        return bool(cached)
+
+    def _vault_cache_key(self, vault_name):
+        """Key of the vault in the vault cache. Taken from the settings and the environment
+        without creating the client: the access key id (or the profile) of the credentials,
+        the region and endpoint (of the client if one was given) and the name of the vault.
+
+        Returns:
+            tuple: The key or None (not cached) if the region can't be resolved.
+        """
+        if self._vault_cache_location is None:
+            if self._client is not None:
+                region_name = self._client.meta.region_name
+            else:
+                region_name = self.region_name or resolve_region_name()
+            endpoint_url = self.endpoint_url
+            location = f"{region_name} {endpoint_url}" if endpoint_url else region_name
+            self._vault_cache_location = location if region_name else ""
+        if not self._vault_cache_location:
+            return None
+        profile = os.environ.get("AWS_PROFILE") or os.environ.get("AWS_DEFAULT_PROFILE") or "default"
+        identity = os.environ.get("AWS_ACCESS_KEY_ID") or f"profile:{profile}"
+        return identity, self._vault_cache_location, vault_name
 
     def _start_upload(self, path_to_file, description, total_size):
-        """The single chunk upload."""
+        """The single chunk upload. The file is hashed first (in one pass) and then
+        sent from the memory mapped file like the parts of a multipart upload.
+        """
+        fingerprint = get_file_fingerprint(path_to_file)
         self.logger.info(f"Starting upload. File size {total_size} bytes.")
-        with open(path_to_file, "rb") as file_object:
+        with MappedFile(path_to_file, self.drop_cache) as mapped_file, mapped_file.part_view(0, total_size) as body:
+            with self.metrics.cpu_phase("hashing"):
+                hashes, body.content_sha256 = part_hashes(body.data)
+            body.rate_limiter = self.rate_limiter
             upload_kwargs = {
                 "vaultName": self.vault_name,
                 "archiveDescription": description,
-                "body": file_object,
+                "checksum": tree_hash(hashes),
+                "body": body,
             }
             self.logger.info("Uploading...")
+            replica_futures = [
+                self._replica_executor.submit(
+                    self._upload_replica_archive, replica, description, upload_kwargs.get("checksum"), body.clone()
+                )
+                for replica in self.replicas
+            ]
             response = self._execute_call(
                 self.client.upload_archive,
                 upload_kwargs
             )
-            if self.validator.is_response_ok(response):
-                self.logger.info("Upload completed.")
-                self.storage.save(response)
-            else:
-                self.logger.error("Upload failed!")
-                self.logger.debug(response)
+            replica_responses = [(replica, future.result()) for replica, future in zip(self.replicas, replica_futures)]
+            mapped_file.release(0, total_size)
+        if self.validator.is_response_ok(response):
+            self.logger.info(f"Upload of {path_to_file} completed.")
+            response.update({"replicas": replica_responses})
+            replicated = self._save_archive(
+                response,
+                path_to_file=path_to_file,
+                size=total_size,
+                description=description,
+            )
+            self.storage.save_fingerprint(path_to_file, fingerprint, upload_kwargs.get("checksum"))
+            return replicated
+        else:
+            self.logger.error(f"Upload of {path_to_file} failed!")
+            self.logger.debug(response)
+            return False
 
-    def _initiate_multipart_upload(self, description, part_size_bytes, total_size):
+    def _initiate_multipart_upload(self, description, part_size_bytes, total_size=None):
         """The multipart upload in the Glacier."""
         self.logger.info(f"Starting multipart upload with part size {part_size_bytes} bytes.")
-        self.logger.info(f"Total upload size {total_size} bytes.")
+        if total_size is not None:
+            self.logger.info(f"Total upload size {total_size} bytes.")
         initiate_kwargs = {
             "vaultName": self.vault_name,
             "archiveDescription": description,
@@ -103,40 +914,157 @@ class GlacierLib:
             self.client.initiate_multipart_upload,
             initiate_kwargs
         )
+        if self.replicas and self.validator.is_response_ok(response):
+            self._replica_uploads[response.get("uploadId")] = [
+                {"replica": replica, "upload_id": self._initiate_replica(replica, description, part_size_bytes)}
+                for replica in self.replicas
+            ]
         return response
 
-    def _do_multipart_upload(self, upload_id, path_to_file, parts):
-        """Uploads the file part by part."""
+    def _do_multipart_upload(self, upload_id, path_to_file, parts, workers=None, journal=None):
+        """Uploads the file part by part. The parts are queued to the upload workers
+        which send them straight from the memory mapped file. The tree hash leaves of
+        each part are collected while the part is hashed for the upload so the file is
+        read only once. A part is queued only when it fits in the memory limit. Completed
+        parts are recorded in the journal (if given). Stops uploading new parts after
+        the first failed one.
+
+        The shared worker pool is used unless a different amount of workers is given.
+        """
         part_count = len(parts)
-        with open(path_to_file, "rb") as file_object:
-            for i, part in enumerate(parts, 1):
-                self.logger.info(f"Uploading part {i}/{part_count}...")
-                file_object.seek(part.get("range_start"))
-                part_data = file_object.read(part.get("part_size"))
-                response = self._upload_part(part, upload_id, part.get("range"), part_data)
-                if self.validator.is_response_ok(response):
-                    part.update({"success": True})
-                    self.logger.info("Done.")
-                else:
-                    # TODO: Retry?
-                    part.update({"success": False})
-                    self.logger.error("Failed!")
-                    break
+        failed = threading.Event()
+        with self._scheduler_for(workers) as scheduler, MappedFile(path_to_file, self.drop_cache) as mapped_file:
+            futures = [
+                scheduler.submit(
+                    part.get("part_size"),
+                    self._upload_file_part, upload_id, mapped_file, part, i, part_count, failed, journal
+                )
+                for i, part in enumerate(parts, 1)
+            ]
+            for future in as_completed(futures):
+                if future.exception():
+                    failed.set()
+            for future in futures:
+                future.result()
         self.logger.debug(parts)
-        return all([True for part in parts if part["success"]])
+        return all([part.get("success") for part in parts])
+
+    def _upload_file_part(self, upload_id, mapped_file, part, part_number, part_count, failed, journal):
+        """Hashes and uploads a single part. Run in one of the upload workers."""
+        if failed.is_set():
+            part.update({"success": False})
+            return
+        file_name = Path(mapped_file.path_to_file).name
+        self.logger.info(f"Uploading part {part_number}/{part_count} of {file_name}...")
+        mapped_file.read_ahead(part.get("range_end") + 1, part.get("part_size") * self.read_ahead)
+        with mapped_file.part_view(part.get("range_start"), part.get("part_size")) as body:
+            with self.metrics.cpu_phase("hashing"):
+                hashes, body.content_sha256 = part_hashes(body.data)
+            part.update({"leaf_hashes": hashes, "checksum": tree_hash(hashes)})
+            response = self._upload_part(part, upload_id, part.get("range"), body)
+        mapped_file.release(part.get("range_start"), part.get("part_size"))
+        if self.validator.is_response_ok(response):
+            part.update({"success": True})
+            if journal:
+                journal.add_part(part)
+            self.logger.info(f"Part {part_number}/{part_count} of {file_name} done.")
+        else:
+            part.update({"success": False})
+            failed.set()
+            self.logger.error(f"Part {part_number}/{part_count} of {file_name} failed!")
+
+    def _upload_buffer_part(self, upload_id, buffer, part, part_number, failed, pool):
+        """Hashes and uploads a single part read from a stream. The buffer is returned
+        to the pool afterwards. Run in one of the upload workers.
+        """
+        try:
+            if failed.is_set():
+                part.update({"success": False})
+                return
+            self.logger.info(f"Uploading part {part_number} of the stream...")
+            with PartView(buffer, 0, part.get("part_size")) as body:
+                with self.metrics.cpu_phase("hashing"):
+                    hashes, body.content_sha256 = part_hashes(body.data)
+                part.update({"leaf_hashes": hashes, "checksum": tree_hash(hashes)})
+                response = self._upload_part(part, upload_id, part.get("range"), body)
+            if self.validator.is_response_ok(response):
+                part.update({"success": True})
+                self.logger.info(f"Part {part_number} of the stream done.")
+            else:
+                part.update({"success": False})
+                failed.set()
+                self.logger.error(f"Part {part_number} of the stream failed!")
+        finally:
+            pool.put(buffer)
+
+    @contextmanager
+    def _scheduler_for(self, workers=None):
+        """The shared scheduler or a temporary one if a different amount of workers is
+        asked for. The shared one is always used with the adaptive concurrency.
+        """
+        if not workers or workers == self.scheduler.workers or self.controller:
+            yield self.scheduler
+            return
+        with PartScheduler(workers, self.max_memory) as scheduler:
+            yield scheduler
+
+    def _hash_parts(self, path_to_file, parts):
+        """Calculates the tree hash leaves and checksums of the given parts (each on
+        several cores).
+        """
+        for part in parts:
+            with self.metrics.phase("hashing"):
+                hashes = file_leaf_hashes(path_to_file, part.get("range_start"), part.get("part_size"))
+            part.update({"leaf_hashes": hashes, "checksum": tree_hash(hashes)})
+
+    def _list_uploaded_parts(self, upload_id):
+        """Lists the parts of a multipart upload that Glacier has received.
+
+        Returns:
+            dict: Tree hashes of the uploaded parts by the start of their byte range or
+                None if the listing failed.
+        """
+        uploaded = dict()
+        list_kwargs = {
+            "vaultName": self.vault_name,
+            "uploadId": upload_id,
+        }
+        while True:
+            response = self._execute_call(self.client.list_parts, list_kwargs)
+            if response is None:
+                return None
+            for part in response.get("Parts", []):
+                range_start = int(part.get("RangeInBytes").split("-")[0])
+                uploaded.update({range_start: part.get("SHA256TreeHash")})
+            if not response.get("Marker"):
+                break
+            list_kwargs.update({"marker": response.get("Marker")})
+        return uploaded
 
     def _upload_part(self, part, upload_id, range_string, body):
-        """Uploading a single part."""
+        """Uploading a single part. The checksum of the part is sent along if it is
+        already known so that botocore doesn't need to hash the body again.
+        """
         upload_kwargs = {
             "vaultName": self.vault_name,
             "uploadId": upload_id,
             "range": range_string,
             "body": body,
         }
+        if part.get("checksum"):
+            upload_kwargs.update({"checksum": part.get("checksum")})
+        replica_futures = [
+            self._replica_executor.submit(self._upload_replica_part, replica_upload, part, range_string, body.clone())
+            for replica_upload in self._replica_uploads.get(upload_id, []) if replica_upload.get("upload_id")
+        ]
+        body.rate_limiter = self.rate_limiter
         response = self._execute_call(
             self.client.upload_multipart_part,
-            upload_kwargs
+            upload_kwargs,
+            part
         )
+        for future in replica_futures:
+            future.result()
         return response
 
     def _complete_multipart_upload(self, upload_id, total_size, total_hash):
@@ -151,19 +1079,168 @@ class GlacierLib:
             self.client.complete_multipart_upload,
             complete_kwargs
             )
-        self.storage.save(response)
+        replica_uploads = self._replica_uploads.pop(upload_id, [])
+        if self.validator.is_response_ok(response) and replica_uploads:
+            response.update({"replicas": [
+                (replica_upload.get("replica"), self._complete_replica(replica_upload, total_size, total_hash))
+                for replica_upload in replica_uploads
+            ]})
         return response
 
+    def _save_archive(self, response, members=None, **details):
+        """Saves the uploaded archive (and the members if it is a pack) to the storage,
+        and the archives of the replicas with their own vault and region.
+
+        Returns:
+            bool: False if the upload to any of the replicas failed.
+        """
+        replicas = response.pop("replicas", [])
+        destinations = [(self, response)] + replicas
+        replicated = True
+        for glacier_lib, glacier_response in destinations:
+            if glacier_lib is not self and not self.validator.is_response_ok(glacier_response):
+                self.logger.error(f"Replication to {glacier_lib.destination} failed.")
+                replicated = False
+                continue
+            self.storage.save(
+                glacier_response,
+                vault_name=glacier_lib.vault_name,
+                region_name=glacier_lib.client.meta.region_name,
+                **details
+            )
+            if members:
+                self.storage.save_pack_members(glacier_response.get("archiveId"), glacier_lib.vault_name, members)
+            if glacier_lib is not self:
+                self.logger.info(
+                    f"Replicated to {glacier_lib.destination} as {glacier_response.get('archiveId')}. "
+                    f"{glacier_lib.retry_count} calls retried."
+                )
+        return replicated
+
+    @property
+    def destination(self):
+        """Region and vault as region:vault."""
+        return f"{self.client.meta.region_name}:{self.vault_name}"
+
+    def _add_total(self, amount):
+        """Adds to the bytes to upload of this and the replicas."""
+        for glacier_lib in [self] + self.replicas:
+            glacier_lib.metrics.add_total(amount)
+
+    def _initiate_replica(self, replica, description, part_size_bytes):
+        """Initiates the multipart upload to the replica.
+
+        Returns:
+            str: The upload id or None if it could not be initiated.
+        """
+        response = replica._initiate_multipart_upload(description, part_size_bytes)
+        if not self.validator.is_response_ok(response):
+            self.logger.error(f"Could not start the upload to {replica.destination}. Continuing without it.")
+            return None
+        return response.get("uploadId")
+
+    def _upload_replica_part(self, replica_upload, part, range_string, body):
+        """Sends the part (hashed already) to a replica. Run in the replica threads. The
+        replica is dropped from the upload if the part fails.
+        """
+        replica = replica_upload.get("replica")
+        with body:
+            response = replica._upload_part(
+                {"checksum": part.get("checksum")}, replica_upload.get("upload_id"), range_string, body
+            )
+        if not self.validator.is_response_ok(response):
+            self.logger.error(f"Part {range_string} failed for {replica.destination}. Continuing without it.")
+            replica_upload.update({"upload_id": None})
+
+    def _complete_replica(self, replica_upload, total_size, total_hash):
+        if not replica_upload.get("upload_id"):
+            return None
+        replica = replica_upload.get("replica")
+        return replica._complete_multipart_upload(replica_upload.get("upload_id"), total_size, total_hash)
+
+    def _upload_replica_archive(self, replica, description, checksum, body):
+        """Sends the archive (hashed already) to a replica in a single chunk."""
+        with body:
+            body.rate_limiter = replica.rate_limiter
+            upload_kwargs = {
+                "vaultName": replica.vault_name,
+                "archiveDescription": description,
+                "checksum": checksum,
+                "body": body,
+            }
+            return replica._execute_call(replica.client.upload_archive, upload_kwargs)
+
     def _abort_multipart_upload(self, upload_id):
-        """TODO: Possibility to abort a failed upload."""
-        pass
+        """Aborts the multipart upload (and the uploads to the replicas) so that Glacier
+        drops the parts it has received. An aborted upload can't be resumed.
+
+        Returns:
+            bool: True if the upload was aborted.
+        """
+        abort_kwargs = {
+            "vaultName": self.vault_name,
+            "uploadId": upload_id,
+        }
+        response = self._execute_call(
+            self.client.abort_multipart_upload,
+            abort_kwargs
+        )
+        for replica_upload in self._replica_uploads.pop(upload_id, []):
+            if replica_upload.get("upload_id"):
+                replica_upload.get("replica")._abort_multipart_upload(replica_upload.get("upload_id"))
+        if not self.validator.is_response_ok(response):
+            self.logger.error(f"Could not abort the upload {upload_id}.")
+            return False
+        self.logger.info(f"Upload {upload_id} aborted.")
+        return True
 
-    def _execute_call(self, call, kwargs):
-        """Calls the boto3 method with provided kwargs."""
-        response = None
+    def _execute_call(self, call, kwargs, record=None):
+        """Calls the boto3 method with provided kwargs. Retryable errors are tried again
+        according to the retry policy. The retries are counted in the record (e.g. the
+        part being uploaded) if one is given.
+        """
+        body = kwargs.get("body")
+        body_start = body.tell() if hasattr(body, "seek") else None
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            started = time.monotonic()
+            try:
+                response = call(**kwargs)
+                elapsed = time.monotonic() - started
+                self.logger.debug(response)
+                self.metrics.add_phase("network" if body is not None else "api", elapsed)
+                if body is not None:
+                    size = self._body_size(body)
+                    self.metrics.part_done(size, elapsed)
+                    if self.controller:
+                        self.controller.completed(size, elapsed)
+                return response
+            except Exception as error:
+                self.metrics.add_phase("network" if body is not None else "api", time.monotonic() - started)
+                if self.controller and is_throttling(error):
+                    self.controller.throttled()
+                retryable = self.retry_policy.is_retryable(error)
+                if retryable and attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.delay(attempt)
+                    self.logger.warning(
+                        f"{error} Retrying in {delay:.1f} seconds (attempt {attempt}/{self.retry_policy.max_attempts})."
+                    )
+                    self._count_retry(record)
+                    with self.metrics.phase("retry_wait"):
+                        time.sleep(delay)
+                    if body_start is not None:
+                        body.seek(body_start)
+                    continue
+                if retryable:
+                    self.logger.error(f"Giving up after {attempt} attempts.")
+                self._log_call_error(error, retryable)
+                return None
+
+    def _log_call_error(self, error, handled=False):
+        """Logs the errors known to end the upload. Other errors are raised unless
+        they have already been handled (e.g. retried).
+        """
         try:
-            response = call(**kwargs)
-            self.logger.debug(response)
+            raise error
         except self.client.exceptions.ResourceNotFoundException:
             self.logger.error("Vault not found! Aborting upload.")
         except self.client.exceptions.InvalidParameterValueException:
@@ -174,4 +1251,27 @@ class GlacierLib:
             self.logger.error("Request timed out! Aborting upload.")
         except self.client.exceptions.ServiceUnavailableException:
             self.logger.error("Connection error or service unavailable. Aborting upload.")
-        return response
+        except Exception:
+            if not handled:
+                raise
+            self.logger.error(f"{error} Aborting upload.")
+
+    def _body_size(self, body):
+        if hasattr(body, "__len__"):
+            return len(body)
+        return os.fstat(body.fileno()).st_size
+
+    def _log_concurrency(self):
+        """Logs the concurrency chosen by the adaptive controller."""
+        if self.controller:
+            self.logger.info(
+                f"Adaptive concurrency at {self.controller.limit} (peak {self.controller.peak_limit}, "
+                f"max {self.controller.max_limit})."
+            )
+
+    def _count_retry(self, record):
+        self.metrics.retried()
+        with self._retry_lock:
+            self.retry_count += 1
+            if record is not None:
+                record.update({"retries": record.get("retries", 0) + 1})
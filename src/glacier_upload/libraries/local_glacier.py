@@ -0,0 +1,658 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from types import SimpleNamespace
+from urllib.parse import parse_qs, unquote, urlsplit
+from botocore.awsrequest import AWSResponse
+from .glacier_library import create_client
+from .setup_logger import logger
+from .tree_hash import LEAF_SIZE, tree_hash
+
+ACCOUNT_ID = "012345678901"
+CHUNK_SIZE = 262144
+LIST_PARTS_LIMIT = 50
+LIST_JOBS_LIMIT = 50
+
+# Operations by the HTTP method and the path after the account id, with the vault names
+# and the upload and job ids as "*" (for the LocalGlacierServer).
+ROUTES = {
+    ("GET", "vaults"): "ListVaults",
+    ("GET", "vaults/*"): "DescribeVault",
+    ("POST", "vaults/*/archives"): "UploadArchive",
+    ("POST", "vaults/*/multipart-uploads"): "InitiateMultipartUpload",
+    ("PUT", "vaults/*/multipart-uploads/*"): "UploadMultipartPart",
+    ("GET", "vaults/*/multipart-uploads/*"): "ListParts",
+    ("POST", "vaults/*/multipart-uploads/*"): "CompleteMultipartUpload",
+    ("DELETE", "vaults/*/multipart-uploads/*"): "AbortMultipartUpload",
+    ("POST", "vaults/*/jobs"): "InitiateJob",
+    ("GET", "vaults/*/jobs"): "ListJobs",
+    ("GET", "vaults/*/jobs/*"): "DescribeJob",
+    ("GET", "vaults/*/jobs/*/output"): "GetJobOutput",
+}
+
+
+class ResponseBody:
+    def __init__(self, content, on_read=None):
+        """Raw body of a response from the local Glacier. Has the parts of a urllib3
+        response botocore reads the content with.
+
+        Args:
+            content (bytes): The body.
+            on_read (callable, optional): Called with the amount of bytes before each read
+                (e.g. to limit the bandwidth).
+        """
+        self._content = content
+        self._position = 0
+        self._on_read = on_read
+
+    def stream(self, amt=CHUNK_SIZE, decode_content=True):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, amt=None):
+        end = len(self._content) if amt is None else self._position + amt
+        chunk = self._content[self._position:end]
+        self._position += len(chunk)
+        if self._on_read and chunk:
+            self._on_read(len(chunk))
+        return chunk
+
+    def close(self):
+        pass
+
+
+class LocalGlacier:
+    def __init__(self, vaults=("local_vault",), latency=0.0, bandwidth=None, error_rate=0.0, throttle_rate=0.0,
+                 keep_data=True, seed=None, job_delay=0.0):
+        """In-process stand-in for Glacier. Attached to a boto3 Glacier client (see
+        local_client) it answers the requests in place of AWS so that the whole client
+        stack is used as it is with the real service: the parameters are serialized,
+        the requests signed and the bodies streamed and hashed.
+
+        The received data is checked like Glacier does it. The byte ranges of the parts
+        have to line up with the part size, the tree hash and the SHA-256 of each body
+        have to match the headers and the completed archive has to be whole and match
+        its tree hash. Otherwise the call fails with InvalidParameterValueException.
+
+        Archive retrieval jobs are completed job_delay seconds after they are initiated
+        and their output can be downloaded in byte ranges. The tree hash of a range is
+        answered when the range is aligned to the tree hash (megabytes) like in Glacier.
+
+        The latency, bandwidth and error rate can be set to see how the uploads behave
+        on a slow or unreliable connection.
+
+        Args:
+            vaults (tuple, optional): Names of the vaults that exist. Defaults to ("local_vault",).
+            latency (float, optional): Seconds added to each request. Defaults to 0.
+            bandwidth (int, optional): Bytes per second received in total by all the requests.
+                No limit by default.
+            error_rate (float, optional): Share (0-1) of the requests failing with
+                ServiceUnavailableException. Defaults to 0.
+            throttle_rate (float, optional): Share (0-1) of the requests failing with
+                ThrottlingException. Defaults to 0.
+            keep_data (bool, optional): Keep the uploaded data in memory. Only the hashes are
+                kept otherwise (e.g. when benchmarking large uploads). Defaults to True.
+            seed (int, optional): Seed for the injected errors.
+            job_delay (float, optional): Seconds until a retrieval job is completed. Defaults to 0.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.keep_data = keep_data
+        self.job_delay = job_delay
+        self.region_name = "us-east-1"
+        self.vaults = {name: self._new_vault(name) for name in vaults}
+        self.uploads = dict()
+        self.jobs = dict()
+        self.request_count = 0
+        self.failed_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._link_lock = threading.Lock()
+        self._link_free_at = 0.0
+
+    def attach(self, client):
+        """Makes the client send its requests to the local Glacier.
+
+        Args:
+            client (botocore.client.BaseClient): A Glacier client.
+
+        Returns:
+            botocore.client.BaseClient: The same client.
+        """
+        self.region_name = client.meta.region_name
+        client.meta.events.register("before-send.glacier", self._handle, unique_id=f"local-glacier-{id(self)}")
+        return client
+
+    def create_vault(self, vault_name):
+        with self._lock:
+            self.vaults.setdefault(vault_name, self._new_vault(vault_name))
+
+    def archive(self, vault_name, archive_id):
+        """The stored archive (dict with the size, checksum, description and data)."""
+        return self.vaults[vault_name]["archives"][archive_id]
+
+    def answer(self, operation, request):
+        """Answers a request to the operation (e.g. UploadMultipartPart).
+
+        Args:
+            operation (str): Name of the operation.
+            request: The request with the url, headers and body (e.g. an AWSRequest).
+
+        Returns:
+            botocore.awsrequest.AWSResponse: The response.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.request_count += 1
+            draw = self._random.random()
+        if draw < self.error_rate:
+            return self._fail(request, 503, "ServiceUnavailableException", "Injected error.")
+        if draw < self.error_rate + self.throttle_rate:
+            return self._fail(request, 400, "ThrottlingException", "Injected throttling.")
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None:
+            raise NotImplementedError(f"{operation} is not supported by the local Glacier.")
+        url = urlsplit(request.url)
+        segments = [unquote(segment) for segment in url.path.split("/")]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            return handler(request, segments, query)
+        except GlacierError as error:
+            return self._fail(request, error.status_code, error.code, error.message)
+
+    def _handle(self, request, event_name, **kwargs):
+        """Answers a request of the client (before-send event)."""
+        return self.answer(event_name.split(".")[-1], request)
+
+    def _op_ListVaults(self, request, segments, query):
+        with self._lock:
+            vault_list = [self._describe(vault) for vault in self.vaults.values()]
+        return self._respond(request, 200, body={"VaultList": vault_list})
+
+    def _op_DescribeVault(self, request, segments, query):
+        vault = self._vault(segments[3])
+        with self._lock:
+            description = self._describe(vault)
+        return self._respond(request, 200, body=description)
+
+    def _op_UploadArchive(self, request, segments, query):
+        vault = self._vault(segments[3])
+        received = self._receive(request)
+        self._check_body(request, received)
+        archive_id = uuid.uuid4().hex
+        archive = {
+            "size": received.get("length"),
+            "checksum": received.get("checksum"),
+            "description": self._header(request, "x-amz-archive-description", ""),
+            "data": received.get("data"),
+            "created": self._now(),
+        }
+        with self._lock:
+            vault["archives"].update({archive_id: archive})
+        return self._respond(request, 201, headers=self._archive_headers(vault, archive_id, archive))
+
+    def _op_InitiateMultipartUpload(self, request, segments, query):
+        vault = self._vault(segments[3])
+        part_size = int(self._header(request, "x-amz-part-size", 0))
+        if part_size < 1048576 or part_size & (part_size - 1) or part_size > 4294967296:
+            raise GlacierError(400, "InvalidParameterValueException", f"Invalid part size: {part_size}")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads.update({upload_id: {
+                "vault_name": vault.get("VaultName"),
+                "description": self._header(request, "x-amz-archive-description", ""),
+                "part_size": part_size,
+                "parts": dict(),
+                "created": self._now(),
+            }})
+        location = f"/{ACCOUNT_ID}/vaults/{vault.get('VaultName')}/multipart-uploads/{upload_id}"
+        return self._respond(request, 201, headers={"Location": location, "x-amz-multipart-upload-id": upload_id})
+
+    def _op_UploadMultipartPart(self, request, segments, query):
+        upload = self._upload(segments[3], segments[5])
+        range_start, range_end = self._parse_range(self._header(request, "Content-Range", ""))
+        part_size = upload.get("part_size")
+        if range_start % part_size or range_end - range_start + 1 > part_size:
+            raise GlacierError(
+                400, "InvalidParameterValueException", f"Range {range_start}-{range_end} doesn't match the part size."
+            )
+        received = self._receive(request)
+        if received.get("length") != range_end - range_start + 1:
+            raise GlacierError(400, "InvalidParameterValueException", "Content-Range doesn't match the body length.")
+        self._check_body(request, received)
+        received.update({"range_start": range_start, "range_end": range_end})
+        with self._lock:
+            upload["parts"].update({range_start: received})
+        return self._respond(request, 204, headers={"x-amz-sha256-tree-hash": received.get("checksum")})
+
+    def _op_ListParts(self, request, segments, query):
+        upload = self._upload(segments[3], segments[5])
+        limit = int(query.get("limit", LIST_PARTS_LIMIT))
+        marker = int(query.get("marker", 0))
+        with self._lock:
+            starts = sorted(start for start in upload["parts"] if start >= marker)
+            listed = [(start, upload["parts"][start]) for start in starts[:limit]]
+        body = {
+            "ArchiveDescription": upload.get("description"),
+            "CreationDate": upload.get("created"),
+            "MultipartUploadId": segments[5],
+            "PartSizeInBytes": upload.get("part_size"),
+            "VaultARN": self._arn(upload.get("vault_name")),
+            "Parts": [
+                {"RangeInBytes": f"{start}-{part.get('range_end')}", "SHA256TreeHash": part.get("checksum")}
+                for start, part in listed
+            ],
+            "Marker": str(starts[limit]) if len(starts) > limit else None,
+        }
+        return self._respond(request, 200, body=body)
+
+    def _op_CompleteMultipartUpload(self, request, segments, query):
+        vault = self._vault(segments[3])
+        upload = self._upload(segments[3], segments[5])
+        archive_size = int(self._header(request, "x-amz-archive-size", -1))
+        with self._lock:
+            parts = [upload["parts"][start] for start in sorted(upload["parts"])]
+        position = 0
+        for part in parts:
+            if part.get("range_start") != position:
+                raise GlacierError(400, "InvalidParameterValueException", f"Part at {position} is missing.")
+            if part.get("length") != upload.get("part_size") and part is not parts[-1]:
+                raise GlacierError(400, "InvalidParameterValueException", f"Part at {position} is incomplete.")
+            position = part.get("range_end") + 1
+        if not parts or position != archive_size:
+            raise GlacierError(
+                400, "InvalidParameterValueException", f"The parts don't add up to {archive_size} bytes."
+            )
+        checksum = tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")])
+        if checksum != self._header(request, "x-amz-sha256-tree-hash"):
+            raise GlacierError(400, "InvalidParameterValueException", "The tree hash of the archive doesn't match.")
+        archive_id = uuid.uuid4().hex
+        archive = {
+            "size": archive_size,
+            "checksum": checksum,
+            "description": upload.get("description"),
+            "data": b"".join(part.get("data") for part in parts) if self.keep_data else None,
+            "created": self._now(),
+        }
+        with self._lock:
+            vault["archives"].update({archive_id: archive})
+            self.uploads.pop(segments[5], None)
+        return self._respond(request, 201, headers=self._archive_headers(vault, archive_id, archive))
+
+    def _op_AbortMultipartUpload(self, request, segments, query):
+        self._upload(segments[3], segments[5])
+        with self._lock:
+            self.uploads.pop(segments[5], None)
+        return self._respond(request, 204)
+
+    def _op_InitiateJob(self, request, segments, query):
+        vault = self._vault(segments[3])
+        parameters = json.loads(request.body or b"{}")
+        if parameters.get("Type") != "archive-retrieval":
+            raise GlacierError(400, "InvalidParameterValueException", "Only archive-retrieval jobs are supported.")
+        archive_id = parameters.get("ArchiveId")
+        with self._lock:
+            archive = vault["archives"].get(archive_id)
+        if archive is None:
+            raise GlacierError(404, "ResourceNotFoundException", f"Archive not found: {archive_id}")
+        if archive.get("data") is None:
+            raise GlacierError(400, "InvalidParameterValueException", "The data of the archive wasn't kept.")
+        byte_range = parameters.get("RetrievalByteRange")
+        if byte_range:
+            start, end = self._parse_range(f"bytes {byte_range}")
+            if start % LEAF_SIZE or (end + 1) % LEAF_SIZE and end + 1 != archive.get("size"):
+                raise GlacierError(400, "InvalidParameterValueException", f"Range {byte_range} isn't aligned.")
+        else:
+            start, end = 0, archive.get("size") - 1
+        job_id = uuid.uuid4().hex
+        data = archive.get("data")[start:end + 1]
+        job = {
+            "JobId": job_id,
+            "JobDescription": parameters.get("Description"),
+            "Action": "ArchiveRetrieval",
+            "ArchiveId": archive_id,
+            "VaultARN": self._arn(vault.get("VaultName")),
+            "CreationDate": self._now(),
+            "ArchiveSizeInBytes": archive.get("size"),
+            "ArchiveSHA256TreeHash": archive.get("checksum"),
+            "SHA256TreeHash": tree_hash(self._leaf_hashes(data)),
+            "RetrievalByteRange": f"{start}-{end}",
+            "Tier": parameters.get("Tier", "Standard"),
+            "data": data,
+            "completes_at": time.monotonic() + self.job_delay,
+        }
+        with self._lock:
+            self.jobs.update({job_id: job})
+        location = f"/{ACCOUNT_ID}/vaults/{vault.get('VaultName')}/jobs/{job_id}"
+        return self._respond(request, 202, headers={"Location": location, "x-amz-job-id": job_id})
+
+    def _op_DescribeJob(self, request, segments, query):
+        return self._respond(request, 200, body=self._describe_job(self._job(segments[3], segments[5])))
+
+    def _op_ListJobs(self, request, segments, query):
+        vault = self._vault(segments[3])
+        limit = int(query.get("limit", LIST_JOBS_LIMIT))
+        arn = self._arn(vault.get("VaultName"))
+        with self._lock:
+            jobs = [self._describe_job(job) for job in self.jobs.values() if job.get("VaultARN") == arn]
+        if "completed" in query:
+            jobs = [job for job in jobs if str(job.get("Completed")).lower() == query.get("completed")]
+        job_ids = [job.get("JobId") for job in jobs]
+        start = job_ids.index(query.get("marker")) if query.get("marker") in job_ids else 0
+        listed = jobs[start:start + limit]
+        marker = job_ids[start + limit] if len(job_ids) > start + limit else None
+        return self._respond(request, 200, body={"JobList": listed, "Marker": marker})
+
+    def _op_GetJobOutput(self, request, segments, query):
+        job = self._job(segments[3], segments[5])
+        if not self._describe_job(job).get("Completed"):
+            raise GlacierError(400, "InvalidParameterValueException", f"Job {job.get('JobId')} isn't completed.")
+        data = job.get("data")
+        range_header = self._header(request, "Range")
+        if range_header:
+            start, end = self._parse_range(range_header.replace("=", " ", 1))
+            end = min(end, len(data) - 1)
+        else:
+            start, end = 0, len(data) - 1
+        content = data[start:end + 1]
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(len(content)),
+            "Accept-Ranges": "bytes",
+            "x-amzn-RequestId": uuid.uuid4().hex,
+        }
+        if range_header:
+            headers.update({"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+        if start % LEAF_SIZE == 0 and ((end + 1) % LEAF_SIZE == 0 or end + 1 == len(data)):
+            headers.update({"x-amz-sha256-tree-hash": tree_hash(self._leaf_hashes(content))})
+        status_code = 206 if range_header else 200
+        return AWSResponse(request.url, status_code, headers, ResponseBody(content, on_read=self._wait_for_link))
+
+    def _job(self, vault_name, job_id):
+        self._vault(vault_name)
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.get("VaultARN") != self._arn(vault_name):
+            raise GlacierError(404, "ResourceNotFoundException", f"Job not found: {job_id}")
+        return job
+
+    def _describe_job(self, job):
+        completed = time.monotonic() >= job.get("completes_at")
+        description = {key: value for key, value in job.items() if key not in ("data", "completes_at")}
+        description.update({
+            "Completed": completed,
+            "StatusCode": "Succeeded" if completed else "InProgress",
+            "CompletionDate": self._now() if completed else None,
+        })
+        return description
+
+    def _leaf_hashes(self, data):
+        leaves = [hashlib.sha256(data[start:start + LEAF_SIZE]).digest() for start in range(0, len(data), LEAF_SIZE)]
+        return leaves or [hashlib.sha256(b"").digest()]
+
+    def _receive(self, request):
+        """Reads the body of the request in chunks (within the bandwidth limit) and hashes
+        it on the way.
+
+        Returns:
+            dict: Length, tree hash leaves, tree hash, linear SHA-256 and the data (if kept).
+        """
+        leaves = []
+        linear = hashlib.sha256()
+        leaf = hashlib.sha256()
+        leaf_fill = 0
+        length = 0
+        data = bytearray() if self.keep_data else None
+        for chunk in self._chunks(request.body):
+            self._wait_for_link(len(chunk))
+            linear.update(chunk)
+            length += len(chunk)
+            if data is not None:
+                data += chunk
+            view = memoryview(chunk)
+            while view:
+                piece = view[:LEAF_SIZE - leaf_fill]
+                leaf.update(piece)
+                leaf_fill += len(piece)
+                view = view[len(piece):]
+                if leaf_fill == LEAF_SIZE:
+                    leaves.append(leaf.digest())
+                    leaf = hashlib.sha256()
+                    leaf_fill = 0
+        if leaf_fill or not leaves:
+            leaves.append(leaf.digest())
+        return {
+            "length": length,
+            "leaf_hashes": leaves,
+            "checksum": tree_hash(leaves),
+            "content_sha256": linear.hexdigest(),
+            "data": bytes(data) if data is not None else None,
+        }
+
+    def _chunks(self, body):
+        if body is None:
+            return
+        if isinstance(body, (bytes, bytearray)):
+            for i in range(0, len(body), CHUNK_SIZE):
+                yield body[i:i + CHUNK_SIZE]
+            return
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+            yield chunk
+
+    def _wait_for_link(self, amount):
+        """Shares the bandwidth between the requests received at the same time."""
+        if not self.bandwidth:
+            return
+        with self._link_lock:
+            start = max(time.monotonic(), self._link_free_at)
+            self._link_free_at = start + amount / self.bandwidth
+            free_at = self._link_free_at
+        time.sleep(max(free_at - time.monotonic(), 0))
+
+    def _check_body(self, request, received):
+        if self._header(request, "x-amz-sha256-tree-hash") != received.get("checksum"):
+            raise GlacierError(400, "InvalidParameterValueException", "The tree hash of the body doesn't match.")
+        content_sha256 = self._header(request, "x-amz-content-sha256")
+        if content_sha256 not in (None, "UNSIGNED-PAYLOAD", received.get("content_sha256")):
+            raise GlacierError(400, "InvalidParameterValueException", "The SHA-256 of the body doesn't match.")
+
+    def _header(self, request, name, default=None):
+        """Header of the request as a string (the client can set them as bytes too)."""
+        value = request.headers.get(name, default)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _parse_range(self, content_range):
+        try:
+            unit, byte_range = content_range.split(" ")
+            range_start, range_end = [int(value) for value in byte_range.split("/")[0].split("-")]
+        except ValueError:
+            raise GlacierError(400, "InvalidParameterValueException", f"Invalid Content-Range: '{content_range}'")
+        if unit != "bytes" or range_end < range_start:
+            raise GlacierError(400, "InvalidParameterValueException", f"Invalid Content-Range: '{content_range}'")
+        return range_start, range_end
+
+    def _vault(self, vault_name):
+        with self._lock:
+            vault = self.vaults.get(vault_name)
+        if vault is None:
+            raise GlacierError(404, "ResourceNotFoundException", f"Vault not found: {vault_name}")
+        return vault
+
+    def _upload(self, vault_name, upload_id):
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None or upload.get("vault_name") != vault_name:
+            raise GlacierError(404, "ResourceNotFoundException", f"Multipart upload not found: {upload_id}")
+        return upload
+
+    def _new_vault(self, vault_name):
+        return {"VaultName": vault_name, "CreationDate": self._now(), "archives": dict()}
+
+    def _describe(self, vault):
+        archives = list(vault["archives"].values())
+        return {
+            "VaultARN": self._arn(vault.get("VaultName")),
+            "VaultName": vault.get("VaultName"),
+            "CreationDate": vault.get("CreationDate"),
+            "NumberOfArchives": len(archives),
+            "SizeInBytes": sum(archive.get("size") for archive in archives),
+        }
+
+    def _arn(self, vault_name):
+        return f"arn:aws:glacier:{self.region_name}:{ACCOUNT_ID}:vaults/{vault_name}"
+
+    def _archive_headers(self, vault, archive_id, archive):
+        return {
+            "Location": f"/{ACCOUNT_ID}/vaults/{vault.get('VaultName')}/archives/{archive_id}",
+            "x-amz-archive-id": archive_id,
+            "x-amz-sha256-tree-hash": archive.get("checksum"),
+        }
+
+    def _fail(self, request, status_code, code, message):
+        with self._lock:
+            self.failed_count += 1
+        # The body of a rejected request is not read, a real server would close the connection.
+        return self._respond(request, status_code, body={"code": code, "message": message, "type": "Client"})
+
+    def _respond(self, request, status_code, headers=None, body=None):
+        headers = dict(headers or {})
+        headers.update({"x-amzn-RequestId": uuid.uuid4().hex})
+        content = b""
+        if body is not None:
+            content = json.dumps(body).encode()
+            headers.update({"Content-Type": "application/json"})
+        headers.update({"Content-Length": str(len(content))})
+        return AWSResponse(request.url, status_code, headers, ResponseBody(content))
+
+    def _now(self):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class GlacierError(Exception):
+    def __init__(self, status_code, code, message):
+        """Error answered to the client by the local Glacier."""
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+class LocalGlacierHandler(BaseHTTPRequestHandler):
+    """Passes the HTTP requests on to the local Glacier of the server."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._answer()
+
+    do_PUT = do_POST = do_DELETE = do_GET
+
+    def _answer(self):
+        url = urlsplit(self.path)
+        segments = url.path.strip("/").split("/")[1:]
+        route = "/".join(segment if index % 2 == 0 else "*" for index, segment in enumerate(segments))
+        length = int(self.headers.get("Content-Length") or 0)
+        request = SimpleNamespace(
+            url=f"{self.server.endpoint_url}{self.path}",
+            headers=self.headers,
+            body=self.rfile.read(length) if length else b"",
+        )
+        operation = ROUTES.get((self.command, route))
+        if operation is None:
+            response = self.server.glacier._fail(
+                request, 404, "UnknownOperationException", f"No operation at {url.path}"
+            )
+        else:
+            response = self.server.glacier.answer(operation, request)
+        content = response.raw.read()
+        self.send_response(response.status_code)
+        for name, value in response.headers.items():
+            if name.lower() != "content-length":
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Local Glacier: {format % args}")
+
+
+class LocalGlacierServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, glacier, address=("127.0.0.1", 0)):
+        """Serves the local Glacier over HTTP, so that clients in several processes (e.g.
+        the workers of a distributed upload) can upload to the same one. A client is
+        pointed to it with the endpoint_url (any credentials will do). Serve with
+        serve_forever (e.g. in a thread).
+
+        Args:
+            glacier (LocalGlacier): The local Glacier.
+            address (tuple, optional): Host and port to listen on. Defaults to a free port
+                on 127.0.0.1.
+        """
+        super().__init__(address, LocalGlacierHandler)
+        self.glacier = glacier
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def local_client(glacier, region_name="us-east-1", workers=1):
+    """A Glacier client that sends its requests to the given local Glacier. Can be given
+    to the GlacierLib in place of the default client.
+
+    Args:
+        glacier (LocalGlacier): The local Glacier.
+        region_name (str, optional): Region of the client. Defaults to "us-east-1".
+        workers (int, optional): Amount of parallel uploads (sizes the connection pool). Defaults to 1.
+
+    Returns:
+        botocore.client.BaseClient: The client.
+    """
+    client = create_client(region_name, workers, aws_access_key_id="local", aws_secret_access_key="local")
+    return glacier.attach(client)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m glacier_upload.libraries.local_glacier",
+        description="serve a local stand-in for glacier over http (use with --endpoint-url)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="host to listen on. defaults to 127.0.0.1")
+    parser.add_argument("--port", default=8000, type=int, help="port to listen on. defaults to 8000")
+    parser.add_argument("--vault", action="append", help="name of a vault that exists. defaults to local_vault")
+    parser.add_argument("--latency", default=0.0, type=float, help="seconds added to each request")
+    parser.add_argument("--bandwidth", type=float, help="megabytes per second received by all the requests")
+    parser.add_argument("--error-rate", dest="error_rate", default=0.0, type=float, help="share of failing requests")
+    args = parser.parse_args()
+    glacier = LocalGlacier(
+        vaults=tuple(args.vault or ["local_vault"]),
+        latency=args.latency,
+        bandwidth=args.bandwidth * 1048576 if args.bandwidth else None,
+        error_rate=args.error_rate,
+    )
+    with LocalGlacierServer(glacier, (args.host, args.port)) as server:
+        logger.info(f"Local Glacier listening on {server.endpoint_url}.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
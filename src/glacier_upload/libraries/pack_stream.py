@@ -0,0 +1,127 @@
+import hashlib
+import io
+import tarfile
+from pathlib import Path
+from .setup_logger import logger
+from .tree_hash import LEAF_SIZE, tree_hash
+
+
+def member_name(path_to_file):
+    """Name of the file in the pack: the absolute path without the leading slash (as tar
+    does it).
+    """
+    return Path(path_to_file).resolve().as_posix().lstrip("/")
+
+
+def group_files(paths, sizes, pack_size):
+    """Groups the files into packs of at most the given size in bytes (each pack has at
+    least one file).
+
+    Args:
+        paths (list): Paths to the files.
+        sizes (dict): Sizes of the files by the path.
+        pack_size (int): Target size of a pack in bytes.
+
+    Returns:
+        list: The packs as lists of paths.
+    """
+    packs = []
+    current = []
+    current_size = 0
+    for path_to_file in paths:
+        size = sizes.get(path_to_file)
+        if current and current_size + size > pack_size:
+            packs.append(current)
+            current = []
+            current_size = 0
+        current.append(path_to_file)
+        current_size += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+class PackStream(io.RawIOBase):
+    def __init__(self, paths):
+        """Read-only stream of a tar archive (pax format) of the given files, generated
+        as it is read so that the pack never needs to be written to the disk. The layout
+        is known before reading: the offset and length of the data of each member are in
+        members, so a single member can later be fetched with a ranged retrieval. The
+        SHA-256 and the tree hash of each member are added to it while the data is read.
+
+        A file that has shrunk since the pack was laid out is padded with zeros and
+        marked with an error (its offset and length in the pack are still valid).
+
+        Args:
+            paths (list): Paths to the packed files.
+        """
+        self.logger = logger
+        self.members = []
+        offset = 0
+        for path_to_file in paths:
+            stat = Path(path_to_file).stat()
+            info = tarfile.TarInfo(member_name(path_to_file))
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = stat.st_mode & 0o7777
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+            self.members.append({
+                "path_to_file": path_to_file,
+                "member_name": info.name,
+                "header": header,
+                "offset": offset + len(header),
+                "length": info.size,
+            })
+            offset += len(header) + self._padded(info.size)
+        offset += 2 * tarfile.BLOCKSIZE
+        self.size = offset + (-offset % tarfile.RECORDSIZE)
+        self._chunks = self._generate()
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def _generate(self):
+        written = 0
+        for member in self.members:
+            header = member.pop("header")
+            yield header
+            yield from self._member_data(member)
+            padding = self._padded(member.get("length")) - member.get("length")
+            yield bytes(padding)
+            written += len(header) + member.get("length") + padding
+        yield bytes(self.size - written)
+
+    def _member_data(self, member):
+        linear = hashlib.sha256()
+        leaves = []
+        remaining = member.get("length")
+        with open(member.get("path_to_file"), "rb") as file_object:
+            while remaining:
+                chunk = file_object.read(min(LEAF_SIZE, remaining))
+                if not chunk:
+                    self.logger.error(f"{member.get('path_to_file')} changed while packing.")
+                    member.update({"error": "changed while packing"})
+                    chunk = bytes(min(LEAF_SIZE, remaining))
+                remaining -= len(chunk)
+                linear.update(chunk)
+                leaves.append(hashlib.sha256(chunk).digest())
+                yield chunk
+        member.update({
+            "sha256": linear.hexdigest(),
+            "checksum": tree_hash(leaves or [hashlib.sha256(b"").digest()]),
+        })
+
+    def _padded(self, size):
+        return size + (-size % tarfile.BLOCKSIZE)
@@ -0,0 +1,274 @@
+import io
+import mmap
+import os
+import queue
+import threading
+
+
+class PartView(io.RawIOBase):
+    def __init__(self, buffer, start, length):
+        """Read-only file-like view to a range of a buffer (e.g. a memory mapped file).
+        Used as the body of the upload calls so that a part never needs to be copied
+        into a separate bytes object. The client reads the part in small chunks while
+        sending it and can seek back to the start if the request is sent again.
+        If a rate limiter is set, each read waits for its turn in the limiter.
+
+        Args:
+            buffer (mmap.mmap): Buffer the view points to.
+            start (int): Offset of the first byte of the view.
+            length (int): Length of the view in bytes.
+        """
+        self._view = memoryview(buffer)[start:start + length]
+        self._position = 0
+        self.content_sha256 = None
+        self.rate_limiter = None
+
+    def __len__(self):
+        return len(self._view)
+
+    @property
+    def data(self):
+        """The whole range as a memoryview (e.g. for hashing)."""
+        return self._view
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        else:
+            position = len(self._view) + offset
+        self._position = min(max(position, 0), len(self._view))
+        return self._position
+
+    def readinto(self, buffer):
+        chunk = self._view[self._position:self._position + len(buffer)]
+        self._limit_rate(len(chunk))
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._view) - self._position
+        chunk = self._view[self._position:self._position + size]
+        self._limit_rate(len(chunk))
+        self._position += len(chunk)
+        return bytes(chunk)
+
+    def clone(self):
+        """Another view to the same range with its own position, e.g. for sending the
+        part to several places at once. The hash of the content is carried over.
+        """
+        view = PartView(self._view, 0, len(self._view))
+        view.content_sha256 = self.content_sha256
+        return view
+
+    def _limit_rate(self, amount):
+        if self.rate_limiter is not None and amount:
+            self.rate_limiter.consume(amount)
+
+    def close(self):
+        """Releases the view so that the underlying buffer can be closed."""
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class MappedFile:
+    def __init__(self, path_to_file, drop_cache=False):
+        """Memory maps the file for reading. The parts are served as PartViews from
+        the mapping so the data is read straight from the page cache. The file is
+        read sequentially (the kernel is told so it reads further ahead) and the
+        coming parts can be read into the page cache in the background with
+        read_ahead(). Pages of the parts that are done can be dropped from memory
+        with release(). An empty file can't be mapped and is served as empty views.
+
+        Args:
+            path_to_file (str): Path to the file.
+            drop_cache (bool, optional): Also drop the released pages from the page cache,
+                so that reading a large file doesn't push the cached data of other
+                programs (e.g. databases) out of memory. Defaults to False.
+        """
+        self.path_to_file = path_to_file
+        self.drop_cache = drop_cache
+        self._file_object = None
+        self._mapped = None
+
+    def __enter__(self):
+        self._file_object = open(self.path_to_file, "rb")
+        if os.fstat(self._file_object.fileno()).st_size:
+            self._mapped = mmap.mmap(self._file_object.fileno(), 0, access=mmap.ACCESS_READ)
+            self._advise(0, 0, "POSIX_FADV_SEQUENTIAL")
+            if hasattr(self._mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._mapped.madvise(mmap.MADV_SEQUENTIAL)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._mapped is not None:
+            self._mapped.close()
+        self._file_object.close()
+
+    def part_view(self, start, length):
+        """File-like view to the given byte range of the file."""
+        return PartView(self._mapped if self._mapped is not None else b"", start, length)
+
+    def read_ahead(self, start, length):
+        """Asks the kernel to read the given range (clipped to the file) into the page
+        cache in the background, e.g. the next parts while this one is being sent, so
+        the disk and the network are busy at the same time. Returns right away.
+        """
+        if self._mapped is None:
+            return
+        length = min(length, len(self._mapped) - start)
+        if length > 0:
+            self._advise(start, length, "POSIX_FADV_WILLNEED")
+
+    def release(self, start, length):
+        """Tells the kernel that the given (page aligned) range is not needed anymore
+        so it doesn't keep adding up to the memory usage of the process (nor of the
+        page cache with drop_cache).
+        """
+        if self._mapped is not None and hasattr(self._mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+            self._mapped.madvise(mmap.MADV_DONTNEED, start, length)
+        if self._mapped is not None and self.drop_cache:
+            self._advise(start, length, "POSIX_FADV_DONTNEED")
+
+    def _advise(self, start, length, advice):
+        """posix_fadvise for the file where it's available (not e.g. on macOS)."""
+        if hasattr(os, "posix_fadvise") and hasattr(os, advice):
+            os.posix_fadvise(self._file_object.fileno(), start, length, getattr(os, advice))
+
+
+class MemoryBudget:
+    def __init__(self, limit=None):
+        """Limits the amount of bytes held by the in-flight parts. Acquiring blocks
+        until enough of the budget has been released by the finished parts. An amount
+        larger than the whole limit is let through when nothing else is in use.
+
+        Args:
+            limit (int, optional): The limit in bytes. No limit if not given.
+        """
+        self.limit = limit
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, amount):
+        with self._condition:
+            if self.limit:
+                self._condition.wait_for(lambda: self.in_use == 0 or self.in_use + amount <= self.limit)
+            self.in_use += amount
+
+    def try_acquire(self, amount):
+        """Acquires the amount only if it fits in the budget right away.
+
+        Returns:
+            bool: True if the amount was acquired.
+        """
+        with self._condition:
+            if self.limit and self.in_use and self.in_use + amount > self.limit:
+                return False
+            self.in_use += amount
+            return True
+
+    def release(self, amount):
+        with self._condition:
+            self.in_use -= amount
+            self._condition.notify_all()
+
+
+class BufferPool:
+    def __init__(self, buffer_size, count, budget=None, reserved=0):
+        """A fixed amount of reusable buffers for reading parts from a stream. Getting a
+        buffer blocks until one is returned to the pool, so the memory used by the parts
+        stays at most buffer_size * count.
+
+        With a budget each buffer is charged against it when created and the charge is
+        released when the pool is closed, so the buffers of several streams and the
+        parts of other files stay within one memory limit together. Only the first
+        buffer waits for the budget. Further buffers are created only while they fit
+        in the budget, otherwise a buffer in use is waited for. Other memory held by the
+        reader of the stream (e.g. the window of a CompressStream) can be reserved along
+        with the first buffer.
+
+        Args:
+            buffer_size (int): Size of each buffer in bytes.
+            count (int): Amount of buffers.
+            budget (MemoryBudget, optional): Budget the buffers are charged against.
+            reserved (int, optional): Bytes charged along with the first buffer. Defaults to 0.
+        """
+        self.buffer_size = buffer_size
+        self.count = max(count, 1)
+        self.budget = budget
+        self.reserved = reserved
+        self._created = 0
+        self._buffers = queue.Queue()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self):
+        with self._lock:
+            if self._buffers.empty() and self._created < self.count and self._reserve():
+                self._created += 1
+                return bytearray(self.buffer_size)
+        return self._buffers.get()
+
+    def put(self, buffer):
+        self._buffers.put(buffer)
+
+    def close(self):
+        """Releases the budget of the buffers. Call once all the buffers have been returned."""
+        if self.budget is not None and self._created:
+            self.budget.release(self._created * self.buffer_size + self.reserved)
+        self._created = 0
+        self._buffers = queue.Queue()
+
+    def _reserve(self):
+        if self.budget is None:
+            return True
+        if not self._created:
+            self.budget.acquire(self.buffer_size + self.reserved)
+            return True
+        return self.budget.try_acquire(self.buffer_size)
+
+
+def fill_buffer(stream, buffer):
+    """Reads from the stream until the buffer is full or the stream ends. Reads from
+    pipes can return less than asked before the stream has ended.
+
+    Returns:
+        int: Amount of bytes read. Less than the buffer size only at the end.
+    """
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(view):
+        read_count = stream.readinto(view[filled:])
+        if not read_count:
+            break
+        filled += read_count
+    view.release()
+    return filled
+
+
+def add_content_sha256(params, **kwargs):
+    """Event handler for the client that sets the x-amz-content-sha256 header from an
+    already calculated hash of the body. Botocore would otherwise read the body once
+    more just to hash it.
+    """
+    content_sha256 = getattr(params.get("body"), "content_sha256", None)
+    if content_sha256:
+        params["headers"].setdefault("x-amz-content-sha256", content_sha256)
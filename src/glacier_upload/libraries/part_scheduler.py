@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from .part_reader import MemoryBudget
+
+
+class PartScheduler:
+    def __init__(self, workers=1, max_memory=None, controller=None):
+        """A pool of upload workers shared by all the uploads of a GlacierLib. The parts
+        of every file (and the single chunk uploads) are queued to the same workers so
+        that small files and the parts of large files keep the same workers and
+        connections busy.
+
+        Args:
+            workers (int, optional): Amount of parallel uploads. Defaults to 1.
+            max_memory (int, optional): Upper limit in megabytes for the data held by the
+                queued and in-flight tasks. No limit by default.
+            controller (ConcurrencyController, optional): Adjusts how many of the workers
+                run a task at once. All the workers are used if not given.
+        """
+        self.workers = workers
+        self.controller = controller
+        self.budget = MemoryBudget(max_memory * 1048576 if max_memory else None)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, cost, call, *args):
+        """Queues the call for the workers. Blocks until the cost fits in the memory
+        budget, which is released once the call has finished.
+
+        Args:
+            cost (int): Bytes held in memory by the call (e.g. the part size).
+            call (callable): The task.
+
+        Returns:
+            concurrent.futures.Future: Future of the call.
+        """
+        self.budget.acquire(cost)
+        try:
+            future = self._executor.submit(self._run, call, *args)
+        except Exception:
+            self.budget.release(cost)
+            raise
+        future.add_done_callback(lambda _: self.budget.release(cost))
+        return future
+
+    def _run(self, call, *args):
+        if self.controller is None:
+            return call(*args)
+        self.controller.acquire()
+        try:
+            return call(*args)
+        finally:
+            self.controller.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -1,10 +1,19 @@
 from pathlib import Path
 
+MAX_PARTS = 10000
+AUTO_PARTS_PER_WORKER = 4
+AUTO_MAX_PART_SIZE = 128
+
 
 def get_file_size(path_to_file):
     return Path(path_to_file).stat().st_size
 
 
+def get_file_fingerprint(path_to_file):
+    stat = Path(path_to_file).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+
 def get_allowed_sizes():
     allowed = dict()
     mb = 1
@@ -16,6 +25,49 @@ def get_allowed_sizes():
     return allowed
 
 
+def get_part_count(total_size, part_size_bytes):
+    return -(-total_size // part_size_bytes)
+
+
+def choose_part_size(total_size, workers=1, max_memory=None):
+    """Picks the part size (in megabytes) for the automatic part size. Starts from the
+    smallest allowed size that keeps the part count within the Glacier limit and grows
+    it (up to AUTO_MAX_PART_SIZE) as long as every worker still gets a few parts and the
+    parts of all the workers fit in the memory limit. Larger parts mean less requests
+    and less overhead per uploaded byte.
+
+    If no size can keep within the part limit, the largest allowed size is returned.
+    The preupload checks reject the sizes that don't fit the limits. When the total size
+    isn't known (e.g. a stream), the largest size up to AUTO_MAX_PART_SIZE that fits in
+    the memory limit is picked.
+
+    Args:
+        total_size (int): Size of the file in bytes. None if not known.
+        workers (int, optional): Amount of parallel part uploads. Defaults to 1.
+        max_memory (int, optional): Memory limit in megabytes.
+
+    Returns:
+        int: Part size in megabytes.
+    """
+    allowed = get_allowed_sizes()
+    sizes = sorted(int(size) for size in allowed.keys())
+    if total_size is None:
+        fitting = [size for size in sizes if size <= AUTO_MAX_PART_SIZE]
+        fitting = [size for size in fitting if not max_memory or size * workers <= max_memory] or fitting[:1]
+        return fitting[-1]
+    within_limit = [size for size in sizes if get_part_count(total_size, allowed.get(str(size))) <= MAX_PARTS]
+    if not within_limit:
+        return sizes[-1]
+    chosen = within_limit[0]
+    for size in within_limit[1:]:
+        enough_parts = get_part_count(total_size, allowed.get(str(size))) >= workers * AUTO_PARTS_PER_WORKER
+        fits_memory = not max_memory or size * workers <= max_memory
+        if size > AUTO_MAX_PART_SIZE or not enough_parts or not fits_memory:
+            break
+        chosen = size
+    return chosen
+
+
 def get_needed_parts(path_to_file, part_size_bytes, total_size):
     last_part_size = total_size % part_size_bytes
     amount_of_parts = (total_size - last_part_size) / part_size_bytes
@@ -27,16 +79,41 @@ def get_needed_parts(path_to_file, part_size_bytes, total_size):
     return parts
 
 
+def get_byte_range(start, part_size):
+    end = start + part_size
+    return {
+        "range": f"bytes {start}-{end-1}/*",
+        "range_start": start,
+        "range_end": end - 1,
+    }
+
+
 def add_byte_ranges(parts):
     start = 0
     for part in parts:
-        end = start + part.get("part_size")
-        part.update(
-            {
-                "range": f"bytes {start}-{end-1}/*",
-                "range_start": start,
-                "range_end": end - 1,
-            }
-        )
-        start = end
+        part.update(get_byte_range(start, part.get("part_size")))
+        start += part.get("part_size")
     return parts
+
+
+def split_into_shards(parts, shard_count):
+    """Splits the parts into contiguous runs of about the same amount of parts, one for
+    each shard (e.g. a worker node of a distributed upload). There are less shards than
+    asked for if there are less parts.
+
+    Args:
+        parts (list): Parts with their byte ranges (see add_byte_ranges).
+        shard_count (int): Amount of shards.
+
+    Returns:
+        list: The parts of each shard (lists).
+    """
+    shard_count = max(min(shard_count, len(parts)), 1)
+    size, extra = divmod(len(parts), shard_count)
+    shards = list()
+    start = 0
+    for index in range(shard_count):
+        end = start + size + (1 if index < extra else 0)
+        shards.append(parts[start:end])
+        start = end
+    return [shard for shard in shards if shard]
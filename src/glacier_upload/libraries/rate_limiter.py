@@ -0,0 +1,144 @@
+import re
+import threading
+import time
+from datetime import datetime
+
+RATE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1024,
+    "MB": 1048576,
+    "GB": 1073741824,
+}
+
+
+def parse_rate(value):
+    """Parses a rate like "50MB/s", "512KB" or "1048576" (bytes per second).
+
+    Args:
+        value (str): The rate. "0", "none" or "unlimited" mean no limit.
+
+    Returns:
+        float: Bytes per second or None if not limited.
+
+    Raises:
+        ValueError: If the rate can't be parsed.
+    """
+    text = str(value).strip().upper()
+    if text in ("0", "NONE", "UNLIMITED"):
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?B?)(?:/S)?", text)
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid rate: '{value}'")
+    return float(match.group(1)) * RATE_UNITS[match.group(2)]
+
+
+def parse_schedule(value):
+    """Parses a time of day schedule like "08:00-18:00=10MB/s,18:00-22:00=30MB/s".
+    A window can wrap over midnight (e.g. "22:00-06:00=unlimited").
+
+    Args:
+        value (str): Comma separated windows of start-end=rate (local time).
+
+    Returns:
+        list: Windows as tuples of start (datetime.time), end (datetime.time) and rate.
+
+    Raises:
+        ValueError: If the schedule can't be parsed.
+    """
+    schedule = []
+    for window in [window.strip() for window in value.split(",") if window.strip()]:
+        try:
+            hours, rate = window.split("=")
+            start, end = [datetime.strptime(hour.strip(), "%H:%M").time() for hour in hours.split("-")]
+        except ValueError:
+            raise ValueError(f"Invalid schedule window: '{window}' (use e.g. 08:00-18:00=10MB/s)")
+        schedule.append((start, end, parse_rate(rate)))
+    return schedule
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        """Token bucket shared by all the threads sending data. Each read of a body
+        takes as many tokens as it returns bytes and the tokens are refilled at the
+        rate. A read that doesn't fit in the bucket reserves the tokens in advance and
+        sleeps until they have been refilled, so the readers are served in turns and
+        the traffic stays smooth.
+
+        Args:
+            rate (float): Bytes per second.
+            burst (float, optional): Size of the bucket in bytes. Defaults to a tenth of a
+                second of the rate (at least 64 kilobytes).
+            clock (callable, optional): Source of the time in seconds.
+            sleep (callable, optional): Function used for waiting.
+        """
+        self.rate = rate
+        self._fixed_burst = burst
+        self.burst = burst or max(rate / 10, 65536)
+        self.tokens = self.burst
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = self._fixed_burst or max(rate / 10, 65536)
+            self.tokens = min(self.tokens, self.burst)
+
+    def consume(self, amount):
+        """Takes the amount of tokens, waiting for them if needed."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            self._sleep(wait)
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    def __init__(self, rate=None, schedule=None, now=datetime.now, **bucket_kwargs):
+        """Limits the upload rate of all the workers of a GlacierLib to the given rate
+        or the rate of the current time of day window in the schedule. The rate is used
+        outside of the windows of the schedule.
+
+        Args:
+            rate (float, optional): Bytes per second. No limit if not given.
+            schedule (list, optional): Windows from parse_schedule.
+            now (callable, optional): Returns the current local datetime.
+            **bucket_kwargs: Passed on to the TokenBucket.
+        """
+        self.rate = rate
+        self.schedule = schedule or []
+        self._now = now
+        self._bucket = None
+        self._bucket_kwargs = bucket_kwargs
+        self._lock = threading.Lock()
+
+    def current_rate(self):
+        """The rate in bytes per second at this time of day (None if not limited)."""
+        now = self._now().time()
+        for start, end, rate in self.schedule:
+            if start <= end and start <= now < end or start > end and (now >= start or now < end):
+                return rate
+        return self.rate
+
+    def consume(self, amount):
+        """Called with the amount of bytes read from a body before they are sent."""
+        rate = self.current_rate()
+        if rate is None:
+            return
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = TokenBucket(rate, **self._bucket_kwargs)
+            elif self._bucket.rate != rate:
+                self._bucket.set_rate(rate)
+            bucket = self._bucket
+        bucket.consume(amount)
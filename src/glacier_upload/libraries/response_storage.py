@@ -1,43 +1,460 @@
-import os.path
 import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    archive_id TEXT,
+    checksum TEXT,
+    location TEXT,
+    path_to_file TEXT,
+    vault_name TEXT,
+    size INTEGER,
+    description TEXT,
+    saved_at TEXT,
+    response TEXT,
+    region_name TEXT,
+    codec TEXT,
+    original_size INTEGER,
+    original_checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS archives_archive_id ON archives (archive_id);
+CREATE INDEX IF NOT EXISTS archives_path_to_file ON archives (path_to_file);
+CREATE INDEX IF NOT EXISTS archives_checksum ON archives (checksum);
+CREATE INDEX IF NOT EXISTS archives_original_checksum ON archives (original_checksum);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path_to_file TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    checksum TEXT,
+    saved_at TEXT
+);
+CREATE TABLE IF NOT EXISTS pack_members (
+    id INTEGER PRIMARY KEY,
+    archive_id TEXT,
+    vault_name TEXT,
+    path_to_file TEXT,
+    member_name TEXT,
+    offset INTEGER,
+    length INTEGER,
+    sha256 TEXT,
+    checksum TEXT,
+    saved_at TEXT
+);
+CREATE INDEX IF NOT EXISTS pack_members_archive_id ON pack_members (archive_id);
+CREATE INDEX IF NOT EXISTS pack_members_path_to_file ON pack_members (path_to_file);
+CREATE INDEX IF NOT EXISTS pack_members_checksum ON pack_members (checksum);
+CREATE TABLE IF NOT EXISTS vaults (
+    account_id TEXT,
+    region_name TEXT,
+    vault_name TEXT,
+    vault_arn TEXT,
+    checked_at REAL,
+    PRIMARY KEY (account_id, region_name, vault_name)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    state TEXT,
+    priority INTEGER,
+    vault_name TEXT,
+    region_name TEXT,
+    paths TEXT,
+    options TEXT,
+    result TEXT,
+    submitted_at TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state_priority ON jobs (state, priority);
+CREATE TABLE IF NOT EXISTS migrations (
+    file_name TEXT PRIMARY KEY,
+    migrated_at TEXT
+);
+"""
+
+ARCHIVE_COLUMNS = (
+    "archive_id", "checksum", "location", "path_to_file", "vault_name", "size", "description", "saved_at", "response",
+    "region_name", "codec", "original_size", "original_checksum",
+)
+
+MEMBER_COLUMNS = (
+    "archive_id", "vault_name", "path_to_file", "member_name", "offset", "length", "sha256", "checksum", "saved_at"
+)
 
 
 class Storage:
-    def __init__(self, file_name="uploaded_log.json"):
-        """By default a json file is used to store archive ids and other
-        information related to the uploaded file(s). This can then be used
-        to retrieve the archives later on. A proper database based setup
-        could be used instead.
+    def __init__(self, file_name="uploaded_log.db"):
+        """The archive ids and other information related to the uploaded file(s) are
+        stored in a SQLite catalog. This can then be used to retrieve the archives later
+        on. Each save is a single committed (and synced) insert, so saving doesn't get
+        slower as the catalog grows and an interrupted write can't corrupt the records
+        saved earlier. The archives can be looked up by archive id, file path or tree hash.
+        The tree hashes of the uploaded files are also cached by a cheap fingerprint (size,
+        modification time and inode) of the file so that unchanged files don't need to be
+        hashed again. Small files uploaded in packs (tar archives) are recorded as members
+        of the pack with the offset and length of their data in the pack. The vaults found
+        in Glacier are cached with the time they were checked.
+
+        A log in the earlier JSON format is imported once. If the given file name has
+        the .json suffix, it is taken as such a log and the catalog is created next to
+        it with the .db suffix.
 
         Args:
             file_name (str, optional): Where the data is saved.
-                Defaults to "uploaded.json".
+                Defaults to "uploaded_log.db".
         """
-        self.file_name = file_name
-        self._create_json_file()
+        path = Path(file_name)
+        if path.suffix == ".json":
+            legacy_file = path
+            path = path.with_suffix(".db")
+        else:
+            legacy_file = path.with_suffix(".json")
+        self.file_name = str(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.file_name, timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._create_tables()
+        if legacy_file.is_file():
+            self._migrate_json_file(legacy_file)
 
-    def _create_json_file(self):
-        """Creates a json file structure if a file with the specified
-        name doesn't already exist.
-        """
-        json_file_structure = {
-            "archives": []
-        }
-        if not os.path.exists(self.file_name):
-            self._write_json(json_file_structure)
+    def _create_tables(self):
+        """Creates the tables and indexes if they don't already exist."""
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=FULL")
+            self._connection.executescript(SCHEMA)
+
+    def _migrate_json_file(self, legacy_file):
+        """Imports the responses from a JSON log (unless already imported)."""
+        key = str(legacy_file.resolve())
+        with self._lock:
+            migrated = self._connection.execute("SELECT 1 FROM migrations WHERE file_name = ?", (key,)).fetchone()
+        if migrated:
+            return
+        with open(legacy_file) as file_object:
+            file_content = json.load(file_object)
+        with self._lock, self._connection:
+            for response in file_content.get("archives", []):
+                self._connection.execute(*self._insert_statement(response))
+            self._connection.execute(
+                "INSERT INTO migrations (file_name, migrated_at) VALUES (?, ?)", (key, self._now())
+            )
 
-    def save(self, response):
-        """Writes the given response dict to a json file.
+    def save(self, response, path_to_file=None, vault_name=None, size=None, description=None, region_name=None,
+             codec=None, original_size=None, original_checksum=None):
+        """Saves the given response with the details of the upload.
 
         Args:
             response (dict): Response received from AWS.
+            path_to_file (str, optional): Path to the uploaded file.
+            vault_name (str, optional): Vault the file was uploaded to.
+            size (int, optional): Size of the archive in bytes.
+            description (str, optional): Description of the archive.
+            region_name (str, optional): Region of the vault.
+            codec (str, optional): Codec the archive is compressed with (e.g. gzip).
+            original_size (int, optional): Size of the data before it was compressed.
+            original_checksum (str, optional): Tree hash of the data before it was compressed.
         """
-        with open(self.file_name) as file_object:
-            file_content = json.load(file_object)
-            file_content['archives'].append(response)
-        self._write_json(file_content)
+        statement = self._insert_statement(
+            response, path_to_file, vault_name, size, description, region_name, codec, original_size, original_checksum
+        )
+        with self._lock, self._connection:
+            self._connection.execute(*statement)
+
+    def archives(self):
+        """All the saved archives in the order they were saved."""
+        return self._select("SELECT * FROM archives ORDER BY id", ())
+
+    def find_by_archive_id(self, archive_id):
+        return self._select("SELECT * FROM archives WHERE archive_id = ? ORDER BY id", (archive_id,))
+
+    def find_by_path(self, path_to_file):
+        path_to_file = str(Path(path_to_file).resolve())
+        return self._select("SELECT * FROM archives WHERE path_to_file = ? ORDER BY id", (path_to_file,))
+
+    def find_by_checksum(self, checksum, vault_name=None, size=None):
+        """Archives with the given tree hash, optionally only in the given vault and with
+        the given size.
+        """
+        query = "SELECT * FROM archives WHERE checksum = ?"
+        args = [checksum]
+        if vault_name is not None:
+            query += " AND vault_name = ?"
+            args.append(vault_name)
+        if size is not None:
+            query += " AND size = ?"
+            args.append(size)
+        return self._select(query + " ORDER BY id", args)
+
+    def find_by_original_checksum(self, checksum, vault_name=None, size=None):
+        """Compressed archives of data with the given tree hash (before compressing),
+        optionally only in the given vault and with the given original size.
+        """
+        query = "SELECT * FROM archives WHERE original_checksum = ?"
+        args = [checksum]
+        if vault_name is not None:
+            query += " AND vault_name = ?"
+            args.append(vault_name)
+        if size is not None:
+            query += " AND original_size = ?"
+            args.append(size)
+        return self._select(query + " ORDER BY id", args)
+
+    def save_pack_members(self, archive_id, vault_name, members):
+        """Saves the members of an uploaded pack.
+
+        Args:
+            archive_id (str): Archive id of the pack.
+            vault_name (str): Vault the pack was uploaded to.
+            members (list): Members (dict) with the path_to_file, member_name, offset and
+                length in the pack and the sha256 and checksum (tree hash) of the data.
+        """
+        saved_at = self._now()
+        rows = [
+            (
+                archive_id,
+                vault_name,
+                str(Path(member.get("path_to_file")).resolve()),
+                member.get("member_name"),
+                member.get("offset"),
+                member.get("length"),
+                member.get("sha256"),
+                member.get("checksum"),
+                saved_at,
+            )
+            for member in members
+        ]
+        placeholders = ', '.join('?' * len(MEMBER_COLUMNS))
+        query = f"INSERT INTO pack_members ({', '.join(MEMBER_COLUMNS)}) VALUES ({placeholders})"
+        with self._lock, self._connection:
+            self._connection.executemany(query, rows)
+
+    def pack_members(self, archive_id):
+        """Members of the pack in the order of their data in the pack."""
+        return self._select_members("SELECT * FROM pack_members WHERE archive_id = ? ORDER BY offset", (archive_id,))
+
+    def find_pack_members_by_path(self, path_to_file):
+        path_to_file = str(Path(path_to_file).resolve())
+        return self._select_members("SELECT * FROM pack_members WHERE path_to_file = ? ORDER BY id", (path_to_file,))
+
+    def find_pack_members_by_checksum(self, checksum, vault_name=None, size=None):
+        """Pack members with the given tree hash, optionally only in the given vault and
+        with the given size.
+        """
+        query = "SELECT * FROM pack_members WHERE checksum = ?"
+        args = [checksum]
+        if vault_name is not None:
+            query += " AND vault_name = ?"
+            args.append(vault_name)
+        if size is not None:
+            query += " AND length = ?"
+            args.append(size)
+        return self._select_members(query + " ORDER BY id", args)
+
+    def save_fingerprint(self, path_to_file, fingerprint, checksum):
+        """Caches the tree hash of the file with the given fingerprint.
+
+        Args:
+            path_to_file (str): Path to the file.
+            fingerprint (dict): Size, mtime_ns and inode of the file (see partlify.get_file_fingerprint).
+            checksum (str): Tree hash of the file.
+        """
+        values = (
+            str(Path(path_to_file).resolve()),
+            fingerprint.get("size"),
+            fingerprint.get("mtime_ns"),
+            fingerprint.get("inode"),
+            checksum,
+            self._now(),
+        )
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO fingerprints "
+                "(path_to_file, size, mtime_ns, inode, checksum, saved_at) VALUES (?, ?, ?, ?, ?, ?)",
+                values,
+            )
+
+    def find_checksum_by_fingerprint(self, path_to_file, fingerprint):
+        """The cached tree hash of the file or None if the file has changed (or wasn't
+        cached).
+        """
+        values = (
+            str(Path(path_to_file).resolve()),
+            fingerprint.get("size"),
+            fingerprint.get("mtime_ns"),
+            fingerprint.get("inode"),
+        )
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT checksum FROM fingerprints WHERE path_to_file = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                values,
+            ).fetchone()
+        return row["checksum"] if row else None
+
+    def save_vault(self, account_id, region_name, vault_name, vault_arn=None):
+        """Caches a vault found in Glacier.
+
+        Returns:
+            float: When the vault was checked (seconds since the epoch).
+        """
+        checked_at = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO vaults (account_id, region_name, vault_name, vault_arn, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (account_id, region_name, vault_name, vault_arn, checked_at),
+            )
+        return checked_at
+
+    def find_vault(self, account_id, region_name, vault_name, max_age):
+        """The cached vault or None if it isn't cached or was checked more than max_age
+        seconds ago.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM vaults WHERE account_id = ? AND region_name = ? AND vault_name = ? AND checked_at > ?",
+                (account_id, region_name, vault_name, time.time() - max_age),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_job(self, vault_name, paths, priority=0, region_name=None, options=None):
+        """Queues an upload job (see UploadDaemon).
+
+        Args:
+            vault_name (str): Vault the files are uploaded to.
+            paths (list): Paths to the files.
+            priority (int, optional): Jobs with a higher priority are started first. Defaults to 0.
+            region_name (str, optional): Region of the vault.
+            options (dict, optional): Options of the upload (e.g. multipart and part_size).
+
+        Returns:
+            int: Id of the job.
+        """
+        values = (
+            "queued", priority, vault_name, region_name, json.dumps(paths), json.dumps(options or {}), self._now()
+        )
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (state, priority, vault_name, region_name, paths, options, submitted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+        return cursor.lastrowid
+
+    def claim_job(self):
+        """Marks the queued job with the highest priority (the oldest of those) as running.
+        Safe with several processes using the same catalog.
+
+        Returns:
+            dict: The job or None if no job is queued.
+        """
+        while True:
+            with self._lock, self._connection:
+                row = self._connection.execute(
+                    "SELECT id FROM jobs WHERE state = 'queued' ORDER BY priority DESC, id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = self._connection.execute(
+                    "UPDATE jobs SET state = 'running', started_at = ? WHERE id = ? AND state = 'queued'",
+                    (self._now(), row["id"]),
+                ).rowcount
+            if claimed:
+                return self.find_job(row["id"])
+
+    def finish_job(self, job_id, state, result=None):
+        """Records the end of a job (e.g. done or failed) and its result."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, result = ?, finished_at = ? WHERE id = ?",
+                (state, json.dumps(result), self._now(), job_id),
+            )
+
+    def cancel_job(self, job_id):
+        """Cancels a queued job.
+
+        Returns:
+            bool: False if the job isn't queued (e.g. already running or finished).
+        """
+        with self._lock, self._connection:
+            cancelled = self._connection.execute(
+                "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state = 'queued'",
+                (self._now(), job_id),
+            ).rowcount
+        return bool(cancelled)
+
+    def requeue_running_jobs(self):
+        """Queues the jobs left running (e.g. by a daemon that was stopped) again.
+
+        Returns:
+            int: Amount of jobs queued again.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE jobs SET state = 'queued', started_at = NULL WHERE state = 'running'"
+            ).rowcount
+
+    def find_job(self, job_id):
+        jobs = self._select_jobs("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def jobs(self, state=None):
+        """The jobs (optionally only in the given state) in the order they were submitted."""
+        if state is None:
+            return self._select_jobs("SELECT * FROM jobs ORDER BY id", ())
+        return self._select_jobs("SELECT * FROM jobs WHERE state = ? ORDER BY id", (state,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _select(self, query, args):
+        with self._lock:
+            rows = self._connection.execute(query, args).fetchall()
+        records = [dict(row) for row in rows]
+        for record in records:
+            record.update({"response": json.loads(record.get("response"))})
+        return records
+
+    def _select_jobs(self, query, args):
+        with self._lock:
+            rows = self._connection.execute(query, args).fetchall()
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job.update({key: json.loads(job.get(key) or "null") for key in ("paths", "options", "result")})
+        return jobs
+
+    def _select_members(self, query, args):
+        with self._lock:
+            rows = self._connection.execute(query, args).fetchall()
+        return [dict(row) for row in rows]
+
+    def _insert_statement(self, response, path_to_file=None, vault_name=None, size=None, description=None,
+                          region_name=None, codec=None, original_size=None, original_checksum=None):
+        if path_to_file is not None:
+            path_to_file = str(Path(path_to_file).resolve())
+        values = (
+            response.get("archiveId"),
+            response.get("checksum"),
+            response.get("location"),
+            path_to_file,
+            vault_name,
+            size,
+            description,
+            self._now(),
+            json.dumps(response, default=str),
+            region_name,
+            codec,
+            original_size,
+            original_checksum,
+        )
+        query = f"INSERT INTO archives ({', '.join(ARCHIVE_COLUMNS)}) VALUES ({', '.join('?' * len(values))})"
+        return query, values
 
-    def _write_json(self, data):
-        """Write given json formatted data to the file."""
-        with open(self.file_name, "w") as file_object:
-            json.dump(data, file_object, indent=4)
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
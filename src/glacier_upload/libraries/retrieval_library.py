@@ -0,0 +1,346 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .glacier_library import GlacierLib
+from .compress_stream import CODECS
+from .tree_hash import LEAF_SIZE, tree_hash
+from .upload_journal import Journal
+from .partlify import get_needed_parts, add_byte_ranges
+
+TIERS = ("Expedited", "Standard", "Bulk")
+# Errors raised while reading the body of a response (the connection broke mid-range).
+STREAM_ERRORS = ("IncompleteReadError", "ProtocolError", "ReadTimeoutError", "ConnectionError")
+
+
+class RetrievalLib(GlacierLib):
+    def __init__(self, vault_name, tier="Standard", poll_interval=900.0, **kwargs):
+        """Retrieving archives from Glacier by the archive ids (or the paths of the
+        uploaded files) in the storage. An archive retrieval job is started for each
+        archive and the jobs of all the archives are polled together with one listing of
+        the jobs of the vault. The output of a completed job is downloaded in byte ranges
+        by the shared workers straight into a preallocated file. The tree hash is
+        calculated from the same leaf hashes as the data arrives, so the file doesn't
+        need to be read again, and each tree hash aligned range is checked against the
+        tree hash sent by Glacier.
+
+        The downloaded ranges are recorded in a journal next to the log file. An
+        interrupted retrieval continues from the ranges that are missing when it is run
+        again (with a new job if the old one has expired).
+
+        Args:
+            vault_name (str): Name of the vault in Glacier.
+            tier (str, optional): Retrieval tier (Expedited, Standard or Bulk). Defaults to Standard.
+            poll_interval (float, optional): Seconds between the checks of the jobs. Defaults to 900.
+            **kwargs: Passed on to the GlacierLib (e.g. upload_log, region_name and workers).
+        """
+        super().__init__(vault_name, **kwargs)
+        self.tier = tier
+        self.poll_interval = poll_interval
+
+    def retrieve(self, targets, output_dir=".", part_size=16):
+        """Retrieves the archives to the output directory. A file that was uploaded in a
+        pack is retrieved alone with a ranged job covering its data.
+
+        Args:
+            targets (list): Archive ids or paths of uploaded files.
+            output_dir (str, optional): Where the files are written. Defaults to the current directory.
+            part_size (int, optional): Size of the downloaded ranges in megabytes. Defaults to 16.
+
+        Returns:
+            dict: Whether the retrieval succeeded (bool) by the target.
+        """
+        results = {target: False for target in targets}
+        retrievals = [retrieval for retrieval in map(self._resolve_target, targets) if retrieval]
+        for retrieval in retrievals:
+            retrieval.update({"output": str(Path(output_dir) / retrieval.get("name"))})
+        if not retrievals or not self._vault_exists(self.vault_name):
+            return results
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        pending = dict()
+        for retrieval in retrievals:
+            if Path(retrieval.get("output")).exists():
+                self.logger.error(f"{retrieval.get('output')} already exists. Skipping {retrieval.get('target')}.")
+                continue
+            job_id = self._start_job(retrieval)
+            if job_id:
+                pending.update({job_id: retrieval})
+        with ThreadPoolExecutor(max_workers=self.workers) as file_executor:
+            futures = dict()
+            while pending:
+                statuses = self._list_jobs()
+                if statuses is None:
+                    break
+                for job_id, retrieval in list(pending.items()):
+                    status = statuses.get(job_id)
+                    if status is None:
+                        self.logger.warning(f"Job {job_id} not found (expired?). Starting a new one.")
+                        pending.pop(job_id)
+                        new_job_id = self._start_job(retrieval, restart=True)
+                        if new_job_id:
+                            pending.update({new_job_id: retrieval})
+                    elif status.get("Completed"):
+                        pending.pop(job_id)
+                        if status.get("StatusCode") != "Succeeded":
+                            self.logger.error(f"Job {job_id} failed: {status.get('StatusMessage')}")
+                            continue
+                        futures.update({
+                            retrieval.get("target"): file_executor.submit(self._download, retrieval, status, part_size)
+                        })
+                if pending:
+                    self.logger.info(f"Waiting for {len(pending)} retrieval jobs.")
+                    time.sleep(self.poll_interval)
+            for target, future in futures.items():
+                results[target] = future.result()
+        retrieved_count = len([result for result in results.values() if result])
+        self.logger.info(f"{retrieved_count}/{len(targets)} archives retrieved. {self.retry_count} calls retried.")
+        return results
+
+    def _resolve_target(self, target):
+        """Finds what to retrieve for the target from the storage: the latest archive of
+        the file in this vault or the pack it was uploaded in. Anything else is taken as
+        an archive id (the size and tree hash are then taken from the job).
+
+        Returns:
+            dict: Archive id, output file name, the byte range of the job, the offset of the
+                data in the job output and its size and tree hash (if known).
+        """
+        records = self.storage.find_by_archive_id(target) or self.storage.find_by_path(target)
+        records = [record for record in records if record.get("vault_name") in (None, self.vault_name)]
+        records = [record for record in records if self._in_region(record)]
+        if records:
+            record = records[-1]
+            name = Path(record.get("path_to_file")).name if record.get("path_to_file") else record.get("archive_id")
+            if record.get("codec"):
+                # Written as it was uploaded, e.g. data.log.gz (decompress with gzip -d).
+                name += CODECS.get(record.get("codec"), {}).get("suffix", "")
+            return {
+                "target": target,
+                "archive_id": record.get("archive_id"),
+                "name": name,
+                "job_range": None,
+                "offset": 0,
+                "size": record.get("size"),
+                "checksum": record.get("checksum"),
+            }
+        members = self.storage.find_pack_members_by_path(target)
+        members = [
+            member for member in members
+            if member.get("vault_name") == self.vault_name
+            and self._in_region((self.storage.find_by_archive_id(member.get("archive_id")) or [{}])[-1])
+        ]
+        if members:
+            member = members[-1]
+            # A ranged retrieval has to start and end on a megabyte (or the end of the archive).
+            job_start = member.get("offset") // LEAF_SIZE * LEAF_SIZE
+            job_end = -(-(member.get("offset") + member.get("length")) // LEAF_SIZE) * LEAF_SIZE
+            pack = (self.storage.find_by_archive_id(member.get("archive_id")) or [{}])[-1]
+            if pack.get("size"):
+                job_end = min(job_end, pack.get("size"))
+            return {
+                "target": target,
+                "archive_id": member.get("archive_id"),
+                "name": Path(member.get("path_to_file")).name,
+                "job_range": f"{job_start}-{job_end - 1}",
+                "offset": member.get("offset") - job_start,
+                "size": member.get("length"),
+                "checksum": member.get("checksum"),
+            }
+        if Path(target).exists():
+            self.logger.error(f"No archive of {target} found in the log for the vault {self.vault_name}.")
+            return None
+        return {
+            "target": target,
+            "archive_id": target,
+            "name": target,
+            "job_range": None,
+            "offset": 0,
+            "size": None,
+            "checksum": None,
+        }
+
+    def _in_region(self, record):
+        """Whether the archive is in the region of the client (records saved before the
+        region was stored are taken to be).
+        """
+        return record.get("region_name") in (None, self.client.meta.region_name)
+
+    def _journal(self, retrieval):
+        key = f"retrieve-{retrieval.get('archive_id')}"
+        if retrieval.get("job_range"):
+            key += f"-{retrieval.get('job_range')}"
+        return Journal(self.storage.file_name, key)
+
+    def _start_job(self, retrieval, restart=False):
+        """Starts the retrieval job, or continues with the one in the journal. The ranges
+        downloaded earlier are kept in the journal when a new job is started.
+
+        Returns:
+            str: Id of the job or None if it could not be started.
+        """
+        journal = self._journal(retrieval)
+        details, parts = journal.load() if journal.exists() else (dict(), dict())
+        if details.get("job_id") and not restart:
+            self.logger.info(f"Continuing the retrieval of {retrieval.get('target')} with job {details.get('job_id')}.")
+            return details.get("job_id")
+        job_parameters = {"Type": "archive-retrieval", "ArchiveId": retrieval.get("archive_id"), "Tier": self.tier}
+        if retrieval.get("job_range"):
+            job_parameters.update({"RetrievalByteRange": retrieval.get("job_range")})
+        response = self._execute_call(
+            self.client.initiate_job, {"vaultName": self.vault_name, "jobParameters": job_parameters}
+        )
+        if not self.validator.is_response_ok(response):
+            return None
+        job_id = response.get("jobId")
+        details = {key: value for key, value in retrieval.items() if key != "target"}
+        details.update({"job_id": job_id, "vault_name": self.vault_name})
+        journal.start(details)
+        for part in parts.values():
+            journal.add_part(part)
+        self.logger.info(f"Started retrieval job {job_id} for {retrieval.get('target')} ({self.tier}).")
+        return job_id
+
+    def _list_jobs(self):
+        """Lists the jobs of the vault (all the pages).
+
+        Returns:
+            dict: The jobs by the job id or None if the listing failed.
+        """
+        jobs = dict()
+        kwargs = {"vaultName": self.vault_name}
+        while True:
+            response = self._execute_call(self.client.list_jobs, kwargs)
+            if not self.validator.is_response_ok(response):
+                return None
+            jobs.update({job.get("JobId"): job for job in response.get("JobList")})
+            if not response.get("Marker"):
+                return jobs
+            kwargs.update({"marker": response.get("Marker")})
+
+    def _download(self, retrieval, status, part_size):
+        """Downloads the output of the completed job in ranges to a temporary file next
+        to the output, verifies the tree hash and renames the file to the output.
+        """
+        size = retrieval.get("size")
+        if size is None:
+            size = status.get("ArchiveSizeInBytes")
+        checksum = retrieval.get("checksum") or status.get("ArchiveSHA256TreeHash")
+        journal = self._journal(retrieval)
+        _, done = journal.load()
+        parts = add_byte_ranges(get_needed_parts(None, part_size * 1048576, size))
+        for part in parts:
+            journaled = done.get(part.get("range_start"))
+            if journaled and journaled.get("range_end") == part.get("range_end"):
+                part.update({"leaf_hashes": journaled.get("leaf_hashes"), "success": True})
+        pending = [part for part in parts if not part.get("success")]
+        self.metrics.add_total(sum([part.get("part_size") for part in pending]))
+        self.logger.info(
+            f"Downloading {retrieval.get('target')} ({size} bytes). "
+            f"{len(parts) - len(pending)}/{len(parts)} ranges already downloaded."
+        )
+        temp_path = Path(f"{retrieval.get('output')}.retrieving")
+        file_descriptor = os.open(temp_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._preallocate(file_descriptor, size)
+            futures = [
+                self.scheduler.submit(0, self._download_range, file_descriptor, retrieval, status, part, journal)
+                for part in pending
+            ]
+            if not all([future.result() for future in futures]):
+                self.logger.error(f"Retrieval of {retrieval.get('target')} failed. Run again to continue.")
+                return False
+            os.fsync(file_descriptor)
+        finally:
+            os.close(file_descriptor)
+        leaves = [leaf for part in parts for leaf in part.get("leaf_hashes")] or [hashlib.sha256(b"").digest()]
+        if tree_hash(leaves) != checksum:
+            self.logger.error(
+                f"Tree hash of {retrieval.get('target')} doesn't match {checksum}. The download was discarded, "
+                "run the retrieval again."
+            )
+            journal.remove()
+            temp_path.unlink()
+            return False
+        os.replace(temp_path, retrieval.get("output"))
+        journal.remove()
+        self.logger.info(f"Retrieved {retrieval.get('target')} to {retrieval.get('output')}.")
+        return True
+
+    def _download_range(self, file_descriptor, retrieval, status, part, journal):
+        """Downloads a range of the job output to its place in the file. The range is
+        tried again if the connection breaks mid-range or the data doesn't match the
+        tree hash sent by Glacier.
+        """
+        start = retrieval.get("offset") + part.get("range_start")
+        end = retrieval.get("offset") + part.get("range_end")
+        kwargs = {"vaultName": self.vault_name, "jobId": status.get("JobId"), "range": f"bytes={start}-{end}"}
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            response = self._execute_call(self.client.get_job_output, kwargs, part)
+            if not self.validator.is_response_ok(response):
+                return False
+            started = time.monotonic()
+            try:
+                with self.metrics.phase("network"):
+                    leaves = self._write_body(file_descriptor, response.get("body"), part)
+            except Exception as error:
+                if not self._is_stream_error(error):
+                    raise
+                problem = f"Download of bytes {start}-{end} broke off ({error})."
+            else:
+                # Glacier sends the tree hash only for the ranges aligned to the tree hash.
+                expected = response.get("checksum") if retrieval.get("offset") == 0 else None
+                if expected is None or expected == tree_hash(leaves):
+                    part.update({"leaf_hashes": leaves, "checksum": tree_hash(leaves), "success": True})
+                    journal.add_part(part)
+                    self.metrics.part_done(part.get("part_size"), time.monotonic() - started)
+                    return True
+                problem = f"Tree hash of bytes {start}-{end} doesn't match."
+            if attempt == self.retry_policy.max_attempts:
+                self.logger.error(f"{problem} Giving up after {attempt} attempts.")
+                return False
+            delay = self.retry_policy.delay(attempt)
+            self.logger.warning(f"{problem} Retrying in {delay:.1f} seconds.")
+            self._count_retry(part)
+            with self.metrics.phase("retry_wait"):
+                time.sleep(delay)
+        return False
+
+    def _write_body(self, file_descriptor, body, part):
+        """Writes the body to the range of the part in the file a leaf (megabyte) at a
+        time and returns the leaf hashes.
+        """
+        leaves = []
+        position = part.get("range_start")
+        remaining = part.get("part_size")
+        while remaining:
+            leaf = bytearray()
+            wanted = min(LEAF_SIZE, remaining)
+            while len(leaf) < wanted:
+                chunk = body.read(wanted - len(leaf))
+                if not chunk:
+                    raise ConnectionError(f"{remaining - len(leaf)} bytes missing from the range.")
+                leaf += chunk
+            os.pwrite(file_descriptor, leaf, position)
+            leaves.append(hashlib.sha256(leaf).digest())
+            position += len(leaf)
+            remaining -= len(leaf)
+        body.close()
+        return leaves
+
+    def _is_stream_error(self, error):
+        return self.retry_policy.is_retryable(error) or any(
+            [cls.__name__ in STREAM_ERRORS for cls in type(error).__mro__]
+        )
+
+    def _preallocate(self, file_descriptor, size):
+        """Reserves the space for the file so the ranges can be written in any order
+        without fragmenting it (or failing late on a full disk).
+        """
+        os.ftruncate(file_descriptor, size)
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(file_descriptor, 0, size)
+            except OSError:
+                # Not supported by every file system, the file has the size anyway.
+                pass
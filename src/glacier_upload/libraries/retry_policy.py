@@ -0,0 +1,46 @@
+import random
+
+RETRYABLE_ERRORS = (
+    "RequestTimeoutException",
+    "ServiceUnavailableException",
+    "ThrottlingException",
+    "ConnectionError",
+    "HTTPClientError",
+)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0, retryable=RETRYABLE_ERRORS):
+        """Decides which failed calls are tried again and how long to wait in between.
+        The waiting time grows exponentially with the attempts and is randomized
+        between zero and the current upper limit (full jitter) so that parallel
+        workers don't retry all at once.
+
+        Args:
+            max_attempts (int, optional): Attempts per call including the first one. Defaults to 5.
+            base_delay (float, optional): Upper limit in seconds for the first wait. Defaults to 1.
+            max_delay (float, optional): Upper limit in seconds for any wait. Defaults to 60.
+            retryable (tuple, optional): Names of the retryable exceptions or Glacier error codes.
+        """
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = tuple(retryable)
+
+    def is_retryable(self, error):
+        """Checks if the error (exception raised by the client) is worth retrying.
+
+        Args:
+            error (Exception): The exception raised by the call.
+
+        Returns:
+            bool: True if the exception class (or any parent) or the error code is retryable.
+        """
+        error_code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        if error_code in self.retryable:
+            return True
+        return any([cls.__name__ in self.retryable for cls in type(error).__mro__])
+
+    def delay(self, attempt):
+        """Seconds to wait before the next attempt after the given failed attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
@@ -0,0 +1,113 @@
+import json
+import os
+from pathlib import Path
+
+
+class ShardPlan:
+    def __init__(self, plan_dir, upload_id):
+        """Plan of a multipart upload split into shards that are uploaded by several
+        workers (e.g. on other hosts) and the reports of the workers. The plan and the
+        reports are JSON files in a directory the coordinator and the workers share
+        (e.g. next to the uploaded file on the shared storage):
+
+        - <upload_id>.plan.json: the upload (file, vault, part size, total size) and the
+          byte range of each shard
+        - <upload_id>.shard-<shard>.json: the tree hash leaves of the parts of an
+          uploaded shard
+
+        The files are written to a temporary file and renamed, so a reader never sees
+        a partially written file.
+
+        Args:
+            plan_dir (str): Directory shared by the coordinator and the workers.
+            upload_id (str): Id of the multipart upload received from Glacier.
+        """
+        self.plan_dir = Path(plan_dir)
+        self.upload_id = upload_id
+        self.file_name = self.plan_dir / f"{upload_id}.plan.json"
+
+    def exists(self):
+        return self.file_name.is_file()
+
+    def write(self, details, shards):
+        """Writes the plan.
+
+        Args:
+            details (dict): E.g. the path of the file, vault name, part size and total size.
+            shards (list): The shards (dicts with the shard number and the first and last
+                byte of its parts).
+        """
+        self.plan_dir.mkdir(parents=True, exist_ok=True)
+        record = {"upload_id": self.upload_id}
+        record.update(details)
+        record.update({"shards": shards})
+        self._write_file(self.file_name, record)
+
+    def load(self):
+        """Reads the plan.
+
+        Returns:
+            dict: The details of the upload with the shards.
+        """
+        with open(self.file_name) as file_object:
+            return json.load(file_object)
+
+    def report_name(self, shard):
+        return self.plan_dir / f"{self.upload_id}.shard-{shard}.json"
+
+    def report(self, shard, parts):
+        """Records an uploaded shard (the ranges and hashes of its parts).
+
+        Args:
+            shard (int): Number of the shard.
+            parts (list): Parts from partlify with the leaf hashes and checksum added.
+        """
+        record = {
+            "shard": shard,
+            "parts": [
+                {
+                    "range_start": part.get("range_start"),
+                    "range_end": part.get("range_end"),
+                    "checksum": part.get("checksum"),
+                    "leaf_hashes": [leaf.hex() for leaf in part.get("leaf_hashes")],
+                }
+                for part in parts
+            ],
+        }
+        self._write_file(self.report_name(shard), record)
+
+    def load_reports(self):
+        """Reads the reports of the shards uploaded so far.
+
+        Returns:
+            dict: The parts (by the start of their byte range) of each reported shard by
+                the number of the shard.
+        """
+        reports = dict()
+        for shard in self.load().get("shards"):
+            try:
+                with open(self.report_name(shard.get("shard"))) as file_object:
+                    record = json.load(file_object)
+            except FileNotFoundError:
+                continue
+            parts = dict()
+            for part in record.get("parts"):
+                part.update({"leaf_hashes": [bytes.fromhex(leaf) for leaf in part.get("leaf_hashes")]})
+                parts.update({part.get("range_start"): part})
+            reports.update({record.get("shard"): parts})
+        return reports
+
+    def remove(self):
+        """Removes the plan and the reports once the upload has been completed."""
+        for shard in self.load().get("shards"):
+            if self.report_name(shard.get("shard")).is_file():
+                self.report_name(shard.get("shard")).unlink()
+        self.file_name.unlink()
+
+    def _write_file(self, file_name, record):
+        temporary = file_name.with_name(f".{file_name.name}.{os.getpid()}")
+        with open(temporary, "w") as file_object:
+            json.dump(record, file_object)
+            file_object.flush()
+            os.fsync(file_object.fileno())
+        os.replace(temporary, file_name)
@@ -0,0 +1,123 @@
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .part_reader import MappedFile
+
+LEAF_SIZE = 1048576
+HASH_BATCH_LEAVES = 64
+
+
+def leaf_hashes(data):
+    """Calculates the SHA-256 digests of the 1 megabyte chunks of the data.
+    These are the leaves of the Glacier tree hash.
+
+    Args:
+        data (bytes): Data to hash, e.g. a single part of a multipart upload.
+
+    Returns:
+        list: SHA-256 digests (bytes) in the order of the chunks.
+    """
+    view = memoryview(data)
+    hashes = [hashlib.sha256(view[i:i + LEAF_SIZE]).digest() for i in range(0, len(view), LEAF_SIZE)]
+    return hashes or [hashlib.sha256(b"").digest()]
+
+
+def part_hashes(data):
+    """Calculates the tree hash leaves and the linear SHA-256 of the data in a single
+    pass. Both are needed for uploading a part.
+
+    Args:
+        data (bytes): Data to hash, e.g. a memoryview of a part.
+
+    Returns:
+        tuple: List of the leaf digests and the linear SHA-256 as hex.
+    """
+    view = memoryview(data)
+    linear = hashlib.sha256()
+    hashes = []
+    for i in range(0, len(view), LEAF_SIZE):
+        chunk = view[i:i + LEAF_SIZE]
+        hashes.append(hashlib.sha256(chunk).digest())
+        linear.update(chunk)
+    return hashes or [hashlib.sha256(b"").digest()], linear.hexdigest()
+
+
+def file_leaf_hashes(path_to_file, start=0, length=None, workers=None):
+    """Calculates the leaf digests of a range of a file on several cores. The file is
+    memory mapped and batches of leaves are hashed by offset in a pool of threads
+    (hashlib releases the GIL while hashing) so nothing is copied or pickled. The pages
+    of a batch are dropped from memory once it has been hashed.
+
+    Args:
+        path_to_file (str): Path to the file.
+        start (int, optional): Offset of the range. Has to be a multiple of the leaf size. Defaults to 0.
+        length (int, optional): Length of the range in bytes. Defaults to the rest of the file.
+        workers (int, optional): Amount of hashing threads. Defaults to the amount of CPUs.
+
+    Returns:
+        list: SHA-256 digests (bytes) of the leaves in the order of the range.
+    """
+    if length is None:
+        length = os.path.getsize(path_to_file) - start
+    if length <= 0:
+        return [hashlib.sha256(b"").digest()]
+    workers = workers or os.cpu_count() or 1
+    leaf_count = math.ceil(length / LEAF_SIZE)
+    batch_size = max(1, min(HASH_BATCH_LEAVES, math.ceil(leaf_count / workers))) * LEAF_SIZE
+    batches = [
+        (offset, min(batch_size, start + length - offset)) for offset in range(start, start + length, batch_size)
+    ]
+    with MappedFile(path_to_file) as mapped_file:
+
+        def hash_batch(batch):
+            with mapped_file.part_view(*batch) as view:
+                hashes = leaf_hashes(view.data)
+            mapped_file.release(*batch)
+            return hashes
+
+        if len(batches) == 1:
+            return hash_batch(batches[0])
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            return [leaf for hashes in executor.map(hash_batch, batches) for leaf in hashes]
+
+
+def file_tree_hash(path_to_file, workers=None):
+    """Calculates the tree hash of a whole file (on several cores, see file_leaf_hashes).
+
+    Args:
+        path_to_file (str): Path to the file.
+        workers (int, optional): Amount of hashing threads. Defaults to the amount of CPUs.
+
+    Returns:
+        str: The tree hash as hex.
+    """
+    return tree_hash(file_leaf_hashes(path_to_file, workers=workers))
+
+
+def combine_hashes(hashes):
+    """Combines the leaf digests pairwise until only the root digest is left.
+    The leaves of a part can be combined into the checksum of the part and the
+    leaves of all the parts into the checksum of the whole archive.
+
+    Args:
+        hashes (list): SHA-256 digests (bytes) of consecutive 1 megabyte chunks.
+
+    Returns:
+        bytes: The root digest of the tree.
+    """
+    level = list(hashes)
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level), 2):
+            if i + 1 < len(level):
+                next_level.append(hashlib.sha256(level[i] + level[i + 1]).digest())
+            else:
+                next_level.append(level[i])
+        level = next_level
+    return level[0]
+
+
+def tree_hash(hashes):
+    """Tree hash in the hex format used by Glacier (e.g. the checksum argument)."""
+    return combine_hashes(hashes).hex()
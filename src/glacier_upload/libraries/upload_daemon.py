@@ -0,0 +1,260 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from .setup_logger import logger
+from .glacier_library import GlacierLib
+from .response_storage import Storage
+from .file_collector import collect_files
+
+# Options of a job passed on to GlacierLib.upload_files.
+JOB_OPTIONS = ("multipart", "part_size", "description", "pack_size")
+
+
+def send_request(socket_path, request, timeout=30.0):
+    """Sends a request (dict) to the daemon listening on the socket.
+
+    Returns:
+        dict: The response of the daemon.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(str(socket_path))
+        with connection.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Reads requests as JSON lines from a connection and writes a JSON line back for each."""
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {"ok": False, "error": "The request isn't JSON."}
+            else:
+                response = self.server.daemon.handle_request(request)
+            self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+            self.wfile.flush()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class UploadDaemon:
+    def __init__(self, upload_log="uploaded_log.db", socket_path=None, spool_dir=None, max_jobs=1,
+                 poll_interval=1.0, region_name=None, **glacier_kwargs):
+        """Runs upload jobs from a queue kept in the storage, so that the queue survives
+        restarts (the jobs left running are queued again on start). The jobs are taken
+        from a Unix socket (see handle_request for the requests) or as JSON files from a
+        spool directory, and run in the order of their priority, max_jobs at a time.
+
+        A GlacierLib is kept for each region and vault, so the client, its connections,
+        the vault lookup and the upload workers stay warm from one job to the next.
+
+        A spool file is a submit request without the command, e.g. {"paths": ["/data/a.tar"],
+        "vault_name": "my_vault", "priority": 5}. Write it under another name and rename it
+        to *.json once it's complete. It's removed once the job has been queued.
+
+        Args:
+            upload_log (str, optional): Catalog of the archives and the jobs. Defaults to "uploaded_log.db".
+            socket_path (str, optional): Path of the Unix socket to listen on.
+            spool_dir (str, optional): Directory checked for job files every poll_interval.
+            max_jobs (int, optional): Amount of jobs run at once. Defaults to 1.
+            poll_interval (float, optional): Seconds between the checks of the spool
+                directory and of the queue (for jobs added by other processes). Defaults to 1.
+            region_name (str, optional): Region of the jobs that don't give one.
+            **glacier_kwargs: Passed on to each GlacierLib (e.g. workers and rate_limiter).
+                A rate limiter given here is shared by all the jobs.
+        """
+        self.logger = logger
+        self.upload_log = upload_log
+        self.socket_path = socket_path
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.region_name = region_name
+        self.glacier_kwargs = glacier_kwargs
+        self.storage = Storage(file_name=upload_log)
+        self._glaciers = dict()
+        self._glaciers_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopped = threading.Event()
+        self._stop_lock = threading.Lock()
+        self._threads = list()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Queues the interrupted jobs again and starts the job runners and the socket."""
+        requeued = self.storage.requeue_running_jobs()
+        if requeued:
+            self.logger.info(f"{requeued} interrupted jobs queued again.")
+        if self.socket_path:
+            if Path(self.socket_path).is_socket():
+                Path(self.socket_path).unlink()
+            self._server = UnixServer(str(self.socket_path), RequestHandler)
+            self._server.daemon = self
+            self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+        if self.spool_dir:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            self._threads.append(threading.Thread(target=self._watch_spool, daemon=True))
+        self._threads.extend(threading.Thread(target=self._run_jobs, daemon=True) for _ in range(self.max_jobs))
+        for thread in self._threads:
+            thread.start()
+        self.logger.info(f"Upload daemon started ({self.max_jobs} jobs at a time).")
+
+    def wait(self):
+        """Blocks until the daemon is stopped (e.g. with the stop request)."""
+        while not self._stopped.wait(1.0):
+            pass
+
+    def stop(self):
+        """Stops taking jobs and waits for the running ones to finish."""
+        with self._stop_lock:
+            if self._stopped.is_set():
+                return
+            self._stopped.set()
+            with self._wakeup:
+                self._wakeup.notify_all()
+            if self._server:
+                self._server.shutdown()
+                self._server.server_close()
+                Path(self.socket_path).unlink()
+                self._server = None
+            for thread in self._threads:
+                thread.join()
+            self._threads = list()
+            for glacier in self._glaciers.values():
+                glacier.close()
+            self._glaciers = dict()
+            self.logger.info("Upload daemon stopped.")
+
+    def submit(self, paths, vault_name, priority=0, region_name=None, **options):
+        """Queues an upload job.
+
+        Args:
+            paths (list): Absolute paths to the files, directories or glob patterns.
+            vault_name (str): Vault the files are uploaded to.
+            priority (int, optional): Jobs with a higher priority are started first. Defaults to 0.
+            region_name (str, optional): Region of the vault. Defaults to the one of the daemon.
+            **options: Options of the upload (see JOB_OPTIONS).
+
+        Returns:
+            int: Id of the job.
+        """
+        unknown = [name for name in options if name not in JOB_OPTIONS]
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(unknown)}")
+        if not paths or not vault_name:
+            raise ValueError("A job needs the paths and the vault_name.")
+        job_id = self.storage.save_job(vault_name, list(paths), priority, region_name or self.region_name, options)
+        self.logger.info(f"Job {job_id} queued ({len(paths)} paths to {vault_name}, priority {priority}).")
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def handle_request(self, request):
+        """Handles a request from the socket:
+
+        - {"command": "submit", "paths": [...], "vault_name": ..., "priority": 0, ...}: queues a job
+        - {"command": "status", "job_id": 1}: the job and the metrics of its vault if it's running
+        - {"command": "list", "state": "queued"}: the jobs (optionally in the state)
+        - {"command": "cancel", "job_id": 1}: cancels a queued job
+        - {"command": "stop"}: stops the daemon once the running jobs have finished
+
+        Returns:
+            dict: The response with "ok" and the result or an "error".
+        """
+        request = dict(request)
+        command = request.pop("command", None)
+        try:
+            if command == "submit":
+                return {"ok": True, "job_id": self.submit(**request)}
+            if command == "status":
+                job = self.storage.find_job(request.get("job_id"))
+                if job is None:
+                    return {"ok": False, "error": f"No job {request.get('job_id')}."}
+                return {"ok": True, "job": job, "metrics": self._job_metrics(job)}
+            if command == "list":
+                return {"ok": True, "jobs": self.storage.jobs(request.get("state"))}
+            if command == "cancel":
+                if not self.storage.cancel_job(request.get("job_id")):
+                    return {"ok": False, "error": f"Job {request.get('job_id')} isn't queued."}
+                return {"ok": True}
+            if command == "stop":
+                threading.Thread(target=self.stop).start()
+                return {"ok": True}
+        except (TypeError, ValueError) as error:
+            return {"ok": False, "error": str(error)}
+        return {"ok": False, "error": f"Unknown command: {command}"}
+
+    def _run_jobs(self):
+        """Runs the queued jobs one at a time until stopped. Run in each job runner."""
+        while not self._stopped.is_set():
+            job = self.storage.claim_job()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job.get("id")
+        self.logger.info(f"Starting job {job_id} ({len(job.get('paths'))} paths to {job.get('vault_name')}).")
+        try:
+            glacier = self._glacier_for(job.get("region_name"), job.get("vault_name"))
+            results = glacier.upload_files(collect_files(job.get("paths")), **job.get("options"))
+        except Exception as error:
+            self.logger.exception(f"Job {job_id} failed: {error}")
+            self.storage.finish_job(job_id, "failed", {"error": str(error)})
+            return
+        state = "done" if results and all(results.values()) else "failed"
+        self.storage.finish_job(job_id, state, results)
+        self.logger.info(f"Job {job_id} {state}.")
+
+    def _glacier_for(self, region_name, vault_name):
+        """The GlacierLib kept for the region and vault (created for the first job)."""
+        key = (region_name, vault_name)
+        with self._glaciers_lock:
+            if key not in self._glaciers:
+                self._glaciers[key] = GlacierLib(
+                    vault_name, upload_log=self.upload_log, region_name=region_name, **self.glacier_kwargs
+                )
+            return self._glaciers.get(key)
+
+    def _job_metrics(self, job):
+        if job.get("state") != "running":
+            return None
+        glacier = self._glaciers.get((job.get("region_name"), job.get("vault_name")))
+        return glacier.metrics.snapshot() if glacier else None
+
+    def _watch_spool(self):
+        while not self._stopped.wait(self.poll_interval):
+            self._scan_spool()
+
+    def _scan_spool(self):
+        """Queues the jobs of the *.json files in the spool directory. Files that can't be
+        queued are renamed to *.json.invalid.
+        """
+        for path in sorted(self.spool_dir.glob("*.json")):
+            try:
+                with open(path) as file_object:
+                    request = json.load(file_object)
+                self.submit(**request)
+            except (OSError, TypeError, ValueError) as error:
+                self.logger.error(f"Could not queue the job in {path}: {error}")
+                os.replace(path, path.with_name(f"{path.name}.invalid"))
+                continue
+            path.unlink()
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class Journal:
+    def __init__(self, upload_log, upload_id):
+        """Keeps track of the progress of a multipart upload so that it can be resumed
+        if the upload is interrupted. The journal is a JSON Lines file in a directory
+        next to the upload log (e.g. uploaded_log.journal/<upload_id>.jsonl). The first
+        line describes the upload and each following line a completed part.
+
+        Args:
+            upload_log (str): Path to the upload log used by the Storage.
+            upload_id (str): Id of the multipart upload received from Glacier.
+        """
+        log_path = Path(upload_log)
+        self.upload_id = upload_id
+        self.file_name = log_path.with_name(f"{log_path.stem}.journal") / f"{upload_id}.jsonl"
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return self.file_name.is_file()
+
+    def start(self, details):
+        """Creates the journal with the details of the upload.
+
+        Args:
+            details (dict): E.g. the path of the file, vault name, part size and total size.
+        """
+        self.file_name.parent.mkdir(parents=True, exist_ok=True)
+        record = {"type": "upload", "upload_id": self.upload_id}
+        record.update(details)
+        with open(self.file_name, "w") as file_object:
+            self._write_record(file_object, record)
+
+    def add_part(self, part):
+        """Records a successfully uploaded part (its range and hashes). Can be called
+        from several upload workers at once.
+
+        Args:
+            part (dict): Part from partlify with the leaf hashes and checksum added.
+        """
+        record = {
+            "type": "part",
+            "range_start": part.get("range_start"),
+            "range_end": part.get("range_end"),
+            "checksum": part.get("checksum"),
+            "leaf_hashes": [leaf.hex() for leaf in part.get("leaf_hashes")],
+        }
+        with self._lock, open(self.file_name, "a") as file_object:
+            self._write_record(file_object, record)
+
+    def load(self):
+        """Reads the journal.
+
+        Returns:
+            tuple: The details of the upload (dict) and the recorded parts (dict) by the
+                start of their byte range.
+        """
+        details = dict()
+        parts = dict()
+        with open(self.file_name) as file_object:
+            for line in file_object:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line can be partially written if the process died mid-write.
+                    continue
+                if record.pop("type") == "upload":
+                    details = record
+                else:
+                    record.update({"leaf_hashes": [bytes.fromhex(leaf) for leaf in record.get("leaf_hashes")]})
+                    parts.update({record.get("range_start"): record})
+        return details, parts
+
+    def remove(self):
+        """Removes the journal once the upload has been completed."""
+        if self.exists():
+            self.file_name.unlink()
+
+    def _write_record(self, file_object, record):
+        file_object.write(json.dumps(record) + "\n")
+        file_object.flush()
+        os.fsync(file_object.fileno())
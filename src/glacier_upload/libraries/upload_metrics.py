@@ -0,0 +1,246 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+PHASES = ("disk_read", "hashing", "network", "api", "retry_wait")
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the values (None if there are none)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def format_bytes(amount):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(amount) < 1024:
+            return f"{amount:.1f} {unit}"
+        amount /= 1024
+    return f"{amount:.1f} TB"
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class UploadMetrics:
+    def __init__(self, window=10.0, clock=time.monotonic):
+        """Collects the progress and timing of the uploads of a GlacierLib: the bytes
+        uploaded (each part or archive once it has been accepted), the throughput on
+        average and over a moving window, the ETA, the latencies of the part uploads
+        and the time spent in each phase summed over all the workers:
+
+        - disk_read: waiting for the data from the disk or the stream
+        - hashing: calculating the tree hashes and SHA-256s (CPU)
+        - network: sending the parts and archives
+        - api: other calls to Glacier (initiating, completing, listing)
+        - retry_wait: waiting before retrying a failed call
+
+        Comparing the phases tells if an upload is disk-, CPU- or network-bound.
+
+        Args:
+            window (float, optional): Seconds of the moving average. Defaults to 10.
+            clock (callable, optional): Source of the time in seconds.
+        """
+        self.window = window
+        self.total_bytes = 0
+        self.bytes_done = 0
+        self.parts_done = 0
+        self.retries = 0
+        self.latencies = []
+        self.phases = {phase: 0.0 for phase in PHASES}
+        self._clock = clock
+        self._started = clock()
+        self._samples = deque([(self._started, 0)])
+        self._lock = threading.Lock()
+
+    def add_total(self, amount):
+        """Adds to the amount of bytes to upload (negative for e.g. skipped files)."""
+        with self._lock:
+            self.total_bytes += amount
+
+    def add_phase(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] += seconds
+
+    @contextmanager
+    def phase(self, phase):
+        """Times the block as the given phase."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, self._clock() - started)
+
+    @contextmanager
+    def cpu_phase(self, phase, wait_phase="disk_read"):
+        """Times a CPU-bound block (e.g. hashing a memory mapped part). The CPU time of
+        the thread goes to the phase and the rest of the time to the wait phase, which
+        with a memory mapped file is the time spent waiting for the pages from the disk.
+        """
+        started = self._clock()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            cpu_time = time.thread_time() - cpu_started
+            elapsed = self._clock() - started
+            with self._lock:
+                self.phases[phase] += min(cpu_time, elapsed)
+                self.phases[wait_phase] += max(elapsed - cpu_time, 0)
+
+    def part_done(self, size, seconds):
+        """Records an uploaded part or archive.
+
+        Args:
+            size (int): Size in bytes.
+            seconds (float): How long the upload call took.
+        """
+        now = self._clock()
+        with self._lock:
+            self.bytes_done += size
+            self.parts_done += 1
+            self.latencies.append(seconds)
+            self._samples.append((now, self.bytes_done))
+            while len(self._samples) > 2 and self._samples[1][0] < now - self.window:
+                self._samples.popleft()
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        """The current state of the uploads.
+
+        Returns:
+            dict: Bytes done and in total, elapsed seconds, average and moving average
+                throughput (bytes per second), ETA in seconds (None if not known), part
+                latency percentiles and the seconds spent in each phase.
+        """
+        now = self._clock()
+        with self._lock:
+            elapsed = max(now - self._started, 1e-9)
+            window_start, window_bytes = self._samples[0]
+            moving = (self.bytes_done - window_bytes) / max(now - window_start, 1e-9)
+            remaining = self.total_bytes - self.bytes_done
+            eta = remaining / moving if moving > 0 and remaining > 0 else (0.0 if remaining <= 0 else None)
+            return {
+                "bytes_done": self.bytes_done,
+                "total_bytes": self.total_bytes,
+                "parts_done": self.parts_done,
+                "retries": self.retries,
+                "elapsed_seconds": round(elapsed, 3),
+                "throughput": self.bytes_done / elapsed,
+                "moving_throughput": moving,
+                "eta_seconds": eta,
+                "part_latency_seconds": {
+                    f"p{percent}": percentile(self.latencies, percent) for percent in PERCENTILES
+                },
+                "phase_seconds": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            }
+
+    def progress_line(self):
+        """One line description of the progress (e.g. for the terminal)."""
+        state = self.snapshot()
+        total = state.get("total_bytes")
+        done = format_bytes(state.get("bytes_done"))
+        line = f"{done} / {format_bytes(total)} ({100 * state.get('bytes_done') / total:.1f}%)" if total else done
+        line += f"  {format_bytes(state.get('moving_throughput'))}/s (avg {format_bytes(state.get('throughput'))}/s)"
+        if state.get("eta_seconds") is not None and total:
+            line += f"  ETA {format_seconds(state.get('eta_seconds'))}"
+        p50 = state.get("part_latency_seconds").get("p50")
+        if p50 is not None:
+            line += f"  part p50 {p50:.2f}s"
+        return line
+
+    def write_summary(self, file_name):
+        """Writes the snapshot to a file. A file with the .prom suffix is written in
+        the Prometheus text format (for the node exporter's textfile collector) and
+        any other as JSON. The file is replaced atomically.
+        """
+        path = Path(file_name)
+        state = self.snapshot()
+        if path.suffix == ".prom":
+            content = self._prometheus_text(state)
+        else:
+            content = json.dumps(state, indent=4) + "\n"
+        temp_path = path.with_name(f".{path.name}.tmp")
+        temp_path.write_text(content)
+        os.replace(temp_path, path)
+
+    def _prometheus_text(self, state):
+        metrics = [
+            ("glacier_upload_bytes_total", "counter", "Bytes uploaded.", [("", state.get("bytes_done"))]),
+            ("glacier_upload_size_bytes", "gauge", "Bytes to upload in total.", [("", state.get("total_bytes"))]),
+            ("glacier_upload_parts_total", "counter", "Parts and archives uploaded.", [("", state.get("parts_done"))]),
+            ("glacier_upload_retries_total", "counter", "Calls retried.", [("", state.get("retries"))]),
+            ("glacier_upload_duration_seconds", "gauge", "Duration of the uploads.",
+             [("", state.get("elapsed_seconds"))]),
+            ("glacier_upload_throughput_bytes_per_second", "gauge", "Average upload throughput.",
+             [("", state.get("throughput"))]),
+            ("glacier_upload_part_latency_seconds", "summary", "Latency of the part uploads.", [
+                (f'{{quantile="{percent / 100}"}}', state.get("part_latency_seconds").get(f"p{percent}"))
+                for percent in PERCENTILES
+            ]),
+            ("glacier_upload_phase_seconds", "counter", "Time spent in each phase over all the workers.", [
+                (f'{{phase="{phase}"}}', seconds) for phase, seconds in state.get("phase_seconds").items()
+            ]),
+        ]
+        lines = []
+        for name, metric_type, description, samples in metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples if value is not None)
+        return "\n".join(lines) + "\n"
+
+
+class ProgressReporter:
+    def __init__(self, metrics, stream=sys.stderr, interval=1.0):
+        """Rewrites a progress line on the terminal at the interval until stopped.
+
+        Args:
+            metrics (UploadMetrics): The metrics to report.
+            stream (io.TextIOBase, optional): Where the line is written. Defaults to stderr.
+            interval (float, optional): Seconds between the updates. Defaults to 1.
+        """
+        self.metrics = metrics
+        self.stream = stream
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._write()
+        self.stream.write("\n")
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        self.stream.write("\r\033[K" + self.metrics.progress_line())
+        self.stream.flush()
@@ -1,18 +1,19 @@
 from pathlib import Path
 from .setup_logger import logger
-from .partlify import get_allowed_sizes
+from .partlify import MAX_PARTS, get_allowed_sizes, get_part_count
 
 
 class Validator:
     def __init__(self):
         self.logger = logger
 
-    def preupload_checks(self, path_to_file, part_size=None):
+    def preupload_checks(self, path_to_file, part_size=None, max_memory=None):
         """Runs the preupload checks to avoid starting unnecessary upload processes.
 
         Args:
             path_to_file (str): Path to the upload file.
             part_size (int, optional): If provided will also run the multipart validations.
+            max_memory (int, optional): Memory limit in megabytes for the multipart upload.
 
         Returns:
             bool: Result from the tests (if all okay or right when a check fails).
@@ -23,6 +24,8 @@ class Validator:
         multipart_checks = [
             {'method': self._check_if_valid_part_size_for_glacier, 'args': [part_size]},
             {'method': self._check_if_part_size_smaller_than_total, 'args': [path_to_file, part_size]},
+            {'method': self._check_if_part_count_within_limit, 'args': [path_to_file, part_size]},
+            {'method': self._check_if_part_size_within_memory_limit, 'args': [part_size, max_memory]},
         ]
         results = []
         if part_size:  # Multipart upload
@@ -36,6 +39,33 @@ class Validator:
                 break
         return all(results)
 
+    def prestream_checks(self, part_size, max_memory=None):
+        """Runs the checks before uploading from a stream (the size isn't known).
+
+        Args:
+            part_size (int): Multipart upload part size in megabytes.
+            max_memory (int, optional): Memory limit in megabytes.
+
+        Returns:
+            bool: Result from the tests.
+        """
+        return (
+            self._check_if_valid_part_size_for_glacier(part_size)
+            and self._check_if_part_size_within_memory_limit(part_size, max_memory)
+        )
+
+    def preresume_checks(self, path_to_file, total_size):
+        """Runs the checks before resuming an interrupted multipart upload.
+
+        Args:
+            path_to_file (str): Path to the upload file.
+            total_size (int): Size of the file when the upload was started.
+
+        Returns:
+            bool: Result from the tests.
+        """
+        return self._check_if_file_exist(path_to_file) and self._check_if_file_unchanged(path_to_file, total_size)
+
     def _check_if_file_exist(self, path_to_file):
         file_found = False
         if Path(path_to_file).is_file():
@@ -45,6 +75,15 @@ class Validator:
             self.logger.error(f"File {path_to_file} can't be found. Cancelling upload.")
         return file_found
 
+    def _check_if_file_unchanged(self, path_to_file, total_size):
+        unchanged = False
+        current_size = Path(path_to_file).stat().st_size
+        if current_size == total_size:
+            unchanged = True
+        else:
+            self.logger.error(f"File {path_to_file} has changed ({total_size} -> {current_size} bytes). Can't resume.")
+        return unchanged
+
     def _check_if_valid_part_size_for_glacier(self, part_size):
         valid_part_size = False
         allowed = get_allowed_sizes()
@@ -59,24 +98,46 @@ class Validator:
         valid_part_size = False
         total_size = Path(path_to_file).stat().st_size
         try:
-            assert total_size > part_size
+            assert total_size > get_allowed_sizes().get(str(part_size))
         except AssertionError:
-            self.logger.error(f"The part size ({part_size}) is larger than the total upload size ({total_size}).")
+            self.logger.error(
+                f"The part size ({part_size} MB) is larger than the total upload size ({total_size} bytes)."
+            )
             self.logger.error("Please specify smaller part size.")
         else:
             valid_part_size = True
         return valid_part_size
 
+    def _check_if_part_count_within_limit(self, path_to_file, part_size):
+        valid_part_size = True
+        total_size = Path(path_to_file).stat().st_size
+        part_count = get_part_count(total_size, get_allowed_sizes().get(str(part_size)))
+        if part_count > MAX_PARTS:
+            valid_part_size = False
+            self.logger.error(f"The part size ({part_size}) would need {part_count} parts. Glacier allows {MAX_PARTS}.")
+            self.logger.error("Please specify larger part size.")
+        return valid_part_size
+
+    def _check_if_part_size_within_memory_limit(self, part_size, max_memory):
+        valid_part_size = True
+        if max_memory and part_size > max_memory:
+            valid_part_size = False
+            self.logger.error(f"The part size ({part_size}) is larger than the memory limit ({max_memory}).")
+            self.logger.error("Please specify smaller part size or a larger memory limit.")
+        return valid_part_size
+
     def is_response_ok(self, response):
         """Checks the response from Glacier (if correct https status code included).
 
         Args:
-            response (dict): Response from Glacier
+            response (dict): Response from Glacier. None if the call failed.
 
         Returns:
             bool: If response includes any of the specified okay codes
         """
-        if response["ResponseMetadata"]["HTTPStatusCode"] in [200, 201, 204]:
+        if response is None:
+            return False
+        if response["ResponseMetadata"]["HTTPStatusCode"] in [200, 201, 202, 204, 206]:
             return True
         else:
             return False
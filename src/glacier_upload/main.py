@@ -1,11 +1,64 @@
 import argparse
+import json
+import signal
+import sys
+from pathlib import Path
+from contextlib import contextmanager
 from glacier_upload.libraries.glacier_library import GlacierLib
+from glacier_upload.libraries.retrieval_library import RetrievalLib, TIERS
+from glacier_upload.libraries.upload_journal import Journal
+from glacier_upload.libraries.shard_plan import ShardPlan
+from glacier_upload.libraries.retry_policy import RetryPolicy, RETRYABLE_ERRORS
+from glacier_upload.libraries.file_collector import collect_files, read_file_list
+from glacier_upload.libraries.tree_hash import file_tree_hash
+from glacier_upload.libraries.rate_limiter import RateLimiter, parse_rate, parse_schedule
+from glacier_upload.libraries.upload_metrics import ProgressReporter
+from glacier_upload.libraries.compress_stream import CODECS
+from glacier_upload.libraries.upload_daemon import UploadDaemon, send_request
+
+
+def part_size_type(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid part size: '{value}' (use megabytes or auto)")
+
+
+def rate_type(value):
+    try:
+        return parse_rate(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def schedule_type(value):
+    try:
+        return parse_schedule(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def destinations_type(value):
+    destinations = []
+    for destination in value.split(","):
+        region_name, _, vault_name = destination.strip().partition(":")
+        if not region_name or not vault_name:
+            raise argparse.ArgumentTypeError(f"invalid destination: '{destination}' (use region:vault)")
+        destinations.append((region_name, vault_name))
+    return destinations
 
 
 def setup_parser():
     parser = argparse.ArgumentParser(
         prog='glacier-upload',
-        usage='%(prog)s [options] file vault_name',
+        usage='%(prog)s [options] file [file ...] vault_name\n'
+              '       %(prog)s hash [--check tree_hash] file [file ...]\n'
+              '       %(prog)s [options] --from-file list_file vault_name\n'
+              '       %(prog)s [options] --resume upload_id\n'
+              '       %(prog)s serve|submit|status [options]\n'
+              '       %(prog)s coordinate|shard [options]',
         description='upload files to AWS S3 Glacier',
         epilog='happy uploading!'
         )
@@ -13,14 +66,24 @@ def setup_parser():
         'file',
         metavar='file',
         type=str,
-        help='uploaded file'
+        nargs='*',
+        help='uploaded file(s). directories are uploaded recursively and glob patterns (e.g. "logs/*.gz") expanded. '
+             '"-" uploads from stdin in multiple parts as the data arrives.'
         )
     parser.add_argument(
         'vault_name',
         metavar='vault_name',
         type=str,
+        nargs='?',
         help='glacier vault name'
         )
+    parser.add_argument(
+        '--from-file',
+        dest='from_file',
+        metavar='list_file',
+        help='read the uploaded files from a file with one file, directory or glob pattern per line. "-" reads '
+             'from stdin.'
+    )
     parser.add_argument(
         '-d',
         '--desc',
@@ -36,35 +99,690 @@ def setup_parser():
     parser.add_argument(
         '-s',
         '--part_size',
+        '--part-size',
         default='4',
+        type=part_size_type,
+        help='multipart upload part size in megabytes. Sizes allowed by Glacier are 1, 2, 4, 8 and so on. '
+             '"auto" picks the size by the file size, concurrency and memory limit.'
+    )
+    parser.add_argument(
+        '--pack',
+        metavar='SIZE_MB',
+        type=int,
+        help='pack the files smaller than a part into tar archives of about this size in megabytes. the offset of '
+             'each file in its pack is saved to the log.'
+    )
+    parser.add_argument(
+        '--compress',
+        choices=sorted(CODECS),
+        help='compress the files (and stdin) while uploading, in blocks on all the cpus. the codec and the original '
+             'size are saved to the log. packs are not compressed.'
+    )
+    parser.add_argument(
+        '--compress-level',
+        dest='compress_level',
+        type=int,
+        help='compression level. defaults to the default of the codec.'
+    )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        default=1,
+        type=int,
+        help='amount of multipart parts uploaded in parallel. defaults to 1.'
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='adjust the amount of parts uploaded in parallel between 1 and --concurrency by the observed '
+             'throughput and throttling. the chosen concurrency is logged.'
+    )
+    parser.add_argument(
+        '--vault-cache-ttl',
+        dest='vault_cache_ttl',
+        default=3600,
+        type=float,
+        help='seconds a found vault is cached in the log file before it is looked up again. 0 disables the cache. '
+             'defaults to 3600.'
+    )
+    parser.add_argument(
+        '--replicate-to',
+        dest='replicate_to',
+        type=destinations_type,
+        default=[],
+        help='comma separated region:vault pairs (e.g. eu-west-1:backup) the upload is also sent to. the file is '
+             'read and hashed once. each destination has its own retries and is logged separately. --max-rate limits '
+             'all the destinations together.'
+    )
+    parser.add_argument(
+        '--max-memory',
+        dest='max_memory',
+        type=int,
+        help='upper limit in megabytes for the part data held in memory at once. no limit by default.'
+    )
+    parser.add_argument(
+        '--read-ahead',
+        dest='read_ahead',
+        metavar='PARTS',
+        default=1,
         type=int,
-        help='multipart upload part size in megabytes. Sizes allowed by Glacier are 1, 2, 4, 8 and so on.'
+        help='parts read from the disk in the background ahead of the part being sent. defaults to 1.'
+    )
+    parser.add_argument(
+        '--keep-cache',
+        dest='keep_cache',
+        action='store_true',
+        help='keep the uploaded data in the page cache. by default the parts that are done are dropped from it so '
+             'a large upload doesn\'t push out the cached data of other programs.'
+    )
+    parser.add_argument(
+        '--max-rate',
+        dest='max_rate',
+        type=rate_type,
+        help='upper limit for the upload rate of all the workers and files together, e.g. 50MB/s. not limited by '
+             'default.'
+    )
+    parser.add_argument(
+        '--rate-schedule',
+        dest='rate_schedule',
+        type=schedule_type,
+        help='upload rate by the time of day (local time), e.g. "08:00-18:00=10MB/s,18:00-22:00=30MB/s". '
+             '--max-rate is used outside of the given hours.'
+    )
+    parser.add_argument(
+        '--skip-existing',
+        dest='skip_existing',
+        action='store_true',
+        help='skip the files already uploaded to the vault (same tree hash and size in the log file). unchanged '
+             'files are recognized without hashing them again.'
+    )
+    parser.add_argument(
+        '--resume',
+        metavar='upload_id',
+        help='resume an interrupted multipart upload. the file and vault are read from the upload journal.'
+    )
+    parser.add_argument(
+        '--retries',
+        default=5,
+        type=int,
+        help='maximum attempts for each call to Glacier (e.g. a part upload). defaults to 5.'
+    )
+    parser.add_argument(
+        '--retry-base-delay',
+        dest='retry_base_delay',
+        default=1.0,
+        type=float,
+        help='upper limit in seconds for the first randomized wait between attempts. doubles on each attempt. '
+             'defaults to 1.'
+    )
+    parser.add_argument(
+        '--retry-max-delay',
+        dest='retry_max_delay',
+        default=60.0,
+        type=float,
+        help='upper limit in seconds for any wait between attempts. defaults to 60.'
+    )
+    parser.add_argument(
+        '--retry-on',
+        dest='retry_on',
+        default=','.join(RETRYABLE_ERRORS),
+        help='comma separated exception names or error codes that are retried. defaults to '
+             f'{",".join(RETRYABLE_ERRORS)}.'
+    )
+    parser.add_argument(
+        '--progress',
+        action='store_true',
+        help='show a progress line with the throughput, eta and part latency (on stderr).'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        dest='metrics_file',
+        help='write a summary of the throughput, part latencies and time spent in each phase (disk read, hashing, '
+             'network, api, retry wait) to this file at exit. json, or prometheus text format if the file ends with '
+             '.prom.'
     )
     parser.add_argument(
         '-r',
         '--region',
         help='aws region (where the vault is located in)'
     )
+    parser.add_argument(
+        '--endpoint-url',
+        dest='endpoint_url',
+        help='glacier endpoint used in place of the one of the region (e.g. a vpc endpoint or a local stand-in)'
+    )
     parser.add_argument(
         '-l',
         '--log_file',
-        default='uploaded_log.json',
-        help='logs the responses from Glacier (e.g. archiveId) in JSON format. defaults to uploaded_log.json'
+        default='uploaded_log.db',
+        help='catalog (SQLite) for the responses from Glacier (e.g. archiveId). a log in the earlier JSON format '
+             'with the same name is imported once. defaults to uploaded_log.db'
     )
     return parser
 
 
+def setup_hash_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload hash',
+        description='calculate the glacier tree hash (sha-256) of file(s) without uploading',
+        )
+    parser.add_argument(
+        'file',
+        metavar='file',
+        type=str,
+        nargs='+',
+        help='hashed file(s)'
+        )
+    parser.add_argument(
+        '--check',
+        metavar='tree_hash',
+        help='compare the tree hash of the file(s) to this one. exits with 1 if any differs.'
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        help='amount of hashing threads. defaults to the amount of cpus.'
+    )
+    return parser
+
+
+def setup_retrieve_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload retrieve',
+        description='retrieve archives from glacier by the archive id or the path of the uploaded file',
+        )
+    parser.add_argument(
+        'target',
+        metavar='archive_id_or_file',
+        type=str,
+        nargs='+',
+        help='archive id(s) or path(s) of the uploaded files in the log'
+        )
+    parser.add_argument(
+        'vault_name',
+        type=str,
+        help='name of the glacier vault'
+        )
+    parser.add_argument(
+        '-o',
+        '--output-dir',
+        dest='output_dir',
+        default='.',
+        help='directory for the retrieved files. defaults to the current directory.'
+    )
+    parser.add_argument(
+        '--tier',
+        default='Standard',
+        choices=TIERS,
+        help='retrieval tier. defaults to Standard.'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        default=900.0,
+        type=float,
+        help='seconds between the checks of the retrieval jobs. defaults to 900.'
+    )
+    parser.add_argument(
+        '-s',
+        '--part-size',
+        dest='part_size',
+        default=16,
+        type=int,
+        help='size in megabytes of the byte ranges downloaded in parallel. defaults to 16.'
+    )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        default=4,
+        type=int,
+        help='amount of byte ranges downloaded in parallel. defaults to 4.'
+    )
+    parser.add_argument(
+        '--retries',
+        default=5,
+        type=int,
+        help='maximum attempts for each call to glacier (e.g. a range download). defaults to 5.'
+    )
+    parser.add_argument(
+        '--progress',
+        action='store_true',
+        help='show a progress line with the throughput, eta and range latency (on stderr).'
+    )
+    parser.add_argument(
+        '-r',
+        '--region',
+        help='aws region (where the vault is located in)'
+    )
+    parser.add_argument(
+        '--endpoint-url',
+        dest='endpoint_url',
+        help='glacier endpoint used in place of the one of the region (e.g. a vpc endpoint or a local stand-in)'
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        default='uploaded_log.db',
+        help='catalog (SQLite) of the uploaded archives. defaults to uploaded_log.db'
+    )
+    parser.set_defaults(retry_base_delay=1.0, retry_max_delay=60.0, retry_on=','.join(RETRYABLE_ERRORS))
+    return parser
+
+
+def setup_serve_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload serve',
+        description='run upload jobs queued over a unix socket or in a spool directory. the queue is kept in the log '
+                    'file and survives restarts. the glacier clients and connections stay open between the jobs.',
+        )
+    parser.add_argument(
+        '--socket',
+        default='glacier-upload.sock',
+        help='unix socket for the submit and status commands. defaults to glacier-upload.sock'
+    )
+    parser.add_argument(
+        '--spool',
+        help='directory checked for jobs as json files (e.g. {"paths": [...], "vault_name": "...", "priority": 5}). '
+             'write a file under another name and rename it to *.json once complete.'
+    )
+    parser.add_argument(
+        '--jobs',
+        default=1,
+        type=int,
+        help='amount of jobs run at once. defaults to 1.'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        default=1.0,
+        type=float,
+        help='seconds between the checks of the spool directory. defaults to 1.'
+    )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        default=4,
+        type=int,
+        help='amount of parallel part uploads of each vault. defaults to 4.'
+    )
+    parser.add_argument(
+        '--max-memory',
+        dest='max_memory',
+        type=int,
+        help='upper limit in megabytes for the part data in flight for each vault.'
+    )
+    parser.add_argument(
+        '--max-rate',
+        dest='max_rate',
+        type=rate_type,
+        help='upper limit for the upload rate of all the jobs together, e.g. 50MB/s.'
+    )
+    parser.add_argument(
+        '--retries',
+        default=5,
+        type=int,
+        help='maximum attempts for each call to glacier (e.g. a part upload). defaults to 5.'
+    )
+    parser.add_argument(
+        '--skip-existing',
+        dest='skip_existing',
+        action='store_true',
+        help='skip the files already uploaded to the vault (same tree hash and size in the log).'
+    )
+    parser.add_argument(
+        '-r',
+        '--region',
+        help='aws region of the jobs that don\'t give one'
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        default='uploaded_log.db',
+        help='catalog (SQLite) of the uploaded archives and the jobs. defaults to uploaded_log.db'
+    )
+    parser.set_defaults(retry_base_delay=1.0, retry_max_delay=60.0, retry_on=','.join(RETRYABLE_ERRORS))
+    return parser
+
+
+def setup_submit_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload submit',
+        description='queue an upload job to the daemon started with glacier-upload serve',
+        )
+    parser.add_argument(
+        'file',
+        metavar='file',
+        type=str,
+        nargs='+',
+        help='uploaded file(s), directories or glob patterns'
+        )
+    parser.add_argument(
+        'vault_name',
+        type=str,
+        help='glacier vault name'
+        )
+    parser.add_argument(
+        '-p',
+        '--priority',
+        default=0,
+        type=int,
+        help='jobs with a higher priority are started first. defaults to 0.'
+    )
+    parser.add_argument(
+        '-m',
+        '--multipart',
+        action='store_true',
+        help='use multipart upload for the files larger than a part'
+    )
+    parser.add_argument(
+        '-s',
+        '--part-size',
+        dest='part_size',
+        default=8,
+        type=part_size_type,
+        help='part size in megabytes or auto. defaults to 8.'
+    )
+    parser.add_argument(
+        '-d',
+        '--description',
+        default='',
+        help='description of the upload'
+    )
+    parser.add_argument(
+        '--pack',
+        metavar='SIZE_MB',
+        type=int,
+        help='pack the files smaller than a part into tar archives of about this size in megabytes.'
+    )
+    parser.add_argument(
+        '-r',
+        '--region',
+        help='aws region (where the vault is located in). defaults to the one of the daemon.'
+    )
+    parser.add_argument(
+        '--socket',
+        default='glacier-upload.sock',
+        help='unix socket of the daemon. defaults to glacier-upload.sock'
+    )
+    return parser
+
+
+def setup_status_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload status',
+        description='show the jobs of the daemon started with glacier-upload serve (as json)',
+        )
+    parser.add_argument(
+        'job_id',
+        type=int,
+        nargs='?',
+        help='show only this job (and the progress of its vault if it is running)'
+        )
+    parser.add_argument(
+        '--state',
+        choices=('queued', 'running', 'done', 'failed', 'cancelled'),
+        help='show only the jobs in this state'
+    )
+    parser.add_argument(
+        '--cancel',
+        action='store_true',
+        help='cancel the (queued) job'
+    )
+    parser.add_argument(
+        '--socket',
+        default='glacier-upload.sock',
+        help='unix socket of the daemon. defaults to glacier-upload.sock'
+    )
+    return parser
+
+
+def setup_coordinate_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload coordinate',
+        usage='%(prog)s [options] --shards N file vault_name\n'
+              '       %(prog)s [options] --upload-id upload_id',
+        description='start a multipart upload that is split into shards uploaded by workers on several hosts '
+                    '(glacier-upload shard), wait for the shards and complete the upload. the plan and the reports of '
+                    'the workers are kept in a directory they all share.',
+        )
+    parser.add_argument(
+        'file',
+        type=str,
+        nargs='?',
+        help='uploaded file (on storage the workers share)'
+        )
+    parser.add_argument(
+        'vault_name',
+        type=str,
+        nargs='?',
+        help='glacier vault name'
+        )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        help='amount of shards (workers). less if the file has less parts.'
+    )
+    parser.add_argument(
+        '--upload-id',
+        dest='upload_id',
+        help='wait for the shards of an upload that has already been started and complete it'
+    )
+    parser.add_argument(
+        '--plan-dir',
+        dest='plan_dir',
+        default='glacier-upload.plans',
+        help='directory shared by the coordinator and the workers. defaults to glacier-upload.plans'
+    )
+    parser.add_argument(
+        '-s',
+        '--part-size',
+        dest='part_size',
+        default='4',
+        type=part_size_type,
+        help='part size in megabytes or auto. defaults to 4.'
+    )
+    parser.add_argument(
+        '-d',
+        '--desc',
+        default='',
+        help='description of the uploaded content'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help='seconds to wait for the shards. the upload is left open (to be completed with --upload-id) if they '
+             'aren\'t done in time. waits until they are done by default.'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        default=5.0,
+        type=float,
+        help='seconds between the checks of the reports of the workers. defaults to 5.'
+    )
+    parser.add_argument(
+        '--retries',
+        default=5,
+        type=int,
+        help='maximum attempts for each call to glacier. defaults to 5.'
+    )
+    parser.add_argument(
+        '-r',
+        '--region',
+        help='aws region (where the vault is located in)'
+    )
+    parser.add_argument(
+        '--endpoint-url',
+        dest='endpoint_url',
+        help='glacier endpoint used in place of the one of the region (e.g. a vpc endpoint or a local stand-in)'
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        default='uploaded_log.db',
+        help='catalog (SQLite) for the responses from glacier. defaults to uploaded_log.db'
+    )
+    parser.set_defaults(retry_base_delay=1.0, retry_max_delay=60.0, retry_on=','.join(RETRYABLE_ERRORS))
+    return parser
+
+
+def setup_shard_parser():
+    parser = argparse.ArgumentParser(
+        prog='glacier-upload shard',
+        description='upload a shard of an upload started with glacier-upload coordinate and report it to the '
+                    'coordinator',
+        )
+    parser.add_argument(
+        '--upload-id',
+        dest='upload_id',
+        required=True,
+        help='id of the upload (logged by the coordinator)'
+    )
+    parser.add_argument(
+        '--shard',
+        required=True,
+        type=int,
+        help='number of the shard uploaded by this worker (from 1)'
+    )
+    parser.add_argument(
+        '--plan-dir',
+        dest='plan_dir',
+        default='glacier-upload.plans',
+        help='directory shared by the coordinator and the workers. defaults to glacier-upload.plans'
+    )
+    parser.add_argument(
+        '--file',
+        help='path to the file on this host if it is mounted elsewhere than on the coordinator'
+    )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        default=1,
+        type=int,
+        help='amount of parts uploaded in parallel. defaults to 1.'
+    )
+    parser.add_argument(
+        '--max-memory',
+        dest='max_memory',
+        type=int,
+        help='upper limit in megabytes for the part data held in memory at once. no limit by default.'
+    )
+    parser.add_argument(
+        '--max-rate',
+        dest='max_rate',
+        type=rate_type,
+        help='upper limit for the upload rate of this worker, e.g. 50MB/s. not limited by default.'
+    )
+    parser.add_argument(
+        '--retries',
+        default=5,
+        type=int,
+        help='maximum attempts for each call to glacier (e.g. a part upload). defaults to 5.'
+    )
+    parser.add_argument(
+        '--progress',
+        action='store_true',
+        help='show a progress line with the throughput, eta and part latency (on stderr).'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        dest='metrics_file',
+        help='write a summary of the throughput and part latencies of this worker to this file at exit.'
+    )
+    parser.add_argument(
+        '--endpoint-url',
+        dest='endpoint_url',
+        help='glacier endpoint used in place of the one of the region (e.g. a vpc endpoint or a local stand-in)'
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        default='uploaded_log.db',
+        help='catalog (SQLite) of this worker. defaults to uploaded_log.db'
+    )
+    parser.set_defaults(retry_base_delay=1.0, retry_max_delay=60.0, retry_on=','.join(RETRYABLE_ERRORS))
+    return parser
+
+
 def main():
+    if sys.argv[1:2] == ["hash"]:
+        hash_files(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["retrieve"]:
+        retrieve_files(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["submit"]:
+        submit_job(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["status"]:
+        job_status(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["coordinate"]:
+        coordinate(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["shard"]:
+        upload_shard(sys.argv[2:])
+        return
     parser = setup_parser()
     args = parser.parse_args()
     settings = vars(args)
+    if settings.get("resume"):
+        resume(settings)
+        return
+    targets = settings.get("file")
+    if targets and not settings.get("vault_name"):
+        settings.update({"vault_name": targets.pop()})
+    if settings.get("from_file"):
+        targets.extend(read_file_list(settings.get("from_file")))
+    if not targets or not settings.get("vault_name"):
+        parser.error("the following arguments are required: file, vault_name")
+    rate_limiter = get_rate_limiter(settings)
     glacier = GlacierLib(
         vault_name=settings.get("vault_name"),
         upload_log=settings.get("log_file"),
-        region_name=settings.get("region_name"),
+        region_name=settings.get("region"),
+        workers=settings.get("concurrency"),
+        max_memory=settings.get("max_memory"),
+        retry_policy=get_retry_policy(settings),
+        skip_existing=settings.get("skip_existing"),
+        adaptive=settings.get("adaptive"),
+        rate_limiter=rate_limiter,
+        vault_cache_ttl=settings.get("vault_cache_ttl"),
+        replicas=get_replicas(settings, rate_limiter),
+        compression=settings.get("compress"),
+        compression_level=settings.get("compress_level"),
+        read_ahead=settings.get("read_ahead"),
+        drop_cache=not settings.get("keep_cache"),
+        endpoint_url=settings.get("endpoint_url"),
+        )
+    with glacier, instrumented(glacier, settings):
+        upload(glacier, targets, settings)
+
+
+def upload(glacier, targets, settings):
+    if targets == ["-"]:
+        glacier.stream_upload(
+            sys.stdin.buffer,
+            part_size=settings.get("part_size"),
+            description=settings.get("desc"),
+        )
+        return
+    paths = collect_files(targets)
+    if len(paths) != 1 or paths != targets:
+        glacier.upload_files(
+            paths,
+            multipart=settings.get("multipart"),
+            part_size=settings.get("part_size"),
+            description=settings.get("desc"),
+            pack_size=settings.get("pack"),
         )
+        return
     upload_args = {
-        "path_to_file": settings.get("file"),
+        "path_to_file": paths[0],
         "part_size": settings.get("part_size"),
         "description": settings.get("desc"),
     }
@@ -74,5 +792,232 @@ def main():
         glacier.upload(**upload_args)
 
 
+def resume(settings):
+    journal = Journal(settings.get("log_file"), settings.get("resume"))
+    details = dict()
+    if journal.exists():
+        details, _ = journal.load()
+    glacier = GlacierLib(
+        vault_name=details.get("vault_name", settings.get("vault_name")),
+        upload_log=settings.get("log_file"),
+        region_name=settings.get("region") or details.get("region_name"),
+        workers=settings.get("concurrency"),
+        max_memory=settings.get("max_memory"),
+        retry_policy=get_retry_policy(settings),
+        adaptive=settings.get("adaptive"),
+        rate_limiter=get_rate_limiter(settings),
+        vault_cache_ttl=settings.get("vault_cache_ttl"),
+        read_ahead=settings.get("read_ahead"),
+        drop_cache=not settings.get("keep_cache"),
+        endpoint_url=settings.get("endpoint_url"),
+        )
+    with glacier, instrumented(glacier, settings):
+        glacier.resume_multipart_upload(settings.get("resume"))
+
+
+@contextmanager
+def instrumented(glacier, settings):
+    """Shows the progress line while uploading and writes the metrics summary at exit."""
+    reporter = ProgressReporter(glacier.metrics) if settings.get("progress") else None
+    if reporter:
+        reporter.start()
+    try:
+        yield
+    finally:
+        if reporter:
+            reporter.stop()
+        if settings.get("metrics_file"):
+            glacier.metrics.write_summary(settings.get("metrics_file"))
+
+
+def hash_files(argv):
+    settings = vars(setup_hash_parser().parse_args(argv))
+    mismatch = False
+    for path_to_file in settings.get("file"):
+        try:
+            checksum = file_tree_hash(path_to_file, workers=settings.get("workers"))
+        except OSError as error:
+            sys.exit(f"Could not hash {path_to_file}: {error.strerror}")
+        print(f"{checksum}  {path_to_file}")
+        if settings.get("check") and checksum != settings.get("check").lower():
+            mismatch = True
+    if mismatch:
+        sys.exit(1)
+
+
+def retrieve_files(argv):
+    settings = vars(setup_retrieve_parser().parse_args(argv))
+    glacier = RetrievalLib(
+        vault_name=settings.get("vault_name"),
+        tier=settings.get("tier"),
+        poll_interval=settings.get("poll_interval"),
+        upload_log=settings.get("log_file"),
+        region_name=settings.get("region"),
+        workers=settings.get("concurrency"),
+        retry_policy=get_retry_policy(settings),
+        endpoint_url=settings.get("endpoint_url"),
+        )
+    with glacier, instrumented(glacier, settings):
+        results = glacier.retrieve(
+            settings.get("target"), output_dir=settings.get("output_dir"), part_size=settings.get("part_size")
+        )
+    if not all(results.values()):
+        sys.exit(1)
+
+
+def serve(argv):
+    settings = vars(setup_serve_parser().parse_args(argv))
+    daemon = UploadDaemon(
+        upload_log=settings.get("log_file"),
+        socket_path=settings.get("socket"),
+        spool_dir=settings.get("spool"),
+        max_jobs=settings.get("jobs"),
+        poll_interval=settings.get("poll_interval"),
+        region_name=settings.get("region"),
+        workers=settings.get("concurrency"),
+        max_memory=settings.get("max_memory"),
+        retry_policy=get_retry_policy(settings),
+        skip_existing=settings.get("skip_existing"),
+        rate_limiter=get_rate_limiter(settings),
+        )
+    # Stopped cleanly (the running jobs finish) on SIGTERM as on Ctrl-C.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with daemon:
+        daemon.wait()
+
+
+def submit_job(argv):
+    settings = vars(setup_submit_parser().parse_args(argv))
+    request = {
+        "command": "submit",
+        "paths": [str(Path(target).absolute()) for target in settings.get("file")],
+        "vault_name": settings.get("vault_name"),
+        "priority": settings.get("priority"),
+        "region_name": settings.get("region"),
+        "multipart": settings.get("multipart"),
+        "part_size": settings.get("part_size"),
+        "description": settings.get("description"),
+        "pack_size": settings.get("pack"),
+    }
+    request_daemon(settings.get("socket"), request)
+
+
+def job_status(argv):
+    settings = vars(setup_status_parser().parse_args(argv))
+    if settings.get("cancel"):
+        request = {"command": "cancel", "job_id": settings.get("job_id")}
+    elif settings.get("job_id") is not None:
+        request = {"command": "status", "job_id": settings.get("job_id")}
+    else:
+        request = {"command": "list", "state": settings.get("state")}
+    request_daemon(settings.get("socket"), request)
+
+
+def coordinate(argv):
+    parser = setup_coordinate_parser()
+    settings = vars(parser.parse_args(argv))
+    upload_id = settings.get("upload_id")
+    vault_name = settings.get("vault_name")
+    region_name = settings.get("region")
+    if upload_id:
+        plan = ShardPlan(settings.get("plan_dir"), upload_id)
+        if not plan.exists():
+            sys.exit(f"No plan found for the upload {upload_id} in {settings.get('plan_dir')}.")
+        details = plan.load()
+        vault_name = details.get("vault_name")
+        region_name = region_name or details.get("region_name")
+    elif not settings.get("file") or not vault_name or not settings.get("shards"):
+        parser.error("the following arguments are required: --shards, file, vault_name (or --upload-id)")
+    glacier = GlacierLib(
+        vault_name=vault_name,
+        upload_log=settings.get("log_file"),
+        region_name=region_name,
+        retry_policy=get_retry_policy(settings),
+        endpoint_url=settings.get("endpoint_url"),
+        )
+    with glacier:
+        if not upload_id:
+            upload_id = glacier.start_distributed_upload(
+                settings.get("file"),
+                settings.get("shards"),
+                settings.get("plan_dir"),
+                part_size=settings.get("part_size"),
+                description=settings.get("desc"),
+            )
+        completed = upload_id and glacier.complete_distributed_upload(
+            settings.get("plan_dir"),
+            upload_id,
+            timeout=settings.get("timeout"),
+            poll_interval=settings.get("poll_interval"),
+        )
+    if not completed:
+        sys.exit(1)
+
+
+def upload_shard(argv):
+    settings = vars(setup_shard_parser().parse_args(argv))
+    plan = ShardPlan(settings.get("plan_dir"), settings.get("upload_id"))
+    details = plan.load() if plan.exists() else dict()
+    glacier = GlacierLib(
+        vault_name=details.get("vault_name"),
+        upload_log=settings.get("log_file"),
+        region_name=details.get("region_name"),
+        workers=settings.get("concurrency"),
+        max_memory=settings.get("max_memory"),
+        retry_policy=get_retry_policy(settings),
+        rate_limiter=get_rate_limiter(settings),
+        endpoint_url=settings.get("endpoint_url"),
+        )
+    with glacier, instrumented(glacier, settings):
+        uploaded = glacier.upload_shard(
+            settings.get("plan_dir"),
+            settings.get("upload_id"),
+            settings.get("shard"),
+            path_to_file=settings.get("file"),
+        )
+    if not uploaded:
+        sys.exit(1)
+
+
+def request_daemon(socket_path, request):
+    try:
+        response = send_request(socket_path, request)
+    except OSError as error:
+        sys.exit(f"Could not reach the daemon at {socket_path}: {error}")
+    print(json.dumps(response, indent=4))
+    if not response.get("ok"):
+        sys.exit(1)
+
+
+def get_replicas(settings, rate_limiter):
+    return [
+        GlacierLib(
+            vault_name=vault_name,
+            upload_log=settings.get("log_file"),
+            region_name=region_name,
+            workers=settings.get("concurrency"),
+            retry_policy=get_retry_policy(settings),
+            rate_limiter=rate_limiter,
+            vault_cache_ttl=settings.get("vault_cache_ttl"),
+        )
+        for region_name, vault_name in settings.get("replicate_to")
+    ]
+
+
+def get_retry_policy(settings):
+    return RetryPolicy(
+        max_attempts=settings.get("retries"),
+        base_delay=settings.get("retry_base_delay"),
+        max_delay=settings.get("retry_max_delay"),
+        retryable=[name.strip() for name in settings.get("retry_on").split(",") if name.strip()],
+    )
+
+
+def get_rate_limiter(settings):
+    if not settings.get("max_rate") and not settings.get("rate_schedule"):
+        return None
+    return RateLimiter(rate=settings.get("max_rate"), schedule=settings.get("rate_schedule"))
+
+
 if __name__ == "__main__":
     main()
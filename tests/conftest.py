@@ -3,6 +3,7 @@ from random import randint
 import pytest
 import boto3
 from botocore.stub import Stubber
+from glacier_upload.libraries.local_glacier import LocalGlacier, local_client
 path = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -35,3 +36,13 @@ def boto3_stub():
     client = boto3.client('s3')
     stubber = Stubber(client)
     return stubber
+
+
+@pytest.fixture
+def local_glacier():
+    return LocalGlacier(vaults=("test_vault",))
+
+
+@pytest.fixture
+def client(local_glacier):
+    return local_client(local_glacier, workers=3)
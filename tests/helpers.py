@@ -0,0 +1,11 @@
+from glacier_upload.libraries.glacier_library import GlacierLib
+
+
+def local_lib(client, tmp_path, glacier_class=GlacierLib, **kwargs):
+    """A GlacierLib (or a subclass) uploading to the test_vault of the local Glacier."""
+    return glacier_class('test_vault', upload_log=str(tmp_path / "uploaded_log.db"), client=client, **kwargs)
+
+
+def read(path_to_file):
+    with open(path_to_file, "rb") as file_object:
+        return file_object.read()
@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from glacier_upload.libraries.async_glacier_library import AsyncGlacierLib
+from glacier_upload.libraries.compress_stream import decompress
+from glacier_upload.libraries.tree_hash import file_tree_hash
+from .helpers import local_lib, read
+
+
+def test_multipart_upload(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=3)
+    events = []
+
+    async def progress(event):
+        events.append(event)
+
+    assert asyncio.run(glacier_lib.async_multipart_upload(path_to_file, part_size=1, progress=progress))
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    archive = local_glacier.archive("test_vault", record.get("archive_id"))
+    assert archive.get("checksum") == record.get("checksum") == file_tree_hash(path_to_file)
+    assert archive.get("data") == read(path_to_file)
+    assert [event.get("parts_done") for event in events] == [1, 2, 3, 4, 5]
+    assert events[-1].get("bytes_done") == 4294304
+    assert not list((tmp_path / "uploaded_log.journal").iterdir())
+
+
+def test_blocking_uploads_still_work(client, test_files, tmp_path):
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=2)
+    assert glacier_lib.upload(test_files[0].get("file_path")) is True
+    assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1) is True
+    assert len(glacier_lib.storage.archives()) == 2
+
+
+def test_compressed_upload_part_size(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=2, compression="gzip")
+    initiate = glacier_lib._initiate_multipart_upload
+    part_sizes = []
+
+    def tracked_initiate(description, part_size_bytes, total_size=None):
+        part_sizes.append(part_size_bytes)
+        return initiate(description, part_size_bytes, total_size)
+
+    glacier_lib._initiate_multipart_upload = tracked_initiate
+    assert asyncio.run(glacier_lib.async_upload(path_to_file, part_size=1))
+    assert part_sizes == [1048576]
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    archive = local_glacier.archive("test_vault", record.get("archive_id"))
+    assert decompress(archive.get("data"), "gzip") == read(path_to_file)
+
+
+def test_concurrent_uploads_share_limit(local_glacier, client, tmp_path):
+    local_glacier.latency = 0.01
+    paths = []
+    for index in range(40):
+        path_to_file = tmp_path / f"small_{index}.txt"
+        path_to_file.write_bytes(f"small file {index}".encode() * 100)
+        paths.append(str(path_to_file))
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=3, max_in_flight=2)
+    peak = []
+
+    def progress(event):
+        peak.append(glacier_lib.limit.parts_in_flight)
+
+    async def upload_all():
+        return await asyncio.gather(
+            *[glacier_lib.async_upload(path_to_file, progress=progress) for path_to_file in paths]
+        )
+
+    assert all(asyncio.run(upload_all()))
+    assert len(glacier_lib.storage.archives()) == 40
+    assert max(peak) <= 2
+
+
+def test_cancel_aborts_upload(local_glacier, client, test_files, tmp_path):
+    local_glacier.latency = 0.05
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=1)
+    first_part = None
+
+    async def upload_and_cancel():
+        nonlocal first_part
+        first_part = asyncio.Event()
+        task = asyncio.ensure_future(
+            glacier_lib.async_multipart_upload(path_to_file, part_size=1, progress=lambda event: first_part.set())
+        )
+        await first_part.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(upload_and_cancel())
+    assert not local_glacier.uploads
+    assert glacier_lib.storage.archives() == []
+    assert not list((tmp_path / "uploaded_log.journal").iterdir())
+
+
+def test_part_calls(local_glacier, client, tmp_path):
+    data = bytes(range(256)) * 8192
+    glacier_lib = local_lib(client, tmp_path, AsyncGlacierLib, workers=2)
+
+    async def upload_in_parts():
+        upload_id = (await glacier_lib.initiate_multipart_upload("parts", 1048576)).get("uploadId")
+        parts = await asyncio.gather(
+            glacier_lib.upload_part(upload_id, data[1048576:], 1048576),
+            glacier_lib.upload_part(upload_id, data[:1048576], 0),
+        )
+        assert all([part.get("success") for part in parts])
+        return await glacier_lib.complete_multipart_upload(upload_id, parts)
+
+    response = asyncio.run(upload_in_parts())
+    assert local_glacier.archive("test_vault", response.get("archiveId")).get("data") == data
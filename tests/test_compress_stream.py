@@ -0,0 +1,55 @@
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from glacier_upload.libraries import compress_stream
+from glacier_upload.libraries.tree_hash import leaf_hashes, tree_hash
+
+
+class TrickleStream(io.RawIOBase):
+    """A pipe returning at most a few bytes per read."""
+    def __init__(self, data, chunk_size):
+        self._data = io.BytesIO(data)
+        self._chunk_size = chunk_size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._data.read(min(size, self._chunk_size))
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        yield executor
+
+
+@pytest.mark.parametrize("codec", sorted(compress_stream.CODECS))
+def test_frames_decompress_to_original(executor, codec):
+    data = os.urandom(1048576) + b"log line\n" * 400000
+    stream = compress_stream.CompressStream(io.BytesIO(data), codec, executor, level=1, block_size=1048576)
+    compressed = stream.read()
+    assert compress_stream.decompress(compressed, codec) == data
+    assert stream.original_size == len(data)
+    assert stream.compressed_size == len(compressed) < len(data)
+    assert stream.original_checksum == tree_hash(leaf_hashes(data))
+
+
+def test_frames_independent(executor):
+    data = b"a" * 1048576 + b"b" * 1048576
+    stream = compress_stream.CompressStream(io.BytesIO(data), "gzip", executor, block_size=1048576)
+    compressed = stream.read()
+    first_frame = compress_stream.compress_block(data[:1048576], "gzip", 6)[0]
+    assert compressed.startswith(first_frame)
+    assert gzip.decompress(compressed[len(first_frame):]) == b"b" * 1048576
+
+
+def test_short_reads_and_empty_source(executor):
+    data = b"0123456789" * 300000
+    stream = compress_stream.CompressStream(TrickleStream(data, 4096), "xz", executor, block_size=1048576)
+    assert compress_stream.decompress(stream.read(), "xz") == data
+    empty = compress_stream.CompressStream(io.BytesIO(b""), "bz2", executor)
+    assert compress_stream.decompress(empty.read(), "bz2") == b""
+    assert empty.original_size == 0
@@ -0,0 +1,80 @@
+import threading
+from botocore.exceptions import ClientError
+from glacier_upload.libraries.concurrency_controller import ConcurrencyController, is_throttling
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def complete_window(controller, clock, size, seconds=1.0):
+    """Completes a window of parts that took the given time in total."""
+    clock.now += seconds
+    for _ in range(controller.limit):
+        controller.completed(size, seconds)
+
+
+def test_slow_start_doubles_while_improving():
+    clock = FakeClock()
+    controller = ConcurrencyController(16, clock=clock)
+    for limit in (1, 2, 4, 8):
+        assert controller.limit == limit
+        complete_window(controller, clock, 1048576)
+    assert controller.limit == 16
+
+
+def test_holds_when_goodput_stops_improving():
+    clock = FakeClock()
+    controller = ConcurrencyController(16, probe_after=3, clock=clock)
+    complete_window(controller, clock, 1048576)
+    complete_window(controller, clock, 1048576)
+    assert controller.limit == 4
+    complete_window(controller, clock, 524288)
+    assert controller.limit == 4
+    complete_window(controller, clock, 524288)
+    complete_window(controller, clock, 524288)
+    assert controller.limit == 5
+
+
+def test_decreases_when_goodput_drops():
+    clock = FakeClock()
+    controller = ConcurrencyController(16, clock=clock)
+    complete_window(controller, clock, 1048576)
+    complete_window(controller, clock, 1048576)
+    complete_window(controller, clock, 131072)
+    assert controller.limit == 3
+
+
+def test_throttled_halves_once_per_window():
+    clock = FakeClock()
+    controller = ConcurrencyController(16, clock=clock)
+    for _ in range(4):
+        complete_window(controller, clock, 1048576)
+    assert controller.limit == 16
+    controller.throttled()
+    controller.throttled()
+    assert controller.limit == 8
+    assert controller.peak_limit == 16
+
+
+def test_acquire_blocks_at_limit():
+    controller = ConcurrencyController(4)
+    controller.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    controller.release()
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_is_throttling():
+    throttled = ClientError({"Error": {"Code": "ThrottlingException"}}, "UploadMultipartPart")
+    not_found = ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "UploadMultipartPart")
+    assert is_throttling(throttled)
+    assert not is_throttling(not_found)
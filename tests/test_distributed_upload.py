@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from glacier_upload.libraries.glacier_library import GlacierLib
+from glacier_upload.libraries.local_glacier import LocalGlacierServer
+from glacier_upload.libraries.response_storage import Storage
+from glacier_upload.libraries.shard_plan import ShardPlan
+from glacier_upload.libraries.tree_hash import file_tree_hash
+from .helpers import read
+
+
+@pytest.fixture
+def endpoint_url(local_glacier):
+    server = LocalGlacierServer(local_glacier)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.endpoint_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_upload_completed_once_all_shards_reported(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    plan_dir = tmp_path / "plans"
+    coordinator = GlacierLib("test_vault", upload_log=str(tmp_path / "coordinator.db"), client=client)
+    upload_id = coordinator.start_distributed_upload(path_to_file, 3, str(plan_dir), part_size=1)
+    shards = ShardPlan(plan_dir, upload_id).load().get("shards")
+    assert [shard.get("part_count") for shard in shards] == [2, 2, 1]
+    workers = [
+        GlacierLib("test_vault", upload_log=str(tmp_path / f"worker_{shard}.db"), client=client, workers=2)
+        for shard in (1, 2, 3)
+    ]
+    assert not workers[0].upload_shard(str(plan_dir), upload_id, 4)
+    assert workers[0].upload_shard(str(plan_dir), upload_id, 1)
+    assert workers[1].upload_shard(str(plan_dir), upload_id, 2)
+    assert not coordinator.complete_distributed_upload(str(plan_dir), upload_id, timeout=0)
+    assert upload_id in local_glacier.uploads
+    assert workers[2].upload_shard(str(plan_dir), upload_id, 3)
+    assert coordinator.complete_distributed_upload(str(plan_dir), upload_id, timeout=0)
+    record = coordinator.storage.find_by_path(path_to_file)[0]
+    assert record.get("checksum") == file_tree_hash(path_to_file)
+    assert local_glacier.archive("test_vault", record.get("archive_id")).get("data") == read(path_to_file)
+    assert not list(plan_dir.iterdir())
+
+
+def test_shards_uploaded_from_several_processes(local_glacier, endpoint_url, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    plan_dir = tmp_path / "plans"
+    env = dict(os.environ, AWS_ACCESS_KEY_ID="local", AWS_SECRET_ACCESS_KEY="local")
+    common = ["--plan-dir", str(plan_dir), "--endpoint-url", endpoint_url]
+
+    def glacier_upload(*arguments):
+        return subprocess.Popen(
+            [sys.executable, "-m", "glacier_upload.main", *arguments, *common],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+    coordinator = glacier_upload(
+        "coordinate", "--shards", "3", "-s", "1", "--poll-interval", "0.05", "--timeout", "60", "-r", "us-east-1",
+        "-l", str(tmp_path / "coordinator.db"), path_to_file, "test_vault"
+    )
+    deadline = time.monotonic() + 30
+    while not list(plan_dir.glob("*.plan.json")):
+        assert coordinator.poll() is None, coordinator.stderr.read().decode()
+        assert time.monotonic() < deadline, "no plan written"
+        time.sleep(0.05)
+    upload_id = list(plan_dir.glob("*.plan.json"))[0].name.split(".")[0]
+    workers = [
+        glacier_upload("shard", "--upload-id", upload_id, "--shard", str(shard), "-c", "2",
+                       "-l", str(tmp_path / f"worker_{shard}.db"))
+        for shard in (1, 2, 3)
+    ]
+    for worker in workers:
+        assert worker.wait(60) == 0, worker.stderr.read().decode()
+    assert coordinator.wait(60) == 0, coordinator.stderr.read().decode()
+    record = Storage(file_name=str(tmp_path / "coordinator.db")).find_by_path(path_to_file)[0]
+    assert local_glacier.archive("test_vault", record.get("archive_id")).get("data") == read(path_to_file)
+    assert not local_glacier.uploads
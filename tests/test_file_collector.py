@@ -0,0 +1,37 @@
+import os
+from glacier_upload.libraries import file_collector
+
+
+def make_tree(tmp_path):
+    (tmp_path / "logs" / "old").mkdir(parents=True)
+    for name in ["logs/a.gz", "logs/b.txt", "logs/old/c.gz"]:
+        (tmp_path / name).write_text(name)
+
+
+def test_collect_files_directory(tmp_path):
+    make_tree(tmp_path)
+    files = file_collector.collect_files([str(tmp_path / "logs")])
+    assert [os.path.relpath(path, tmp_path) for path in files] == [
+        os.path.join("logs", "a.gz"),
+        os.path.join("logs", "b.txt"),
+        os.path.join("logs", "old", "c.gz"),
+    ]
+
+
+def test_collect_files_glob_without_duplicates(tmp_path):
+    make_tree(tmp_path)
+    files = file_collector.collect_files([str(tmp_path / "logs" / "**" / "*.gz"), str(tmp_path / "logs" / "a.gz")])
+    assert [os.path.relpath(path, tmp_path) for path in files] == [
+        os.path.join("logs", "a.gz"),
+        os.path.join("logs", "old", "c.gz"),
+    ]
+
+
+def test_collect_files_keeps_missing(tmp_path):
+    assert file_collector.collect_files(["no_file.txt"]) == ["no_file.txt"]
+
+
+def test_read_file_list(tmp_path):
+    list_file = tmp_path / "files.txt"
+    list_file.write_text("a.txt\n\n  b.txt \n")
+    assert file_collector.read_file_list(str(list_file)) == ["a.txt", "b.txt"]
@@ -1,10 +1,227 @@
+from io import BytesIO
 import pytest
-from botocore.stub import Stubber
+from botocore.stub import Stubber, ANY
 from glacier_upload.libraries.glacier_library import GlacierLib
+from glacier_upload.libraries.partlify import get_file_fingerprint, get_needed_parts, add_byte_ranges
+from glacier_upload.libraries.response_storage import Storage
+from glacier_upload.libraries.retry_policy import RetryPolicy
+from glacier_upload.libraries.tree_hash import file_tree_hash, leaf_hashes, tree_hash
+from glacier_upload.libraries.upload_journal import Journal
 
 
 @pytest.fixture
-def glacier_lib(boto3_stub, temp_json):
-    with boto3_stub:
-        glacier = GlacierLib('test_vault', upload_log=temp_json)
+def glacier_lib(temp_json):
+    glacier = GlacierLib('test_vault', upload_log=temp_json, region_name='us-east-1')
     return glacier
+
+
+def part_response(status_code=204):
+    return {
+        "checksum": "0" * 64,
+        "ResponseMetadata": {"HTTPStatusCode": status_code},
+    }
+
+
+def test_do_multipart_upload_parallel(glacier_lib, test_files):
+    path_to_file = test_files[1].get("file_path")
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 1048576, 4294304))
+    with Stubber(glacier_lib.client) as stubber:
+        for _ in parts:
+            stubber.add_response("upload_multipart_part", part_response(), {
+                "vaultName": "test_vault",
+                "uploadId": "upload_id",
+                "range": ANY,
+                "body": ANY,
+                "checksum": ANY,
+            })
+        success = glacier_lib._do_multipart_upload("upload_id", path_to_file, parts, workers=3)
+        stubber.assert_no_pending_responses()
+    assert success
+    assert all([part.get("success") for part in parts])
+    assert [len(part.get("leaf_hashes")) for part in parts] == [1, 1, 1, 1, 1]
+
+
+def test_do_multipart_upload_failed_part(glacier_lib, test_files):
+    path_to_file = test_files[1].get("file_path")
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 1048576, 4294304))
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("upload_multipart_part", part_response(500))
+        success = glacier_lib._do_multipart_upload("upload_id", path_to_file, parts, workers=1)
+    assert not success
+    assert parts[0].get("success") is False
+    assert not any([part.get("success") for part in parts])
+
+
+def test_do_multipart_upload_memory_limit(glacier_lib, test_files):
+    path_to_file = test_files[1].get("file_path")
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 1048576, 4294304))
+    glacier_lib.max_memory = 2
+    with Stubber(glacier_lib.client) as stubber:
+        for _ in parts:
+            stubber.add_response("upload_multipart_part", part_response())
+        success = glacier_lib._do_multipart_upload("upload_id", path_to_file, parts, workers=4)
+    assert success
+
+
+def test_resume_multipart_upload(glacier_lib, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib.storage = Storage(file_name=str(tmp_path / "uploaded.json"))
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 1048576, 4294304))
+    glacier_lib._hash_parts(path_to_file, parts)
+    journal = Journal(glacier_lib.storage.file_name, "upload_id")
+    journal.start({
+        "path_to_file": path_to_file,
+        "vault_name": "test_vault",
+        "part_size": 1048576,
+        "total_size": 4294304,
+    })
+    journal.add_part(parts[0])
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("list_parts", {
+            "Parts": [
+                {"RangeInBytes": "0-1048575", "SHA256TreeHash": parts[0].get("checksum")},
+                {"RangeInBytes": "1048576-2097151", "SHA256TreeHash": parts[1].get("checksum")},
+            ],
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }, {"vaultName": "test_vault", "uploadId": "upload_id"})
+        for part in parts[2:]:
+            stubber.add_response("upload_multipart_part", part_response(), {
+                "vaultName": "test_vault",
+                "uploadId": "upload_id",
+                "range": part.get("range"),
+                "body": ANY,
+                "checksum": part.get("checksum"),
+            })
+        stubber.add_response("complete_multipart_upload", {
+            "archiveId": "archive_id",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        }, {
+            "vaultName": "test_vault",
+            "uploadId": "upload_id",
+            "archiveSize": "4294304",
+            "checksum": tree_hash([leaf for part in parts for leaf in part.get("leaf_hashes")]),
+        })
+        glacier_lib.resume_multipart_upload("upload_id", workers=1)
+        stubber.assert_no_pending_responses()
+    assert not journal.exists()
+
+
+def test_do_multipart_upload_retries_part(glacier_lib, test_files):
+    path_to_file = test_files[1].get("file_path")
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 2097152, 4294304))
+    glacier_lib.retry_policy = RetryPolicy(base_delay=0)
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_client_error("upload_multipart_part", "ServiceUnavailableException", http_status_code=503)
+        for _ in parts:
+            stubber.add_response("upload_multipart_part", part_response())
+        success = glacier_lib._do_multipart_upload("upload_id", path_to_file, parts, workers=1)
+    assert success
+    assert parts[0].get("retries") == 1
+    assert glacier_lib.retry_count == 1
+
+
+def test_do_multipart_upload_gives_up(glacier_lib, test_files):
+    path_to_file = test_files[1].get("file_path")
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 2097152, 4294304))
+    glacier_lib.retry_policy = RetryPolicy(max_attempts=2, base_delay=0)
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_client_error("upload_multipart_part", "ThrottlingException", http_status_code=400)
+        stubber.add_client_error("upload_multipart_part", "ThrottlingException", http_status_code=400)
+        success = glacier_lib._do_multipart_upload("upload_id", path_to_file, parts, workers=1)
+    assert not success
+    assert parts[0].get("retries") == 1
+
+
+def test_upload_files(glacier_lib, test_files, tmp_path):
+    glacier_lib.storage = Storage(file_name=str(tmp_path / "uploaded.db"))
+    small_file = test_files[0].get("file_path")
+    large_file = test_files[1].get("file_path")
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("describe_vault", {
+            "VaultName": "test_vault",
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        })
+        stubber.add_response("upload_archive", {
+            "archiveId": "small_archive",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        }, {"vaultName": "test_vault", "archiveDescription": "", "checksum": ANY, "body": ANY})
+        stubber.add_response("initiate_multipart_upload", {
+            "uploadId": "upload_id",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        }, {"vaultName": "test_vault", "archiveDescription": "", "partSize": "2097152"})
+        for _ in range(3):
+            stubber.add_response("upload_multipart_part", part_response())
+        stubber.add_response("complete_multipart_upload", {
+            "archiveId": "large_archive",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        })
+        results = glacier_lib.upload_files(
+            [small_file, large_file, "no_file.txt"], multipart=True, part_size=2
+        )
+        stubber.assert_no_pending_responses()
+    assert results == {small_file: True, large_file: True, "no_file.txt": False}
+    assert [archive.get("archive_id") for archive in glacier_lib.storage.find_by_path(large_file)] == ["large_archive"]
+
+
+def test_upload_skip_existing(glacier_lib, test_files, tmp_path):
+    path_to_file = test_files[0].get("file_path")
+    glacier_lib.storage = Storage(file_name=str(tmp_path / "uploaded.db"))
+    glacier_lib.skip_existing = True
+    glacier_lib.storage.save(
+        {"archiveId": "archive_id", "checksum": file_tree_hash(path_to_file)},
+        path_to_file="elsewhere.txt",
+        vault_name="test_vault",
+        size=16,
+    )
+    vault = {"VaultName": "test_vault", "ResponseMetadata": {"HTTPStatusCode": 200}}
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("describe_vault", vault, {"vaultName": "test_vault"})
+        assert glacier_lib.upload(path_to_file)
+        stubber.assert_no_pending_responses()
+    fingerprint = get_file_fingerprint(path_to_file)
+    assert glacier_lib.storage.find_checksum_by_fingerprint(path_to_file, fingerprint) == file_tree_hash(path_to_file)
+
+
+def test_stream_upload(glacier_lib, test_files, tmp_path):
+    glacier_lib.storage = Storage(file_name=str(tmp_path / "uploaded.db"))
+    with open(test_files[1].get("file_path"), "rb") as file_object:
+        data = file_object.read()
+    parts = add_byte_ranges(get_needed_parts(None, 2097152, len(data)))
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("describe_vault", {
+            "VaultName": "test_vault",
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        })
+        stubber.add_response("initiate_multipart_upload", {
+            "uploadId": "upload_id",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        }, {"vaultName": "test_vault", "archiveDescription": "", "partSize": "2097152"})
+        for part in parts:
+            stubber.add_response("upload_multipart_part", part_response(), {
+                "vaultName": "test_vault",
+                "uploadId": "upload_id",
+                "range": part.get("range"),
+                "body": ANY,
+                "checksum": ANY,
+            })
+        stubber.add_response("complete_multipart_upload", {
+            "archiveId": "stream_archive",
+            "ResponseMetadata": {"HTTPStatusCode": 201},
+        }, {
+            "vaultName": "test_vault",
+            "uploadId": "upload_id",
+            "archiveSize": str(len(data)),
+            "checksum": tree_hash(leaf_hashes(data)),
+        })
+        assert glacier_lib.stream_upload(BytesIO(data), part_size=2)
+        stubber.assert_no_pending_responses()
+    assert [archive.get("size") for archive in glacier_lib.storage.archives()] == [len(data)]
+
+
+def test_stream_upload_empty(glacier_lib):
+    with Stubber(glacier_lib.client) as stubber:
+        stubber.add_response("describe_vault", {
+            "VaultName": "test_vault",
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        })
+        assert not glacier_lib.stream_upload(BytesIO(b""), part_size=2)
@@ -0,0 +1,341 @@
+import logging
+import os
+import time
+import pytest
+from glacier_upload.libraries.compress_stream import decompress
+from glacier_upload.libraries.glacier_library import GlacierLib
+from glacier_upload.libraries.local_glacier import LocalGlacier, local_client
+from glacier_upload.libraries.partlify import add_byte_ranges, get_file_fingerprint, get_needed_parts
+from glacier_upload.libraries.rate_limiter import RateLimiter
+from glacier_upload.libraries.retry_policy import RetryPolicy
+from glacier_upload.libraries.tree_hash import file_tree_hash, leaf_hashes, tree_hash
+from glacier_upload.libraries.upload_journal import Journal
+from .helpers import local_lib, read
+
+
+def test_multipart_upload(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib = local_lib(client, tmp_path, workers=3)
+    assert glacier_lib.multipart_upload(path_to_file, part_size=1)
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    archive = local_glacier.archive("test_vault", record.get("archive_id"))
+    assert archive.get("checksum") == record.get("checksum") == file_tree_hash(path_to_file)
+    assert archive.get("data") == read(path_to_file)
+    assert not local_glacier.uploads
+
+
+def test_resume_after_file_changed_in_place(local_glacier, client, tmp_path):
+    path_to_file = str(tmp_path / "data.bin")
+    with open(path_to_file, "wb") as file_object:
+        file_object.write(os.urandom(4 * 1048576))
+    glacier_lib = local_lib(client, tmp_path)
+    parts = add_byte_ranges(get_needed_parts(path_to_file, 1048576, 4 * 1048576))
+    upload_id = glacier_lib._initiate_multipart_upload("", 1048576).get("uploadId")
+    journal = Journal(glacier_lib.storage.file_name, upload_id)
+    journal.start({
+        "path_to_file": path_to_file,
+        "vault_name": "test_vault",
+        "part_size": 1048576,
+        "total_size": 4 * 1048576,
+        "fingerprint": get_file_fingerprint(path_to_file),
+    })
+    assert glacier_lib._do_multipart_upload(upload_id, path_to_file, parts[:2], journal=journal)
+    with open(path_to_file, "r+b") as file_object:
+        file_object.seek(10)
+        file_object.write(b"changed")
+    # Same size, a different modification time (even on file systems with coarse timestamps).
+    os.utime(path_to_file, ns=(1, 1))
+    assert glacier_lib.resume_multipart_upload(upload_id)
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    assert record.get("checksum") == file_tree_hash(path_to_file)
+    assert local_glacier.archive("test_vault", record.get("archive_id")).get("data") == read(path_to_file)
+
+
+def test_upload(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[0].get("file_path")
+    glacier_lib = local_lib(client, tmp_path)
+    assert glacier_lib.upload(path_to_file, description="small file")
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    archive = local_glacier.archive("test_vault", record.get("archive_id"))
+    assert archive.get("data") == read(path_to_file)
+    assert archive.get("description") == "small file"
+
+
+def test_missing_vault(client, test_files, tmp_path):
+    glacier_lib = GlacierLib('other_vault', upload_log=str(tmp_path / "uploaded_log.db"), client=client)
+    assert not glacier_lib.upload(test_files[0].get("file_path"))
+
+
+def test_wrong_part_checksum_rejected(client):
+    upload_id = client.initiate_multipart_upload(vaultName="test_vault", partSize="1048576").get("uploadId")
+    with pytest.raises(client.exceptions.InvalidParameterValueException):
+        client.upload_multipart_part(
+            vaultName="test_vault", uploadId=upload_id, range="bytes 0-3/*", body=b"data", checksum="0" * 64
+        )
+
+
+def test_misaligned_range_rejected(client):
+    upload_id = client.initiate_multipart_upload(vaultName="test_vault", partSize="1048576").get("uploadId")
+    with pytest.raises(client.exceptions.InvalidParameterValueException):
+        client.upload_multipart_part(vaultName="test_vault", uploadId=upload_id, range="bytes 4-7/*", body=b"data")
+
+
+def test_incomplete_archive_rejected(client):
+    data = b"x" * 1048576
+    upload_id = client.initiate_multipart_upload(vaultName="test_vault", partSize="1048576").get("uploadId")
+    client.upload_multipart_part(vaultName="test_vault", uploadId=upload_id, range="bytes 1048576-2097151/*", body=data)
+    with pytest.raises(client.exceptions.InvalidParameterValueException):
+        client.complete_multipart_upload(
+            vaultName="test_vault",
+            uploadId=upload_id,
+            archiveSize="2097152",
+            checksum=tree_hash(leaf_hashes(data + data)),
+        )
+
+
+def test_list_parts_paginated(client):
+    upload_id = client.initiate_multipart_upload(vaultName="test_vault", partSize="1048576").get("uploadId")
+    for i in range(3):
+        client.upload_multipart_part(
+            vaultName="test_vault", uploadId=upload_id, range=f"bytes {i * 1048576}-{i * 1048576}/*", body=b"x"
+        )
+    response = client.list_parts(vaultName="test_vault", uploadId=upload_id, limit="2")
+    assert [part.get("RangeInBytes") for part in response.get("Parts")] == ["0-0", "1048576-1048576"]
+    response = client.list_parts(vaultName="test_vault", uploadId=upload_id, marker=response.get("Marker"))
+    assert [part.get("RangeInBytes") for part in response.get("Parts")] == ["2097152-2097152"]
+    assert not response.get("Marker")
+
+
+def test_injected_errors_retried(local_glacier, client, test_files, tmp_path):
+    local_glacier.error_rate = 0.3
+    local_glacier._random.seed(1)
+    glacier_lib = local_lib(client, tmp_path, workers=2, retry_policy=RetryPolicy(max_attempts=10, base_delay=0))
+    assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1)
+    assert local_glacier.failed_count > 0
+    assert glacier_lib.retry_count == local_glacier.failed_count
+
+
+def test_bandwidth_limit(local_glacier, client):
+    local_glacier.bandwidth = 10485760
+    start = time.monotonic()
+    client.upload_archive(vaultName="test_vault", body=b"x" * 2097152)
+    assert time.monotonic() - start >= 0.2
+
+
+def test_adaptive_concurrency_backs_off_when_throttled(local_glacier, client, test_files, tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="glacier_logger")
+    local_glacier.throttle_rate = 0.3
+    local_glacier._random.seed(2)
+    glacier_lib = local_lib(
+        client, tmp_path, workers=4, adaptive=True, retry_policy=RetryPolicy(max_attempts=10, base_delay=0)
+    )
+    glacier_lib.controller.limit = 4
+    assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1)
+    assert local_glacier.failed_count > 0
+    assert "Concurrency 4 -> 2 (throttled)." in caplog.messages
+
+
+def test_rate_limit_shared_by_workers(local_glacier, client, test_files, tmp_path):
+    glacier_lib = local_lib(client, tmp_path, workers=3, rate_limiter=RateLimiter(rate=8388608))
+    start = time.monotonic()
+    assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1)
+    assert glacier_lib.upload(test_files[1].get("file_path"))
+    assert time.monotonic() - start >= 0.9
+
+
+def test_metrics(client, test_files, tmp_path):
+    glacier_lib = local_lib(client, tmp_path, workers=2)
+    assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1)
+    state = glacier_lib.metrics.snapshot()
+    assert state.get("bytes_done") == state.get("total_bytes") == 4294304
+    assert state.get("parts_done") == 5
+    assert state.get("phase_seconds").get("network") > 0
+    assert state.get("phase_seconds").get("api") > 0
+
+
+def test_upload_files_packed(local_glacier, client, test_files, tmp_path):
+    small_files = []
+    for index in range(5):
+        path_to_file = tmp_path / f"small_{index}.txt"
+        path_to_file.write_bytes(f"small file {index}".encode() * 1000)
+        small_files.append(str(path_to_file))
+    paths = small_files + [test_files[1].get("file_path")]
+    glacier_lib = local_lib(client, tmp_path, workers=2)
+    results = glacier_lib.upload_files(paths, multipart=True, part_size=1, pack_size=1)
+    assert all(results.values())
+    assert len(glacier_lib.storage.archives()) == 2
+    for path_to_file in small_files:
+        member = glacier_lib.storage.find_pack_members_by_path(path_to_file)[0]
+        data = local_glacier.archive("test_vault", member.get("archive_id")).get("data")
+        assert data[member.get("offset"):member.get("offset") + member.get("length")] == read(path_to_file)
+    state = glacier_lib.metrics.snapshot()
+    assert state.get("bytes_done") == state.get("total_bytes")
+
+    glacier_lib.skip_existing = True
+    assert all(glacier_lib.upload_files(paths, multipart=True, part_size=1, pack_size=1).values())
+    assert len(glacier_lib.storage.archives()) == 2
+
+
+def track_memory(budget):
+    """Records the memory in use of the budget before each release."""
+    in_use = []
+    release = budget.release
+
+    def tracked_release(amount):
+        in_use.append(budget.in_use)
+        release(amount)
+
+    budget.release = tracked_release
+    return in_use
+
+
+def test_upload_files_within_memory_limit(local_glacier, client, tmp_path):
+    paths = []
+    for index in range(12):
+        path_to_file = tmp_path / f"file_{index}.bin"
+        path_to_file.write_bytes(os.urandom(300 * 1024))
+        paths.append(str(path_to_file))
+    glacier_lib = local_lib(client, tmp_path, workers=4, max_memory=2)
+    peak = track_memory(glacier_lib.scheduler.budget)
+    assert all(glacier_lib.upload_files(paths[:6], part_size=1).values())
+    assert all(glacier_lib.upload_files(paths[6:], part_size=1, pack_size=1).values())
+    assert 0 < max(peak) <= 2 * 1048576
+
+
+def test_vault_lookup_cached(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[0].get("file_path")
+    assert local_lib(client, tmp_path).upload(path_to_file)
+    assert local_glacier.request_count == 2
+    glacier_lib = local_lib(client, tmp_path)
+    assert glacier_lib.upload(path_to_file)
+    assert glacier_lib.upload(path_to_file)
+    assert local_glacier.request_count == 4
+    assert local_lib(client, tmp_path, vault_cache_ttl=0).upload(path_to_file)
+    assert local_glacier.request_count == 6
+
+
+def test_vault_cache_keyed_by_credentials_without_client(local_glacier, client, tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "key_1")
+    assert local_lib(client, tmp_path)._vault_exists("test_vault")
+    glacier_lib = GlacierLib("test_vault", upload_log=str(tmp_path / "uploaded_log.db"), region_name="us-east-1")
+    assert glacier_lib._vault_exists("test_vault")
+    assert glacier_lib._client is None
+    other_endpoint = GlacierLib(
+        "test_vault", upload_log=str(tmp_path / "uploaded_log.db"), region_name="us-east-1",
+        endpoint_url="http://127.0.0.1:8000"
+    )
+    assert other_endpoint._vault_cache_key("test_vault") != glacier_lib._vault_cache_key("test_vault")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "key_2")
+    assert local_lib(client, tmp_path)._vault_exists("test_vault")
+    assert local_glacier.request_count == 2
+
+
+def test_vault_cache_keyed_by_region_of_profile(tmp_path, monkeypatch):
+    config_file = tmp_path / "config"
+    config_file.write_text("[default]\n[profile backup]\nregion = eu-west-1\n")
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config_file))
+    monkeypatch.delenv("AWS_DEFAULT_REGION", raising=False)
+    monkeypatch.setenv("AWS_PROFILE", "backup")
+    glacier_lib = GlacierLib("test_vault", upload_log=str(tmp_path / "uploaded_log.db"))
+    assert glacier_lib._vault_cache_key("test_vault")[1] == "eu-west-1"
+    monkeypatch.delenv("AWS_PROFILE")
+    assert GlacierLib("test_vault", upload_log=str(tmp_path / "uploaded_log.db"))._vault_cache_key("test_vault") is None
+
+
+def test_missing_vault_not_cached(local_glacier, client, test_files, tmp_path):
+    glacier_lib = GlacierLib('other_vault', upload_log=str(tmp_path / "uploaded_log.db"), client=client)
+    assert not glacier_lib.upload(test_files[0].get("file_path"))
+    local_glacier.create_vault("other_vault")
+    assert glacier_lib.upload(test_files[0].get("file_path"))
+
+
+@pytest.fixture
+def replica_glacier():
+    return LocalGlacier(vaults=("backup_vault",))
+
+
+def replica_lib(replica_glacier, tmp_path, **kwargs):
+    client = local_client(replica_glacier, region_name="eu-west-1", workers=2)
+    return GlacierLib('backup_vault', upload_log=str(tmp_path / "uploaded_log.db"), client=client, **kwargs)
+
+
+def test_replicated_uploads(local_glacier, replica_glacier, client, test_files, tmp_path):
+    replica = replica_lib(replica_glacier, tmp_path, workers=2)
+    glacier_lib = local_lib(client, tmp_path, workers=2, replicas=[replica])
+    path_to_file = test_files[1].get("file_path")
+    assert glacier_lib.multipart_upload(path_to_file, part_size=1)
+    assert glacier_lib.upload(test_files[0].get("file_path"))
+    with open(path_to_file, "rb") as stream:
+        assert glacier_lib.stream_upload(stream, part_size=1)
+    records = glacier_lib.storage.archives()
+    assert [(record.get("vault_name"), record.get("region_name")) for record in records] == [
+        ("test_vault", "us-east-1"), ("backup_vault", "eu-west-1")
+    ] * 3
+    for record in records:
+        glacier = local_glacier if record.get("vault_name") == "test_vault" else replica_glacier
+        archive = glacier.archive(record.get("vault_name"), record.get("archive_id"))
+        assert archive.get("checksum") == record.get("checksum")
+    assert records[0].get("checksum") == records[1].get("checksum") == file_tree_hash(path_to_file)
+    assert not local_glacier.uploads and not replica_glacier.uploads
+    assert replica.metrics.snapshot().get("bytes_done") == glacier_lib.metrics.snapshot().get("bytes_done")
+
+
+def test_failing_replica_does_not_stop_upload(local_glacier, replica_glacier, client, test_files, tmp_path, caplog):
+    replica = replica_lib(replica_glacier, tmp_path, retry_policy=RetryPolicy(max_attempts=2, base_delay=0))
+    glacier_lib = local_lib(client, tmp_path, workers=2, replicas=[replica])
+    assert glacier_lib._vault_exists("test_vault")
+    replica_glacier.error_rate = 1.0
+    path_to_file = test_files[1].get("file_path")
+    assert not glacier_lib.multipart_upload(path_to_file, part_size=1)
+    records = glacier_lib.storage.find_by_path(path_to_file)
+    assert [record.get("vault_name") for record in records] == ["test_vault"]
+    assert local_glacier.archive("test_vault", records[0].get("archive_id")).get("data") == read(path_to_file)
+    assert "Replication to eu-west-1:backup_vault failed." in caplog.messages
+
+
+def test_replica_vault_checked_when_vault_cached(local_glacier, replica_glacier, client, tmp_path):
+    assert local_lib(client, tmp_path)._vault_exists("test_vault")
+    replica = GlacierLib(
+        'missing_vault', upload_log=str(tmp_path / "uploaded_log.db"),
+        client=local_client(replica_glacier, region_name="eu-west-1")
+    )
+    glacier_lib = local_lib(client, tmp_path, replicas=[replica])
+    assert not glacier_lib._vault_exists("test_vault")
+    assert local_glacier.request_count == 1
+
+
+def test_close_stops_replica_threads(replica_glacier, client, test_files, tmp_path):
+    replica = replica_lib(replica_glacier, tmp_path, workers=2)
+    with local_lib(client, tmp_path, workers=2, replicas=[replica]) as glacier_lib:
+        assert glacier_lib.multipart_upload(test_files[1].get("file_path"), part_size=1)
+    for executor in (glacier_lib._replica_executor, glacier_lib.scheduler._executor, replica.scheduler._executor):
+        with pytest.raises(RuntimeError):
+            executor.submit(print)
+
+
+def test_upload_compressed(local_glacier, client, test_files, tmp_path):
+    path_to_file = test_files[1].get("file_path")
+    glacier_lib = local_lib(client, tmp_path, workers=2, compression="gzip")
+    assert glacier_lib.multipart_upload(path_to_file, part_size=1)
+    record = glacier_lib.storage.find_by_path(path_to_file)[0]
+    assert record.get("codec") == "gzip"
+    assert record.get("original_size") == 4294304 > record.get("size")
+    archive = local_glacier.archive("test_vault", record.get("archive_id"))
+    assert archive.get("checksum") == record.get("checksum")
+    assert decompress(archive.get("data"), "gzip") == read(path_to_file)
+    state = glacier_lib.metrics.snapshot()
+    assert state.get("bytes_done") == state.get("total_bytes") == record.get("size")
+
+    glacier_lib.skip_existing = True
+    assert glacier_lib.upload_files([path_to_file], multipart=True, part_size=1)
+    assert len(glacier_lib.storage.archives()) == 1
+
+
+def test_compressed_uploads_within_memory_limit(local_glacier, client, test_files, tmp_path):
+    paths = [test_files[1].get("file_path"), str(tmp_path / "copy.txt")]
+    (tmp_path / "copy.txt").write_bytes(read(paths[0]))
+    glacier_lib = local_lib(client, tmp_path, workers=2, max_memory=24, compression="gzip")
+    peak = track_memory(glacier_lib.scheduler.budget)
+    assert all(glacier_lib.upload_files(paths, multipart=True, part_size=1).values())
+    assert 17 * 1048576 <= max(peak) <= 24 * 1048576
+    assert glacier_lib.scheduler.budget.in_use == 0
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from unittest.mock import patch
+import pytest
+from glacier_upload import main
+
+
+def imported_modules(code):
+    output = subprocess.run(
+        [sys.executable, "-c", code + "\nimport sys\nprint(','.join(sys.modules))"],
+        check=True, stdout=subprocess.PIPE,
+    ).stdout
+    return output.decode().strip().splitlines()[-1].split(",")
+
+
+def test_boto3_not_imported_at_startup():
+    """Guards the startup time: boto3 and botocore are imported only when a client is needed."""
+    modules = imported_modules("import glacier_upload.main")
+    assert not [module for module in modules if module.split(".")[0] in ("boto3", "botocore")]
+
+
+def test_client_not_created_for_missing_file(tmp_path):
+    arguments = ["glacier-upload", str(tmp_path / "missing.bin"), "test_vault", "-l", str(tmp_path / "log.db")]
+    with patch.object(sys, "argv", arguments), patch(
+        "glacier_upload.libraries.glacier_library.create_client"
+    ) as create_client:
+        main.main()
+    create_client.assert_not_called()
+
+
+def test_replicas_share_the_rate_limit(tmp_path):
+    arguments = [
+        "glacier-upload", "--max-rate", "10MB/s", "--replicate-to", "eu-west-1:backup,ap-southeast-2:backup",
+        "-l", str(tmp_path / "log.db"), str(tmp_path / "missing.bin"), "test_vault",
+    ]
+    with patch.object(sys, "argv", arguments), patch.object(main, "upload") as upload:
+        main.main()
+    glacier = upload.call_args[0][0]
+    assert glacier.rate_limiter is not None
+    assert [replica.rate_limiter for replica in glacier.replicas] == [glacier.rate_limiter] * 2
+
+
+def test_hash_reports_missing_file(tmp_path):
+    with patch.object(sys, "argv", ["glacier-upload", "hash", str(tmp_path / "missing.bin")]):
+        with pytest.raises(SystemExit) as error:
+            main.main()
+    assert error.value.code == f"Could not hash {tmp_path / 'missing.bin'}: No such file or directory"
+
+
+def test_coordinator_closes_glacier(tmp_path):
+    arguments = ["--shards", "2", "--plan-dir", str(tmp_path), str(tmp_path / "data.bin"), "test_vault"]
+    with patch.object(main, "GlacierLib") as glacier_class:
+        glacier_class.return_value.complete_distributed_upload.return_value = True
+        main.coordinate(arguments)
+    glacier_class.return_value.__exit__.assert_called_once()
@@ -0,0 +1,56 @@
+import hashlib
+import io
+import tarfile
+from glacier_upload.libraries import pack_stream
+from glacier_upload.libraries.tree_hash import file_tree_hash
+
+
+def create_files(tmp_path, sizes):
+    paths = []
+    for index, size in enumerate(sizes):
+        path_to_file = tmp_path / f"file_{index}.bin"
+        path_to_file.write_bytes(bytes([index % 256]) * size)
+        paths.append(str(path_to_file))
+    return paths
+
+
+def test_group_files():
+    sizes = {"a": 40, "b": 40, "c": 30, "d": 200, "e": 10}
+    assert pack_stream.group_files(["a", "b", "c", "d", "e"], sizes, 100) == [["a", "b"], ["c"], ["d"], ["e"]]
+    assert pack_stream.group_files([], {}, 100) == []
+
+
+def test_pack_stream_is_tar(tmp_path):
+    paths = create_files(tmp_path, [0, 1, 511, 512, 1048577])
+    stream = pack_stream.PackStream(paths)
+    data = stream.read()
+    assert len(data) == stream.size
+    assert stream.size % tarfile.RECORDSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert archive.getnames() == [pack_stream.member_name(path_to_file) for path_to_file in paths]
+        for path_to_file, info in zip(paths, archive.getmembers()):
+            assert archive.extractfile(info).read() == open(path_to_file, "rb").read()
+
+
+def test_member_offsets_and_hashes(tmp_path):
+    paths = create_files(tmp_path, [16, 4294304, 3])
+    stream = pack_stream.PackStream(paths)
+    data = stream.read()
+    for path_to_file, member in zip(paths, stream.members):
+        content = open(path_to_file, "rb").read()
+        assert data[member.get("offset"):member.get("offset") + member.get("length")] == content
+        assert member.get("sha256") == hashlib.sha256(content).hexdigest()
+        assert member.get("checksum") == file_tree_hash(path_to_file)
+        assert "error" not in member
+
+
+def test_shrunk_file_padded(tmp_path):
+    paths = create_files(tmp_path, [1000, 10])
+    stream = pack_stream.PackStream(paths)
+    with open(paths[0], "wb") as file_object:
+        file_object.write(b"x" * 10)
+    data = stream.read()
+    assert len(data) == stream.size
+    assert stream.members[0].get("error")
+    assert "error" not in stream.members[1]
+    assert data[stream.members[1].get("offset"):stream.members[1].get("offset") + 10] == bytes([1]) * 10
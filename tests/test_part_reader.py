@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import pytest
+from glacier_upload.libraries import part_reader
+
+
+def test_part_view_read_and_seek(test_files):
+    with part_reader.MappedFile(test_files[0].get("file_path")) as mapped_file:
+        with mapped_file.part_view(4, 8) as view:
+            assert len(view) == 8
+            assert view.read(4) == b"1001"
+            assert view.read() == b"1100"
+            assert view.read() == b""
+            view.seek(0)
+            assert view.read() == b"10011100"
+            assert bytes(view.data) == b"10011100"
+
+
+def test_part_view_readinto(test_files):
+    with part_reader.MappedFile(test_files[0].get("file_path")) as mapped_file:
+        with mapped_file.part_view(0, 4) as view:
+            buffer = bytearray(8)
+            assert view.readinto(buffer) == 4
+            assert buffer[:4] == b"1000"
+
+
+def test_part_view_rate_limiter(test_files):
+    class Limiter:
+        def __init__(self):
+            self.consumed = []
+
+        def consume(self, amount):
+            self.consumed.append(amount)
+
+    with part_reader.MappedFile(test_files[0].get("file_path")) as mapped_file:
+        with mapped_file.part_view(0, 16) as view:
+            view.rate_limiter = Limiter()
+            view.read(10)
+            view.readinto(bytearray(10))
+            view.read()
+            assert view.rate_limiter.consumed == [10, 6]
+
+
+def test_mapped_file_empty(tmp_path):
+    path_to_file = tmp_path / "empty.bin"
+    path_to_file.write_bytes(b"")
+    with part_reader.MappedFile(str(path_to_file)) as mapped_file:
+        with mapped_file.part_view(0, 0) as view:
+            assert view.read() == b""
+        mapped_file.release(0, 0)
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fadvise"), reason="posix_fadvise not available")
+def test_mapped_file_advice(monkeypatch, tmp_path):
+    path_to_file = tmp_path / "data.bin"
+    path_to_file.write_bytes(b"x" * 3 * 1048576)
+    calls = []
+    monkeypatch.setattr(part_reader.os, "posix_fadvise", lambda fd, start, length, advice: calls.append(
+        (start, length, advice)
+    ))
+    with part_reader.MappedFile(str(path_to_file), drop_cache=True) as mapped_file:
+        mapped_file.read_ahead(1048576, 4 * 1048576)
+        mapped_file.read_ahead(3 * 1048576, 1048576)
+        mapped_file.release(0, 1048576)
+    assert calls == [
+        (0, 0, os.POSIX_FADV_SEQUENTIAL),
+        (1048576, 2 * 1048576, os.POSIX_FADV_WILLNEED),
+        (0, 1048576, os.POSIX_FADV_DONTNEED),
+    ]
+
+
+def test_memory_budget_blocks_until_released():
+    budget = part_reader.MemoryBudget(limit=10)
+    budget.acquire(6)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(6)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+    budget.release(6)
+    thread.join(timeout=1)
+    assert acquired.is_set()
+    assert budget.in_use == 6
+
+
+def test_add_content_sha256():
+    class Body:
+        content_sha256 = "abc"
+
+    params = {"body": Body(), "headers": {}}
+    part_reader.add_content_sha256(params)
+    assert params["headers"]["x-amz-content-sha256"] == "abc"
+
+
+def test_fill_buffer_short_reads():
+    class Pipe:
+        def __init__(self, chunks):
+            self.chunks = chunks
+
+        def readinto(self, buffer):
+            if not self.chunks:
+                return 0
+            chunk = self.chunks.pop(0)
+            if len(chunk) > len(buffer):
+                self.chunks.insert(0, chunk[len(buffer):])
+                chunk = chunk[:len(buffer)]
+            buffer[:len(chunk)] = chunk
+            return len(chunk)
+
+    stream = Pipe([b"100", b"01", b"110", b"0111"])
+    buffer = bytearray(6)
+    assert part_reader.fill_buffer(stream, buffer) == 6
+    assert buffer == b"100011"
+    assert part_reader.fill_buffer(stream, buffer) == 6
+    assert buffer == b"100111"
+    assert part_reader.fill_buffer(stream, buffer) == 0
+
+
+def test_buffer_pool_reuses_buffers():
+    pool = part_reader.BufferPool(4, 2)
+    first = pool.get()
+    second = pool.get()
+    assert first is not second
+    pool.put(first)
+    assert pool.get() is first
+
+
+def test_buffer_pool_charges_budget():
+    budget = part_reader.MemoryBudget(limit=8)
+    with part_reader.BufferPool(4, 3, budget) as pool:
+        first = pool.get()
+        pool.get()
+        assert budget.in_use == 8
+        pool.put(first)
+        assert pool.get() is first
+        assert budget.in_use == 8
+    assert budget.in_use == 0
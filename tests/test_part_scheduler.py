@@ -0,0 +1,16 @@
+import threading
+from glacier_upload.libraries.part_scheduler import PartScheduler
+
+
+def test_submit_runs_calls_in_parallel():
+    barrier = threading.Barrier(3, timeout=1)
+    with PartScheduler(workers=3) as scheduler:
+        futures = [scheduler.submit(0, barrier.wait) for _ in range(3)]
+        assert sorted(future.result() for future in futures) == [0, 1, 2]
+
+
+def test_submit_releases_budget():
+    with PartScheduler(workers=2, max_memory=1) as scheduler:
+        futures = [scheduler.submit(1048576, lambda i=i: i) for i in range(4)]
+        assert [future.result() for future in futures] == [0, 1, 2, 3]
+    assert scheduler.budget.in_use == 0
@@ -72,3 +72,34 @@ def test_add_range_string_2mb():
     assert ranges_added[0].get("range") == "bytes 0-2097151/*"
     assert ranges_added[1].get("range") == "bytes 2097152-4194303/*"
     assert ranges_added[2].get("range") == "bytes 4194304-4295153/*"
+
+
+def test_choose_part_size_small_file():
+    assert partlify.choose_part_size(4294304) == 1
+
+
+def test_choose_part_size_grows_with_file_size():
+    gigabyte = 1073741824
+    assert partlify.choose_part_size(gigabyte, workers=4) == 64
+    assert partlify.choose_part_size(100 * gigabyte, workers=4) == 128
+
+
+def test_choose_part_size_part_limit():
+    size = partlify.choose_part_size(5 * 1099511627776, workers=8)
+    assert size == 1024
+    assert partlify.get_part_count(5 * 1099511627776, size * 1048576) <= partlify.MAX_PARTS
+
+
+def test_choose_part_size_memory_limit():
+    gigabyte = 1073741824
+    assert partlify.choose_part_size(100 * gigabyte, workers=8, max_memory=256) == 32
+    assert partlify.choose_part_size(100 * gigabyte, workers=8, max_memory=8) == 16
+
+
+def test_split_into_shards():
+    parts = partlify.add_byte_ranges([{"part_size": 1048576} for _ in range(5)])
+    shards = partlify.split_into_shards(parts, 3)
+    assert [len(shard) for shard in shards] == [2, 2, 1]
+    assert [part for shard in shards for part in shard] == parts
+    assert len(partlify.split_into_shards(parts, 8)) == 5
+    assert partlify.split_into_shards([], 3) == []
@@ -0,0 +1,64 @@
+from datetime import datetime
+import pytest
+from glacier_upload.libraries.rate_limiter import RateLimiter, TokenBucket, parse_rate, parse_schedule
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+def test_parse_rate():
+    assert parse_rate("50MB/s") == 50 * 1048576
+    assert parse_rate("512kb") == 512 * 1024
+    assert parse_rate("1.5 GB/s") == 1.5 * 1073741824
+    assert parse_rate("1000") == 1000
+    assert parse_rate("unlimited") is None
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_parse_schedule():
+    schedule = parse_schedule("08:00-18:00=10MB/s, 22:00-06:00=unlimited")
+    assert schedule[0] == (datetime(1, 1, 1, 8).time(), datetime(1, 1, 1, 18).time(), 10 * 1048576)
+    assert schedule[1][2] is None
+    with pytest.raises(ValueError):
+        parse_schedule("08:00=10MB/s")
+
+
+def test_token_bucket_waits_for_tokens():
+    clock = FakeClock()
+    bucket = TokenBucket(1048576, burst=65536, clock=clock, sleep=clock.sleep)
+    for _ in range(16):
+        bucket.consume(65536)
+    assert clock.slept == pytest.approx(15 / 16)
+
+
+def test_token_bucket_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(1048576, burst=65536, clock=clock, sleep=clock.sleep)
+    bucket.consume(65536)
+    clock.now += 1
+    bucket.consume(65536)
+    assert clock.slept == 0
+
+
+def test_rate_limiter_schedule():
+    now = datetime(2020, 1, 1, 12)
+    schedule = parse_schedule("08:00-18:00=10MB/s,22:00-06:00=unlimited")
+    limiter = RateLimiter(rate=50 * 1048576, schedule=schedule, now=lambda: now)
+    assert limiter.current_rate() == 10 * 1048576
+    now = datetime(2020, 1, 1, 20)
+    assert limiter.current_rate() == 50 * 1048576
+    now = datetime(2020, 1, 1, 23)
+    assert limiter.current_rate() is None
+    now = datetime(2020, 1, 1, 5)
+    assert limiter.current_rate() is None
@@ -1,58 +1,125 @@
 import json
+import sqlite3
 import pytest
 from glacier_upload.libraries import response_storage
 
 
 @pytest.fixture
-def storage(temp_json):
-    return response_storage.Storage(file_name=temp_json)
+def storage(tmp_path):
+    return response_storage.Storage(file_name=str(tmp_path / "uploaded.db"))
 
 
-def test_storage_init(temp_json, storage):
-    """Testing that the json file is created if it doesn't exist."""
-    expected_content = {
-        "archives": []
-    }
-    with open(temp_json) as temp_file:
-        temp_json_content = json.load(temp_file)
-    assert expected_content == temp_json_content
+def test_storage_init(tmp_path, storage):
+    """Testing that the catalog is created with the indexed archives table."""
+    connection = sqlite3.connect(str(tmp_path / "uploaded.db"))
+    indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert "archives_archive_id" in indexes
+    assert "archives_path_to_file" in indexes
+    assert "archives_checksum" in indexes
+    assert storage.archives() == []
 
 
-def test_storage_init_file_exists(temp_json):
-    """Testing that nothing changes in the file if it exists when the
-    Storage is initialized.
+def test_save(storage, test_files):
+    storage.save({"archiveId": "archive_1", "checksum": "hash_1"})
+    storage.save(
+        {"archiveId": "archive_2", "checksum": "hash_2", "list": ['one', 'two']},
+        path_to_file=test_files[0].get("file_path"),
+        vault_name="test_vault",
+        size=16,
+        description="something",
+    )
+    archives = storage.archives()
+    assert [archive.get("archive_id") for archive in archives] == ["archive_1", "archive_2"]
+    assert archives[1].get("response") == {"archiveId": "archive_2", "checksum": "hash_2", "list": ['one', 'two']}
+    assert archives[1].get("vault_name") == "test_vault"
+    assert archives[1].get("size") == 16
+
+
+def test_save_persists(tmp_path, storage):
+    storage.save({"archiveId": "archive_1"})
+    storage.close()
+    reopened = response_storage.Storage(file_name=str(tmp_path / "uploaded.db"))
+    assert [archive.get("archive_id") for archive in reopened.archives()] == ["archive_1"]
+
+
+def test_lookups(storage, test_files):
+    path_to_file = test_files[0].get("file_path")
+    storage.save({"archiveId": "archive_1", "checksum": "hash_1"}, path_to_file=path_to_file, vault_name="a", size=16)
+    storage.save({"archiveId": "archive_2", "checksum": "hash_1"}, vault_name="b", size=16)
+    assert [archive.get("archive_id") for archive in storage.find_by_archive_id("archive_2")] == ["archive_2"]
+    assert [archive.get("archive_id") for archive in storage.find_by_path(path_to_file)] == ["archive_1"]
+    assert len(storage.find_by_checksum("hash_1")) == 2
+    found = storage.find_by_checksum("hash_1", vault_name="b")
+    assert [archive.get("archive_id") for archive in found] == ["archive_2"]
+    assert storage.find_by_checksum("hash_1", vault_name="b", size=17) == []
+
+
+def test_json_log_migrated_once(tmp_path):
+    """Testing that a log in the JSON format is imported when the catalog is opened
+    and only once.
     """
-    expected_content = {
-        "archives": []
-    }
-    with open(temp_json, "w") as temp_file:
-        json.dump(expected_content, temp_file, indent=4)
-    storage = response_storage.Storage(file_name=temp_json)
-    with open(temp_json) as temp_file:
-        temp_json_content = json.load(temp_file)
-    assert expected_content == temp_json_content
-
-
-def test_save(temp_json, storage):
-    expected_content = {
-        "archives": [
-            {
-                "item": 1
-            },
-            {
-                "item": "something",
-                "list": [
-                    'one',
-                    'two'
-                ]
-            }
-        ]
-    }
-    storage.save({"item": 1})
-    storage.save({
-        "item": "something",
-        "list": ['one', 'two']
-        })
-    with open(temp_json) as temp_file:
-        temp_json_content = json.load(temp_file)
-    assert expected_content == temp_json_content
+    legacy_file = tmp_path / "uploaded.json"
+    with open(legacy_file, "w") as temp_file:
+        json.dump({"archives": [{"archiveId": "archive_1"}, {"item": "something"}]}, temp_file, indent=4)
+    storage = response_storage.Storage(file_name=str(legacy_file))
+    assert storage.file_name == str(tmp_path / "uploaded.db")
+    assert [archive.get("response") for archive in storage.archives()] == [
+        {"archiveId": "archive_1"}, {"item": "something"}
+    ]
+    storage.close()
+    storage = response_storage.Storage(file_name=str(tmp_path / "uploaded.db"))
+    assert len(storage.archives()) == 2
+
+
+def test_fingerprints(storage, test_files):
+    path_to_file = test_files[0].get("file_path")
+    fingerprint = {"size": 16, "mtime_ns": 1, "inode": 2}
+    assert storage.find_checksum_by_fingerprint(path_to_file, fingerprint) is None
+    storage.save_fingerprint(path_to_file, fingerprint, "hash_1")
+    assert storage.find_checksum_by_fingerprint(path_to_file, fingerprint) == "hash_1"
+    assert storage.find_checksum_by_fingerprint(path_to_file, dict(fingerprint, mtime_ns=3)) is None
+    storage.save_fingerprint(path_to_file, dict(fingerprint, mtime_ns=3), "hash_2")
+    assert storage.find_checksum_by_fingerprint(path_to_file, dict(fingerprint, mtime_ns=3)) == "hash_2"
+
+
+def test_pack_members(tmp_path, storage, test_files):
+    path_to_file = test_files[0].get("file_path")
+    members = [
+        {"path_to_file": path_to_file, "member_name": "a", "offset": 1536, "length": 16, "checksum": "h"},
+        {"path_to_file": str(tmp_path / "b"), "member_name": "b", "offset": 512, "length": 3, "checksum": "h_2"},
+    ]
+    storage.save_pack_members("pack_1", "test_vault", members)
+    assert [member.get("member_name") for member in storage.pack_members("pack_1")] == ["b", "a"]
+    found = storage.find_pack_members_by_path(path_to_file)
+    assert found[0].get("archive_id") == "pack_1"
+    assert found[0].get("offset") == 1536
+    assert storage.find_pack_members_by_checksum("h", "test_vault", 16)[0].get("member_name") == "a"
+    assert storage.find_pack_members_by_checksum("h", "other_vault") == []
+    assert storage.find_pack_members_by_checksum("h", size=3) == []
+
+
+def test_vault_cache(storage):
+    assert storage.find_vault("-", "us-east-1", "test_vault", max_age=60) is None
+    checked_at = storage.save_vault("-", "us-east-1", "test_vault", vault_arn="arn")
+    cached = storage.find_vault("-", "us-east-1", "test_vault", max_age=60)
+    assert cached.get("vault_arn") == "arn"
+    assert cached.get("checked_at") == checked_at
+    assert storage.find_vault("-", "eu-west-1", "test_vault", max_age=60) is None
+    assert storage.find_vault("-", "us-east-1", "test_vault", max_age=0) is None
+
+
+def test_job_queue(storage):
+    first = storage.save_job("test_vault", ["/data/a"], priority=0)
+    urgent = storage.save_job("test_vault", ["/data/b"], priority=9, options={"multipart": True})
+    cancelled = storage.save_job("test_vault", ["/data/c"], priority=9)
+    assert storage.cancel_job(cancelled)
+    job = storage.claim_job()
+    assert (job.get("id"), job.get("state"), job.get("options")) == (urgent, "running", {"multipart": True})
+    assert storage.requeue_running_jobs() == 1
+    assert storage.claim_job().get("id") == urgent
+    assert storage.claim_job().get("id") == first
+    assert storage.claim_job() is None
+    storage.finish_job(first, "done", {"/data/a": True})
+    assert storage.find_job(first).get("result") == {"/data/a": True}
+    assert [job.get("id") for job in storage.jobs("running")] == [urgent]
+    assert not storage.cancel_job(first)
@@ -0,0 +1,134 @@
+import os
+import pytest
+from glacier_upload.libraries.compress_stream import decompress
+from glacier_upload.libraries.glacier_library import GlacierLib
+from glacier_upload.libraries.local_glacier import GlacierError
+from glacier_upload.libraries.retrieval_library import RetrievalLib
+from glacier_upload.libraries.retry_policy import RetryPolicy
+from .helpers import local_lib, read
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path_to_file = tmp_path / "data.bin"
+    path_to_file.write_bytes(os.urandom(5 * 1048576 + 12345))
+    return str(path_to_file)
+
+
+def retrieval_lib(client, tmp_path, **kwargs):
+    kwargs.setdefault("retry_policy", RetryPolicy(max_attempts=3, base_delay=0))
+    return local_lib(client, tmp_path, RetrievalLib, workers=3, poll_interval=0.01, **kwargs)
+
+
+def test_retrieve_by_path(local_glacier, client, data_file, tmp_path):
+    assert local_lib(client, tmp_path, workers=3).multipart_upload(data_file, part_size=2)
+    local_glacier.job_delay = 0.05
+    glacier_lib = retrieval_lib(client, tmp_path)
+    results = glacier_lib.retrieve([data_file], output_dir=str(tmp_path / "out"), part_size=2)
+    assert results == {data_file: True}
+    assert read(tmp_path / "out" / "data.bin") == read(data_file)
+    assert not (tmp_path / "out" / "data.bin.retrieving").exists()
+    assert not list((tmp_path / "uploaded_log.journal").glob("retrieve-*"))
+    state = glacier_lib.metrics.snapshot()
+    assert state.get("bytes_done") == state.get("total_bytes") == os.path.getsize(data_file)
+
+
+def test_retrieve_unknown_archive_id(local_glacier, client, data_file, tmp_path):
+    archive_id = client.upload_archive(vaultName="test_vault", body=read(data_file)).get("archiveId")
+    results = retrieval_lib(client, tmp_path).retrieve([archive_id], output_dir=str(tmp_path), part_size=1)
+    assert results == {archive_id: True}
+    assert read(tmp_path / archive_id) == read(data_file)
+
+
+def test_retrieve_packed_file(local_glacier, client, data_file, tmp_path):
+    medium_file = tmp_path / "medium.bin"
+    medium_file.write_bytes(os.urandom(3 * 1048576 + 100))
+    small_file = tmp_path / "small.txt"
+    small_file.write_bytes(b"small file" * 100)
+    paths = [data_file, str(medium_file), str(small_file)]
+    assert all(local_lib(client, tmp_path, workers=3).upload_files(paths, pack_size=8).values())
+    results = retrieval_lib(client, tmp_path).retrieve([str(small_file)], output_dir=str(tmp_path / "out"))
+    assert results == {str(small_file): True}
+    assert read(tmp_path / "out" / "small.txt") == read(small_file)
+    # Only the last megabyte of the pack with the small file is retrieved.
+    job = list(local_glacier.jobs.values())[0]
+    assert job.get("RetrievalByteRange") == f"3145728-{job.get('ArchiveSizeInBytes') - 1}"
+
+
+def test_failed_ranges_resumed(local_glacier, client, data_file, tmp_path):
+    assert local_lib(client, tmp_path, workers=3).multipart_upload(data_file, part_size=1)
+    get_job_output = local_glacier._op_GetJobOutput
+
+    def fail_late_ranges(request, segments, query):
+        if not local_glacier._header(request, "Range").startswith(("bytes=0-", "bytes=1048576-")):
+            raise GlacierError(503, "ServiceUnavailableException", "Injected error.")
+        return get_job_output(request, segments, query)
+
+    local_glacier._op_GetJobOutput = fail_late_ranges
+    output_dir = tmp_path / "restored"
+    glacier_lib = retrieval_lib(client, tmp_path)
+    assert glacier_lib.retrieve([data_file], output_dir=str(output_dir), part_size=1) == {data_file: False}
+    assert not (output_dir / "data.bin").exists()
+    del local_glacier._op_GetJobOutput
+    request_count = local_glacier.request_count
+    glacier_lib = retrieval_lib(client, tmp_path)
+    assert glacier_lib.retrieve([data_file], output_dir=str(output_dir), part_size=1) == {data_file: True}
+    assert read(output_dir / "data.bin") == read(data_file)
+    # One listing of the jobs and the four missing ranges, the job is reused.
+    assert local_glacier.request_count - request_count == 5
+    assert len(local_glacier.jobs) == 1
+
+
+def test_broken_stream_retried(local_glacier, client, data_file, tmp_path):
+    assert local_lib(client, tmp_path, workers=3).upload(data_file)
+    get_job_output = local_glacier._op_GetJobOutput
+    broken = []
+
+    def break_first_response(request, segments, query):
+        response = get_job_output(request, segments, query)
+        if not broken:
+            broken.append(request.headers.get("Range"))
+            response.raw._content = response.raw._content[:1000]
+        return response
+
+    local_glacier._op_GetJobOutput = break_first_response
+    glacier_lib = retrieval_lib(client, tmp_path)
+    assert glacier_lib.retrieve([data_file], output_dir=str(tmp_path / "out"), part_size=2) == {data_file: True}
+    assert read(tmp_path / "out" / "data.bin") == read(data_file)
+    assert glacier_lib.retry_count == 1
+
+
+def test_corrupted_output_rejected(local_glacier, client, data_file, tmp_path):
+    assert local_lib(client, tmp_path, workers=3).upload(data_file)
+    initiate_job = local_glacier._op_InitiateJob
+
+    def corrupt_job(request, segments, query):
+        response = initiate_job(request, segments, query)
+        job = local_glacier.jobs[response.headers.get("x-amz-job-id")]
+        job.update({"data": b"x" + job.get("data")[1:]})
+        return response
+
+    local_glacier._op_InitiateJob = corrupt_job
+    glacier_lib = retrieval_lib(client, tmp_path)
+    assert glacier_lib.retrieve([data_file], output_dir=str(tmp_path / "out")) == {data_file: False}
+    assert not list((tmp_path / "out").iterdir())
+
+
+def test_existing_output_not_overwritten(client, data_file, tmp_path):
+    assert local_lib(client, tmp_path, workers=3).upload(data_file)
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "data.bin").write_bytes(b"keep")
+    assert retrieval_lib(client, tmp_path).retrieve([data_file], output_dir=str(tmp_path / "out")) == {
+        data_file: False
+    }
+    assert read(tmp_path / "out" / "data.bin") == b"keep"
+
+
+def test_retrieve_compressed(client, data_file, tmp_path):
+    glacier_lib = GlacierLib(
+        "test_vault", upload_log=str(tmp_path / "uploaded_log.db"), client=client, workers=3, compression="xz"
+    )
+    assert glacier_lib.upload(data_file)
+    results = retrieval_lib(client, tmp_path).retrieve([data_file], output_dir=str(tmp_path / "out"), part_size=1)
+    assert results == {data_file: True}
+    assert decompress(read(tmp_path / "out" / "data.bin.xz"), "xz") == read(data_file)
@@ -0,0 +1,28 @@
+from botocore.exceptions import ClientError, EndpointConnectionError
+from glacier_upload.libraries.retry_policy import RetryPolicy
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": ""}}, "UploadMultipartPart")
+
+
+def test_is_retryable_error_code():
+    policy = RetryPolicy()
+    assert policy.is_retryable(client_error("ThrottlingException"))
+    assert policy.is_retryable(client_error("ServiceUnavailableException"))
+    assert not policy.is_retryable(client_error("InvalidParameterValueException"))
+
+
+def test_is_retryable_connection_error():
+    policy = RetryPolicy()
+    assert policy.is_retryable(EndpointConnectionError(endpoint_url="https://glacier"))
+    assert not RetryPolicy(retryable=["ThrottlingException"]).is_retryable(
+        EndpointConnectionError(endpoint_url="https://glacier")
+    )
+
+
+def test_delay_is_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(1, 10):
+        delay = policy.delay(attempt)
+        assert 0 <= delay <= min(5, 2 ** (attempt - 1))
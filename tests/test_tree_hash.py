@@ -0,0 +1,59 @@
+from io import BytesIO
+from botocore.utils import calculate_tree_hash
+from glacier_upload.libraries import tree_hash
+
+
+def test_tree_hash_matches_botocore(test_files):
+    with open(test_files[1].get("file_path"), "rb") as file_object:
+        data = file_object.read()
+        file_object.seek(0)
+        expected = calculate_tree_hash(file_object)
+    assert tree_hash.tree_hash(tree_hash.leaf_hashes(data)) == expected
+
+
+def test_tree_hash_combined_from_parts(test_files):
+    with open(test_files[1].get("file_path"), "rb") as file_object:
+        data = file_object.read()
+        file_object.seek(0)
+        expected = calculate_tree_hash(file_object)
+    part_size = 2097152
+    leaves = []
+    for start in range(0, len(data), part_size):
+        leaves.extend(tree_hash.leaf_hashes(data[start:start + part_size]))
+    assert tree_hash.tree_hash(leaves) == expected
+
+
+def test_tree_hash_small_and_empty():
+    expected = calculate_tree_hash(BytesIO(b"1000100111001111"))
+    assert tree_hash.tree_hash(tree_hash.leaf_hashes(b"1000100111001111")) == expected
+    assert tree_hash.tree_hash(tree_hash.leaf_hashes(b"")) == calculate_tree_hash(BytesIO(b""))
+
+
+def test_file_tree_hash(test_files):
+    with open(test_files[1].get("file_path"), "rb") as file_object:
+        expected = calculate_tree_hash(file_object)
+    assert tree_hash.file_tree_hash(test_files[1].get("file_path")) == expected
+
+
+def test_file_tree_hash_parallel(tmp_path):
+    path_to_file = tmp_path / "data.bin"
+    path_to_file.write_bytes(bytes(range(256)) * 40000)
+    with open(path_to_file, "rb") as file_object:
+        expected = calculate_tree_hash(file_object)
+    for workers in (1, 2, 3, 16):
+        assert tree_hash.file_tree_hash(str(path_to_file), workers=workers) == expected
+
+
+def test_file_tree_hash_empty(tmp_path):
+    path_to_file = tmp_path / "empty.bin"
+    path_to_file.write_bytes(b"")
+    assert tree_hash.file_tree_hash(str(path_to_file)) == calculate_tree_hash(BytesIO(b""))
+
+
+def test_file_leaf_hashes_range(test_files):
+    path_to_file = test_files[1].get("file_path")
+    with open(path_to_file, "rb") as file_object:
+        data = file_object.read()
+    hashes = tree_hash.file_leaf_hashes(path_to_file, 2097152, 2097152, workers=2)
+    assert hashes == tree_hash.leaf_hashes(data[2097152:4194304])
+    assert tree_hash.file_leaf_hashes(path_to_file, 4194304) == tree_hash.leaf_hashes(data[4194304:])
@@ -0,0 +1,77 @@
+import json
+import time
+import pytest
+from glacier_upload.libraries.upload_daemon import UploadDaemon, send_request
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for index in range(3):
+        path_to_file = tmp_path / f"file_{index}.txt"
+        path_to_file.write_bytes(f"file {index}".encode() * 1000)
+        paths.append(str(path_to_file))
+    return paths
+
+
+def upload_daemon(client, tmp_path, **kwargs):
+    return UploadDaemon(upload_log=str(tmp_path / "uploaded_log.db"), client=client, workers=2, **kwargs)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_jobs_run_by_priority_after_restart(client, files, tmp_path):
+    daemon = upload_daemon(client, tmp_path)
+    job_ids = [daemon.submit([path_to_file], "test_vault", priority=priority)
+               for path_to_file, priority in zip(files, (0, 5, 1))]
+    daemon.storage.close()
+    with upload_daemon(client, tmp_path) as daemon:
+        wait_for(lambda: all(daemon.storage.find_job(job_id).get("state") == "done" for job_id in job_ids))
+    uploaded = [record.get("path_to_file") for record in daemon.storage.archives()]
+    assert uploaded == [files[1], files[2], files[0]]
+    assert daemon.storage.find_job(job_ids[0]).get("result") == {files[0]: True}
+
+
+def test_interrupted_job_queued_again(client, files, tmp_path):
+    daemon = upload_daemon(client, tmp_path)
+    job_id = daemon.submit(files, "test_vault", multipart=True, part_size=1)
+    assert daemon.storage.claim_job().get("id") == job_id
+    with upload_daemon(client, tmp_path) as daemon:
+        wait_for(lambda: daemon.storage.find_job(job_id).get("state") == "done")
+    assert len(daemon.storage.archives()) == 3
+
+
+def test_socket_requests(local_glacier, client, files, tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    with upload_daemon(client, tmp_path, socket_path=str(socket_path)) as daemon:
+        response = send_request(socket_path, {"command": "submit", "paths": files[:2], "vault_name": "test_vault"})
+        assert response.get("ok")
+        job_id = response.get("job_id")
+        wait_for(lambda: send_request(socket_path, {"command": "status", "job_id": job_id}).get("job")
+                 .get("state") == "done")
+        assert send_request(socket_path, {"command": "list", "state": "done"}).get("jobs")[0].get("id") == job_id
+        assert not send_request(socket_path, {"command": "cancel", "job_id": job_id}).get("ok")
+        assert "Unknown job options" in send_request(
+            socket_path, {"command": "submit", "paths": files, "vault_name": "test_vault", "speed": 1}
+        ).get("error")
+        assert not send_request(socket_path, {"command": "restart"}).get("ok")
+        assert send_request(socket_path, {"command": "stop"}).get("ok")
+        daemon.wait()
+    assert not socket_path.exists()
+    assert local_glacier.request_count == 3
+
+
+def test_spool_directory(client, files, tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / "job.json").write_text(json.dumps({"paths": files, "vault_name": "test_vault", "priority": 2}))
+    (spool / "broken.json").write_text("{")
+    with upload_daemon(client, tmp_path, spool_dir=str(spool), poll_interval=0.01) as daemon:
+        wait_for(lambda: [job.get("state") for job in daemon.storage.jobs()] == ["done"])
+    assert sorted(path.name for path in spool.iterdir()) == ["broken.json.invalid"]
+    assert len(daemon.storage.archives()) == 3
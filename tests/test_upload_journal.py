@@ -0,0 +1,45 @@
+import pytest
+from glacier_upload.libraries.upload_journal import Journal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return Journal(str(tmp_path / "uploaded.json"), "upload_id")
+
+
+def test_journal_location(journal, tmp_path):
+    assert journal.file_name == tmp_path / "uploaded.journal" / "upload_id.jsonl"
+
+
+def test_journal_roundtrip(journal):
+    journal.start({"path_to_file": "file.txt", "part_size": 1048576, "total_size": 1048577})
+    journal.add_part({
+        "range_start": 0,
+        "range_end": 1048575,
+        "checksum": "ab" * 32,
+        "leaf_hashes": [b"\xab" * 32],
+    })
+    details, parts = journal.load()
+    assert details == {
+        "upload_id": "upload_id",
+        "path_to_file": "file.txt",
+        "part_size": 1048576,
+        "total_size": 1048577,
+    }
+    assert parts[0].get("checksum") == "ab" * 32
+    assert parts[0].get("leaf_hashes") == [b"\xab" * 32]
+
+
+def test_journal_ignores_partial_line(journal):
+    journal.start({"path_to_file": "file.txt"})
+    with open(journal.file_name, "a") as file_object:
+        file_object.write('{"type": "part", "range_st')
+    details, parts = journal.load()
+    assert details.get("path_to_file") == "file.txt"
+    assert parts == {}
+
+
+def test_journal_remove(journal):
+    journal.start({})
+    journal.remove()
+    assert not journal.exists()
@@ -0,0 +1,85 @@
+import io
+import json
+from glacier_upload.libraries.upload_metrics import ProgressReporter, UploadMetrics, percentile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_percentile():
+    values = [0.1 * i for i in range(1, 11)]
+    assert percentile(values, 50) == values[4]
+    assert percentile(values, 90) == values[8]
+    assert percentile(values, 99) == values[9]
+    assert percentile([], 50) is None
+
+
+def test_throughput_and_eta():
+    clock = FakeClock()
+    metrics = UploadMetrics(window=10, clock=clock)
+    metrics.add_total(4194304)
+    for _ in range(2):
+        clock.now += 1
+        metrics.part_done(1048576, 1.0)
+    state = metrics.snapshot()
+    assert state.get("bytes_done") == 2097152
+    assert state.get("throughput") == 1048576
+    assert state.get("eta_seconds") == 2
+    assert state.get("part_latency_seconds").get("p50") == 1.0
+
+
+def test_moving_throughput_window():
+    clock = FakeClock()
+    metrics = UploadMetrics(window=10, clock=clock)
+    for _ in range(20):
+        clock.now += 1
+        metrics.part_done(1048576, 1.0)
+    for _ in range(10):
+        clock.now += 1
+        metrics.part_done(4194304, 1.0)
+    state = metrics.snapshot()
+    assert state.get("moving_throughput") > 3 * 1048576
+    assert state.get("throughput") == 2 * 1048576
+
+
+def test_phases():
+    clock = FakeClock()
+    metrics = UploadMetrics(clock=clock)
+    with metrics.phase("network"):
+        clock.now += 2
+    with metrics.cpu_phase("hashing"):
+        clock.now += 1
+    phases = metrics.snapshot().get("phase_seconds")
+    assert phases.get("network") == 2
+    assert phases.get("hashing") + phases.get("disk_read") == 1
+
+
+def test_write_summary(tmp_path):
+    metrics = UploadMetrics()
+    metrics.add_total(100)
+    metrics.part_done(100, 0.5)
+    metrics.write_summary(str(tmp_path / "metrics.json"))
+    metrics.write_summary(str(tmp_path / "metrics.prom"))
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary.get("bytes_done") == 100
+    assert summary.get("part_latency_seconds").get("p99") == 0.5
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert "glacier_upload_bytes_total 100\n" in prometheus
+    assert 'glacier_upload_part_latency_seconds{quantile="0.5"} 0.5\n' in prometheus
+    assert 'glacier_upload_phase_seconds{phase="hashing"}' in prometheus
+
+
+def test_progress_reporter():
+    metrics = UploadMetrics()
+    metrics.add_total(200)
+    metrics.part_done(100, 0.5)
+    stream = io.StringIO()
+    with ProgressReporter(metrics, stream=stream, interval=0.01):
+        pass
+    assert "100.0 B / 200.0 B (50.0%)" in stream.getvalue()
+    assert stream.getvalue().endswith("\n")
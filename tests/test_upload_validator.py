@@ -30,3 +30,34 @@ def test__check_if_valid_part_size_for_glacier_2048mb(validator):
 def test__check_if_valid_part_size_for_glacier_invalid(validator):
     result = validator._check_if_valid_part_size_for_glacier(12)
     assert not result
+
+
+def test__check_if_part_size_within_memory_limit(validator):
+    assert validator._check_if_part_size_within_memory_limit(16, 64)
+    assert validator._check_if_part_size_within_memory_limit(16, None)
+
+
+def test__check_if_part_size_within_memory_limit_too_small(validator):
+    result = validator._check_if_part_size_within_memory_limit(16, 8)
+    assert not result
+
+
+def test_is_response_ok_no_response(validator):
+    assert not validator.is_response_ok(None)
+
+
+def test__check_if_part_size_smaller_than_total(validator, test_files):
+    assert validator._check_if_part_size_smaller_than_total(test_files[1].get("file_path"), 2)
+    assert not validator._check_if_part_size_smaller_than_total(test_files[1].get("file_path"), 8)
+
+
+def test__check_if_part_count_within_limit(validator, test_files):
+    assert validator._check_if_part_count_within_limit(test_files[1].get("file_path"), 1)
+
+
+def test__check_if_part_count_within_limit_too_many_parts(validator, tmp_path):
+    sparse_file = tmp_path / "sparse.bin"
+    with open(sparse_file, "wb") as file_object:
+        file_object.truncate(50 * 1073741824)
+    assert not validator._check_if_part_count_within_limit(str(sparse_file), 4)
+    assert validator._check_if_part_count_within_limit(str(sparse_file), 8)